@@ -0,0 +1,134 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+
+import database
+
+
+def normalize_prompt(prompt: str) -> str:
+    # Whitespace only: case matters in code, acronyms and names
+    return " ".join(prompt.split())
+
+
+class ResponseCache:
+    """LRU + TTL cache of AI answers, backed by SQLite so it survives restarts.
+    Concurrent identical prompts share one upstream call (single-flight)."""
+
+    def __init__(self, ttl: float, max_memory: int, max_rows: int):
+        self.ttl = ttl
+        self.max_memory = max_memory
+        self.max_rows = max_rows
+        self.memory = OrderedDict() # key -> (content, provider, created_at)
+        self.inflight = {} # key -> asyncio.Task
+        self.touched = set() # keys hit since the last flush, last_used is written in batches
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def key(prompt: str, scope: str = "auto") -> str:
+        """scope is the provider the request is pinned to (economy mode), or "auto"."""
+        return hashlib.sha256(f"{scope}\n{normalize_prompt(prompt)}".encode()).hexdigest()
+
+    def _remember(self, key, entry):
+        self.memory[key] = entry
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_memory:
+            self.memory.popitem(last=False)
+
+    def lookup(self, key):
+        entry = self.memory.get(key)
+        if entry is None:
+            entry = database.get_ai_cache(key)
+            if entry is not None:
+                self._remember(key, entry)
+        else:
+            self.memory.move_to_end(key)
+
+        if entry is None:
+            return None
+        if time.time() - entry[2] > self.ttl:
+            self.memory.pop(key, None)
+            return None
+        self.touched.add(key)
+        return entry
+
+    async def cached(self, prompt: str, scope: str = "auto"):
+        """(content, provider, "hit" | "shared") from the cache or an identical request
+        in flight, or None when the caller has to ask the AI itself."""
+        key = self.key(prompt, scope)
+        entry = self.lookup(key)
+        if entry is not None:
+            self.hits += 1
+            return entry[0], entry[1], "hit"
+
+        task = self.inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            content, provider = await asyncio.shield(task)
+            return content, provider, "shared"
+        return None
+
+    async def get_or_compute(self, prompt: str, compute, scope: str = "auto"):
+        """compute() -> (content, provider). Returns (content, provider, source),
+        source being "hit", "shared" or "miss"."""
+        found = await self.cached(prompt, scope)
+        if found is not None:
+            return found
+
+        key = self.key(prompt, scope)
+        self.misses += 1
+        task = asyncio.ensure_future(compute())
+        self.inflight[key] = task
+        try:
+            # Shielded so a cancelled caller doesn't cancel the others waiting on it
+            content, provider = await asyncio.shield(task)
+        finally:
+            if task.done():
+                self.inflight.pop(key, None)
+            else:
+                task.add_done_callback(lambda _: self.inflight.pop(key, None))
+
+        if content:
+            self.store(key, content, provider)
+        return content, provider, "miss"
+
+    def begin(self, prompt: str, scope: str = "auto") -> str:
+        """For answers produced outside get_or_compute (streaming): identical prompts wait
+        for this one until finish(). Call after cached() returned None. Returns the key."""
+        key = self.key(prompt, scope)
+        self.misses += 1
+        self.inflight[key] = asyncio.get_running_loop().create_future()
+        return key
+
+    def finish(self, key: str, content, provider):
+        """Hand the answer to the waiting requests and cache it; content None means failure."""
+        future = self.inflight.pop(key, None)
+        if future is not None and not future.done():
+            future.set_result((content, provider))
+        if content:
+            self.store(key, content, provider)
+
+    def store(self, key: str, content: str, provider: str):
+        entry = (content, provider, time.time())
+        self._remember(key, entry)
+        database.save_ai_cache(key, provider, content, entry[2])
+
+    def flush(self):
+        if not self.touched:
+            return
+        touched, self.touched = self.touched, set()
+        database.touch_ai_cache(list(touched))
+
+    def prune(self):
+        self.flush()
+        database.prune_ai_cache(time.time() - self.ttl, self.max_rows)
+
+    def report(self) -> str:
+        total = self.hits + self.misses + self.coalesced
+        hit_rate = (self.hits + self.coalesced) / total * 100 if total else 0
+        return (
+            f"🗃 Кэш ИИ: попадания {self.hits}, совмещено {self.coalesced}, промахи {self.misses} "
+            f"({hit_rate:.0f}% без запроса к ИИ), в памяти {len(self.memory)}"
+        )
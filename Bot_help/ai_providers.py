@@ -0,0 +1,141 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+
+# Shared limit across all providers so a burst of AI requests can't starve the loop
+ai_semaphore = asyncio.Semaphore(config.AI_MAX_CONCURRENCY)
+# Only used for SDKs without an async client
+ai_executor = ThreadPoolExecutor(max_workers=config.AI_THREADS, thread_name_prefix="ai")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count without a tokenizer (~3 chars per token for mixed ru/en text)."""
+    return len(text) // 3 + 1 if text else 0
+
+
+class Provider:
+    """One LLM backend with its own concurrency limit and timeout."""
+    supports_stream = False
+
+    def __init__(self, name: str, limit: int, timeout: float):
+        self.name = name
+        self.timeout = timeout
+        self.semaphore = asyncio.Semaphore(limit)
+
+    async def complete(self, prompt: str) -> str:
+        """The timeout covers waiting for a free slot too, so a queued request can't hang."""
+        return await asyncio.wait_for(self._limited(prompt), self.timeout)
+
+    async def _limited(self, prompt: str) -> str:
+        async with ai_semaphore, self.semaphore:
+            return await self._request(prompt)
+
+    async def _acquire(self):
+        await ai_semaphore.acquire()
+        try:
+            await self.semaphore.acquire()
+        except BaseException:
+            ai_semaphore.release()
+            raise
+
+    async def stream(self, prompt: str):
+        """Yield text chunks as they arrive. The timeout applies to getting a slot and to each chunk."""
+        await asyncio.wait_for(self._acquire(), self.timeout)
+        try:
+            chunks = self._stream(prompt).__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), self.timeout)
+                except StopAsyncIteration:
+                    break
+                if chunk:
+                    yield chunk
+        finally:
+            self.semaphore.release()
+            ai_semaphore.release()
+
+    async def _request(self, prompt: str) -> str:
+        raise NotImplementedError
+
+    async def _stream(self, prompt: str):
+        raise NotImplementedError
+        yield
+
+
+class GigaChatProvider(Provider):
+    def __init__(self, client, **kwargs):
+        super().__init__("GigaChat", **kwargs)
+        self.client = client
+        self.supports_stream = hasattr(client, "astream")
+
+    async def _request(self, prompt):
+        if hasattr(self.client, "achat"):
+            response = await self.client.achat(prompt)
+        else:
+            # Older SDKs are sync-only: keep them off the event loop
+            loop = asyncio.get_running_loop()
+            response = await loop.run_in_executor(ai_executor, self.client.chat, prompt)
+        return response.choices[0].message.content
+
+    async def _stream(self, prompt):
+        async for chunk in self.client.astream(prompt):
+            yield chunk.choices[0].delta.content
+
+
+class ChatCompletionsProvider(Provider):
+    """OpenAI-compatible async clients (AsyncOpenAI, AsyncGroq)."""
+    supports_stream = True
+
+    def __init__(self, name, client, model, **kwargs):
+        super().__init__(name, **kwargs)
+        self.client = client
+        self.model = model
+
+    async def _request(self, prompt):
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+        )
+        return response.choices[0].message.content
+
+    async def _stream(self, prompt):
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            stream=True,
+        )
+        async for chunk in response:
+            if chunk.choices:
+                yield chunk.choices[0].delta.content
+
+
+def build_providers():
+    """Configured providers in fallback order."""
+    providers = []
+
+    if config.GIGACHAT_CREDENTIALS:
+        from gigachat import GigaChat
+        client = GigaChat(credentials=config.GIGACHAT_CREDENTIALS, verify_ssl_certs=False, timeout=config.AI_TIMEOUT)
+        providers.append(GigaChatProvider(client, limit=config.GIGACHAT_CONCURRENCY, timeout=config.AI_TIMEOUT))
+
+    if config.GROQ_API_KEY:
+        from groq import AsyncGroq
+        client = AsyncGroq(api_key=config.GROQ_API_KEY, base_url=config.GROQ_BASE_URL, timeout=config.AI_TIMEOUT, max_retries=0)
+        providers.append(ChatCompletionsProvider(
+            "Groq", client, "llama-3.3-70b-versatile",
+            limit=config.GROQ_CONCURRENCY, timeout=config.AI_TIMEOUT
+        ))
+
+    if config.OPENAI_API_KEY:
+        from openai import AsyncOpenAI
+        client = AsyncOpenAI(api_key=config.OPENAI_API_KEY, base_url=config.OPENAI_BASE_URL, timeout=config.AI_TIMEOUT, max_retries=0)
+        providers.append(ChatCompletionsProvider(
+            "OpenAI", client, "gpt-4o-mini",
+            limit=config.OPENAI_CONCURRENCY, timeout=config.AI_TIMEOUT
+        ))
+
+    if not providers:
+        logging.warning("No AI providers configured, AI features will be unavailable.")
+    return providers
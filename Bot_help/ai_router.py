@@ -0,0 +1,261 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from datetime import datetime
+
+import config
+from resilience import CircuitBreaker, LatencyWindow
+
+DISCLAIMER = "Как и любая языковая модель"
+
+
+class ProviderHealth:
+    """Rolling latency, error and quality-reject stats for one provider."""
+
+    def __init__(self, provider, order: int):
+        self.provider = provider
+        self.order = order # configured preference, used as a tie-breaker
+        self.latency = LatencyWindow(config.AI_ROUTER_WINDOW)
+        self.outcomes = deque(maxlen=config.AI_ROUTER_WINDOW) # (time, "ok" | "error" | "reject")
+        self.breaker = CircuitBreaker(
+            failures=config.AI_BREAKER_FAILURES,
+            cooldown=config.AI_BREAKER_COOLDOWN,
+        )
+
+    def record(self, outcome: str):
+        self.outcomes.append((time.monotonic(), outcome))
+
+    def recent(self):
+        # Old failures expire so a recovered provider gets traffic again
+        horizon = time.monotonic() - config.AI_ROUTER_STATS_TTL
+        return [outcome for ts, outcome in self.outcomes if ts >= horizon]
+
+    def rate(self, outcome: str) -> float:
+        recent = self.recent()
+        if not recent:
+            return 0.0
+        return recent.count(outcome) / len(recent)
+
+    def score(self) -> float:
+        """Expected cost of a request, lower is better."""
+        p50 = self.latency.percentile(50)
+        if p50 is None:
+            p50 = config.AI_ROUTER_PRIOR_LATENCY
+        penalty = 1 + 3 * self.rate("error") + 2 * self.rate("reject")
+        return p50 * penalty * (1 + 0.05 * self.order)
+
+
+def is_acceptable(content: str, provider_name: str = None) -> bool:
+    if not content or DISCLAIMER in content:
+        return False
+    # GigaChat tends to answer with short canned refusals
+    if provider_name == "GigaChat" and len(content) <= 50:
+        return False
+    return True
+
+
+class HedgeBudget:
+    """Caps hedged requests: a global share of traffic plus a per-user hourly limit."""
+
+    def __init__(self):
+        self.tokens = config.AI_HEDGE_BURST
+        self.per_user = {} # user_id -> deque of hedge timestamps
+
+    def on_request(self):
+        # Every request earns a fraction of a hedge
+        self.tokens = min(config.AI_HEDGE_BURST, self.tokens + config.AI_HEDGE_RATIO)
+
+    def take(self, user_id=None) -> bool:
+        if self.tokens < 1:
+            return False
+        if user_id is not None:
+            history = self.per_user.setdefault(user_id, deque())
+            while history and time.monotonic() - history[0] > 3600:
+                history.popleft()
+            if len(history) >= config.AI_HEDGE_PER_USER_HOUR:
+                return False
+            history.append(time.monotonic())
+        self.tokens -= 1
+        return True
+
+
+class AIRouter:
+    """Picks the best healthy provider per request and falls back down the ranking."""
+
+    def __init__(self, providers):
+        self.health = [ProviderHealth(p, i) for i, p in enumerate(providers)]
+        self.decisions = deque(maxlen=20)
+        self.hedge_budget = HedgeBudget()
+        self.hedges_fired = 0
+        self.hedges_won = 0
+
+    def ranked(self, prefer: str = None):
+        """Providers allowed by their breaker, best score first (`prefer` moved to the front).
+        If every breaker is open, the one that reopens soonest is tried anyway."""
+        ordered = sorted(self.health, key=lambda h: h.score())
+        allowed = [h for h in ordered if h.breaker.available()]
+        if not allowed and ordered:
+            allowed = [min(ordered, key=lambda h: h.breaker.retry_in())]
+        if prefer:
+            allowed.sort(key=lambda h: h.provider.name != prefer)
+        return allowed
+
+    async def attempt(self, health: ProviderHealth, prompt: str):
+        """One request to one provider. Returns the content, or None on failure/reject."""
+        provider = health.provider
+        started = time.monotonic()
+        try:
+            content = await provider.complete(prompt)
+        except asyncio.CancelledError:
+            health.breaker.release() # Lost a hedge race, not a provider failure
+            raise
+        except asyncio.TimeoutError:
+            logging.error(f"{provider.name} Error: timed out after {provider.timeout}s")
+            health.record("error")
+            health.breaker.record_failure()
+            return None
+        except Exception as e:
+            logging.error(f"{provider.name} Error: {e}")
+            health.record("error")
+            health.breaker.record_failure()
+            return None
+
+        health.latency.add(time.monotonic() - started)
+        health.breaker.record_success()
+        if not is_acceptable(content, provider.name):
+            health.record("reject")
+            return None
+        health.record("ok")
+        return content
+
+    def hedge_delay(self, health: ProviderHealth) -> float:
+        p90 = health.latency.percentile(90) if len(health.latency) >= 10 else None
+        return max(config.AI_HEDGE_MIN_DELAY, p90 if p90 is not None else config.AI_HEDGE_DELAY)
+
+    async def race(self, primary: ProviderHealth, backups, prompt: str, user_id, tried):
+        """Start the primary; if it is slower than its usual p90, fire the same prompt
+        at the next provider. First acceptable answer wins, the other is cancelled."""
+        tasks = {asyncio.create_task(self.attempt(primary, prompt)): primary}
+        pending = set(tasks)
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay(primary))
+
+            # The breaker goes first so an open backup doesn't spend hedge budget
+            if not done and backups and backups[0].breaker.allow():
+                backup = backups[0]
+                if self.hedge_budget.take(user_id):
+                    tried.append(backup.provider.name)
+                    tasks[asyncio.create_task(self.attempt(backup, prompt))] = backup
+                    pending = set(tasks)
+                    self.hedges_fired += 1
+                else:
+                    backup.breaker.release()
+
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    content = task.result()
+                    if content is not None:
+                        winner = tasks[task]
+                        if winner is not primary:
+                            self.hedges_won += 1
+                        return content, winner
+        finally:
+            for task in pending:
+                task.cancel()
+        return None, None
+
+    async def complete(self, prompt: str, user_id: int = None, prefer: str = None):
+        """Returns (content, provider_name), or (None, None) if every provider failed.
+        With `prefer` (economy mode) that provider goes first and nothing is hedged."""
+        ranked = self.ranked(prefer)
+        tried = []
+        self.hedge_budget.on_request()
+
+        if config.AI_HEDGING and not prefer and len(ranked) > 1 and ranked[0].breaker.allow():
+            tried.append(ranked[0].provider.name)
+            content, winner = await self.race(ranked[0], ranked[1:], prompt, user_id, tried)
+            if content is not None:
+                self.log_decision(tried, winner.provider.name)
+                return content, winner.provider.name
+            ranked = [h for h in ranked if h.provider.name not in tried]
+
+        for health in ranked:
+            if not health.breaker.allow() and len(ranked) > 1:
+                continue # Another request grabbed the half-open probe meanwhile
+            tried.append(health.provider.name)
+            content = await self.attempt(health, prompt)
+            if content is not None:
+                self.log_decision(tried, health.provider.name)
+                return content, health.provider.name
+        self.log_decision(tried, None)
+        return None, None
+
+    async def stream(self, prompt: str, meta: dict = None, prefer: str = None):
+        """Yield chunks from the best healthy provider that supports streaming.
+        Falls back to the next provider only while nothing has been yielded yet.
+        The answering provider's name is put into meta["provider"]."""
+        tried = []
+        for health in self.ranked(prefer):
+            provider = health.provider
+            if not provider.supports_stream or not health.breaker.allow():
+                continue
+            tried.append(provider.name)
+            if meta is not None:
+                meta["provider"] = provider.name
+            started = time.monotonic()
+            yielded = False
+            text = ""
+            try:
+                async for chunk in provider.stream(prompt):
+                    yielded = True
+                    text += chunk
+                    yield chunk
+            except (asyncio.CancelledError, GeneratorExit):
+                health.breaker.release()
+                raise
+            except Exception as e:
+                logging.error(f"{provider.name} Stream Error: {e}")
+                health.record("error")
+                health.breaker.record_failure()
+                if yielded:
+                    self.log_decision(tried, None)
+                    return
+                continue
+
+            health.latency.add(time.monotonic() - started)
+            health.breaker.record_success()
+            # Same quality check as attempt(): a streamed refusal must not keep the provider on top
+            health.record("ok" if is_acceptable(text, provider.name) else "reject")
+            if yielded:
+                self.log_decision(tried, provider.name)
+                return
+        self.log_decision(tried, None)
+
+    def log_decision(self, tried, winner):
+        self.decisions.append((datetime.now().strftime("%H:%M:%S"), tried, winner))
+
+    def report(self) -> str:
+        """Plain-text health summary for the admin."""
+        if not self.health:
+            return "ИИ-провайдеры не настроены."
+        lines = ["🤖 ИИ-провайдеры:"]
+        for h in sorted(self.health, key=lambda h: h.score()):
+            p50 = h.latency.percentile(50)
+            p95 = h.latency.percentile(95)
+            timing = f"p50 {p50:.1f}s / p95 {p95:.1f}s" if p50 is not None else "нет данных"
+            state = h.breaker.state
+            if state == CircuitBreaker.OPEN:
+                state += f" ({h.breaker.retry_in():.0f}s)"
+            lines.append(
+                f"• {h.provider.name}: {state}, {timing}, "
+                f"ошибки {h.rate('error') * 100:.0f}%, отказы {h.rate('reject') * 100:.0f}% (n={len(h.recent())})"
+            )
+        if config.AI_HEDGING:
+            lines.append(f"\n🏁 Хеджирование: запущено {self.hedges_fired}, выиграло {self.hedges_won}")
+        if self.decisions:
+            lines.append("\n🧭 Последние маршруты:")
+            for ts, tried, winner in list(self.decisions)[-5:]:
+                lines.append(f"• {ts}: {' → '.join(tried) or '—'} ⇒ {winner or 'ошибка'}")
+        return "\n".join(lines)
@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta, timezone
+
+import config
+import database
+from ai_providers import estimate_tokens
+
+FEATURES = ("chat", "voice", "summary", "pdf", "memory")
+
+# Quota levels
+FULL = "full"
+ECONOMY = "economy" # shorter context and the cheap provider
+BLOCKED = "blocked"
+
+
+def today() -> str:
+    return datetime.now(timezone.utc).date().isoformat()
+
+
+class UsageMeter:
+    """Estimated token spend per (user, day, feature, provider).
+    Deltas are buffered in memory and flushed in one transaction, like ActivityCounters."""
+
+    def __init__(self):
+        self.pending = {} # (user_id, day, feature, provider) -> [requests, prompt_tokens, completion_tokens]
+        self.day = today()
+        self.spent = {} # user_id -> tokens today, loaded lazily from the DB
+
+    def used_today(self, user_id: int) -> int:
+        if self.day != today():
+            self.day = today()
+            self.spent = {}
+        if user_id not in self.spent:
+            pending = sum(v[1] + v[2] for (uid, day, _, _), v in self.pending.items() if uid == user_id and day == self.day)
+            self.spent[user_id] = database.get_user_tokens(user_id, self.day) + pending
+        return self.spent[user_id]
+
+    def level(self, user_id: int) -> str:
+        if user_id is None or user_id == config.ADMIN_ID:
+            return FULL
+        used = self.used_today(user_id)
+        if used >= config.AI_DAILY_TOKENS_HARD:
+            return BLOCKED
+        if used >= config.AI_DAILY_TOKENS:
+            return ECONOMY
+        return FULL
+
+    def record(self, user_id: int, feature: str, provider: str, prompt: str, completion: str):
+        """A cache hit is recorded with provider "cache" and no tokens: it costs nothing upstream."""
+        if user_id is None:
+            return
+        if provider == "cache":
+            prompt_tokens = completion_tokens = 0
+        else:
+            prompt_tokens, completion_tokens = estimate_tokens(prompt), estimate_tokens(completion or "")
+        key = (user_id, today(), feature, provider or "none")
+        entry = self.pending.setdefault(key, [0, 0, 0])
+        entry[0] += 1
+        entry[1] += prompt_tokens
+        entry[2] += completion_tokens
+        if user_id in self.spent and key[1] == self.day:
+            self.spent[user_id] += prompt_tokens + completion_tokens
+
+    def flush(self):
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, {}
+        database.add_ai_usage([(*key, *values) for key, values in pending.items()])
+
+    def report(self) -> str:
+        self.flush()
+        week_ago = (datetime.now(timezone.utc) - timedelta(days=6)).date().isoformat()
+        lines = ["💸 Расход ИИ (оценка токенов):"]
+        for title, since in (("Сегодня", today()), ("7 дней", week_ago)):
+            rows = database.get_ai_usage_breakdown(since)
+            requests = sum(r[2] for r in rows)
+            tokens = sum(r[3] + r[4] for r in rows)
+            lines.append(f"{title}: {requests} запр., {tokens} ток.")
+            if since == today():
+                for feature, provider, req, pt, ct in rows[:8]:
+                    lines.append(f"• {feature} / {provider}: {req} запр., {pt} → {ct} ток.")
+        top = database.get_top_ai_users(week_ago)
+        if top:
+            lines.append("Топ за 7 дней:")
+            for uid, req, tokens in top:
+                lines.append(f"• {uid}: {req} запр., {tokens} ток.")
+        return "\n".join(lines)
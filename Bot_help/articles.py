@@ -0,0 +1,191 @@
+import asyncio
+import re
+import time
+
+from bs4 import BeautifulSoup
+
+import config
+import database
+
+try:
+    import lxml # noqa: F401 - a much faster tree builder for BeautifulSoup
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
+
+HTML_TYPES = ("text/html", "application/xhtml+xml")
+TEXT_TYPES = HTML_TYPES + ("text/plain",)
+ACCEPT = "text/html,application/xhtml+xml;q=0.9,text/plain;q=0.8"
+
+JUNK_TAGS = ["script", "style", "noscript", "nav", "footer", "header", "aside", "form", "iframe", "svg", "button"]
+BLOCK_TAGS = ["p", "h1", "h2", "h3", "h4", "li", "blockquote", "pre"]
+POSITIVE = re.compile(r"article|body|content|entry|main|page|post|text|story", re.IGNORECASE)
+NEGATIVE = re.compile(
+    r"comment|footer|sidebar|share|social|related|promo|advert|banner|sponsor|menu|nav|subscribe|cookie|popup|widget",
+    re.IGNORECASE,
+)
+
+
+class ArticleError(Exception):
+    """The link can't be read as an article; the message is shown to the user."""
+
+
+class Article:
+    def __init__(self, url: str, title: str, text: str, source: str):
+        self.url = url
+        self.title = title
+        self.text = text
+        self.source = source # "network", "revalidated" (304) or "cache"
+
+
+def class_weight(tag) -> int:
+    names = " ".join(tag.get("class") or []) + " " + (tag.get("id") or "")
+    weight = 0
+    if POSITIVE.search(names):
+        weight += 25
+    if NEGATIVE.search(names):
+        weight -= 25
+    return weight
+
+
+def link_density(tag) -> float:
+    text = len(tag.get_text(" ", strip=True))
+    if not text:
+        return 1.0
+    links = sum(len(a.get_text(" ", strip=True)) for a in tag.find_all("a"))
+    return links / text
+
+
+def block_texts(root) -> list:
+    texts = []
+    for block in root.find_all(BLOCK_TAGS):
+        if block.find(BLOCK_TAGS): # The nested blocks are visited themselves
+            continue
+        text = " ".join(block.get_text(" ", strip=True).split())
+        if len(text) > 20 or (block.name.startswith("h") and text):
+            texts.append(text)
+    return texts
+
+
+def main_content(soup):
+    """Readability-style pick of the element holding the article: paragraphs score
+    their parent (and half for the grandparent) by length and commas; class/id names
+    and link density adjust the score; well-scored siblings of the winner are kept."""
+    # Keyed by id(): hashing a bs4 Tag serializes the whole subtree
+    tags, scores = {}, {}
+    for paragraph in soup.find_all(["p", "pre", "blockquote"]):
+        text = paragraph.get_text(" ", strip=True)
+        if len(text) < 25:
+            continue
+        score = 1 + text.count(",") + min(len(text) // 100, 3)
+        for ancestor, share in ((paragraph.parent, 1.0), (paragraph.parent.parent if paragraph.parent else None, 0.5)):
+            if ancestor is None or ancestor.name in (None, "[document]"):
+                continue
+            if id(ancestor) not in scores:
+                tags[id(ancestor)] = ancestor
+                scores[id(ancestor)] = class_weight(ancestor)
+            scores[id(ancestor)] += score * share
+
+    if not scores:
+        return []
+    ranked = {key: score * (1 - link_density(tags[key])) for key, score in scores.items()}
+    best = tags[max(ranked, key=ranked.get)]
+    threshold = max(10, ranked[id(best)] * 0.2)
+
+    parts = []
+    siblings = best.parent.find_all(recursive=False) if best.parent else [best]
+    for sibling in siblings:
+        if sibling is best or ranked.get(id(sibling), 0) >= threshold:
+            parts.extend(block_texts(sibling))
+    return parts
+
+
+def extract(body: bytes, encoding, content_type: str):
+    """-> (title, text). CPU-bound: run it in a worker thread."""
+    if content_type == "text/plain":
+        text = body.decode(encoding or "utf-8", errors="replace")
+        return "", text[:config.ARTICLE_MAX_CHARS]
+
+    soup = BeautifulSoup(body, HTML_PARSER, from_encoding=encoding)
+    og_title = soup.find("meta", property="og:title")
+    if og_title and og_title.get("content"):
+        title = og_title["content"].strip()
+    else:
+        title = soup.title.get_text(strip=True) if soup.title else ""
+    for junk in soup(JUNK_TAGS):
+        junk.decompose()
+
+    parts = main_content(soup)
+    if sum(len(part) for part in parts) < 500:
+        # No clear article body (short page, unusual markup): fall back to every paragraph
+        fallback = block_texts(soup)
+        if sum(map(len, fallback)) > sum(map(len, parts)):
+            parts = fallback
+    return title, "\n\n".join(parts)[:config.ARTICLE_MAX_CHARS]
+
+
+async def read_capped(response) -> bytes:
+    """Body up to ARTICLE_MAX_BYTES; anything longer is cut (the article text is near the top)."""
+    chunks, size = [], 0
+    async for chunk in response.aiter_bytes():
+        chunks.append(chunk)
+        size += len(chunk)
+        if size >= config.ARTICLE_MAX_BYTES:
+            break
+    return b"".join(chunks)[:config.ARTICLE_MAX_BYTES]
+
+
+async def fetch_article(http, url: str) -> Article:
+    """Streamed, size-capped download; extraction off the event loop. Results are cached
+    per URL with the ETag/Last-Modified, so a repeated link costs a conditional GET
+    (or nothing, within ARTICLE_FRESH_SECONDS). Raises ArticleError."""
+    cached = database.get_article_cache(url)
+    if cached:
+        etag, last_modified, title, text, checked_at = cached
+        if time.time() - checked_at < config.ARTICLE_FRESH_SECONDS:
+            return Article(url, title, text, "cache")
+
+    headers = {"Accept": ACCEPT}
+    if cached and etag:
+        headers["If-None-Match"] = etag
+    if cached and last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    async with http.stream("GET", url, headers=headers) as response:
+        if response.status_code == 304 and cached:
+            database.touch_article_cache(url)
+            return Article(url, title, text, "revalidated")
+        if response.status_code >= 400:
+            raise ArticleError(f"Сайт ответил ошибкой {response.status_code}.")
+        content_type = response.headers.get("Content-Type", "text/html").split(";")[0].strip().lower()
+        if content_type not in TEXT_TYPES:
+            raise ArticleError(f"По ссылке не статья, а {content_type or 'неизвестный тип файла'}.")
+        body = await read_capped(response)
+        encoding = response.charset_encoding
+        new_etag = response.headers.get("ETag")
+        new_last_modified = response.headers.get("Last-Modified")
+
+    title, text = await asyncio.to_thread(extract, body, encoding, content_type)
+    if not text.strip():
+        raise ArticleError("Не удалось извлечь текст из статьи. Попробуй другую ссылку.")
+    database.save_article_cache(url, new_etag, new_last_modified, title, text)
+    return Article(url, title, text, "network")
+
+
+LINK_RE = re.compile(r"https?://[^\s<>\"'«»]+", re.IGNORECASE)
+# Video links go to the downloader, not the summarizer
+VIDEO_HOSTS = re.compile(r"^https?://(?:www\.|m\.)?(?:youtube\.com|youtu\.be|tiktok\.com|instagram\.com)", re.IGNORECASE)
+
+
+def find_links(text: str, hyperlinks=()) -> list:
+    """Article URLs in the text plus hyperlink targets, in order, without duplicates or video links."""
+    links = []
+    for url in [m.group(0).rstrip(".,;:!?)]") for m in LINK_RE.finditer(text or "")] + list(hyperlinks):
+        if url and url not in links and LINK_RE.fullmatch(url) and not VIDEO_HOSTS.match(url):
+            links.append(url)
+    return links
+
+
+def short_url(url: str, limit: int = 50) -> str:
+    url = re.sub(r"^https?://(www\.)?", "", url)
+    return url if len(url) <= limit else url[:limit - 1] + "…"
@@ -0,0 +1,181 @@
+"""Offline load test of the AI path (router, cache, metering, summarizer) against mock_llm.py.
+
+    python bench_ai.py --scenario degraded --requests 500 --concurrency 50
+    python bench_ai.py --scenario outage --stream
+    python bench_ai.py --summaries 5 --summary-words 20000
+
+Two mock servers stand in for Groq (primary) and OpenAI (backup); nothing leaves the machine.
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from mock_llm import MockLLM, MockProfile
+
+SCENARIOS = {
+    # name: (groq profile, openai profile)
+    "healthy": (MockProfile(latency=0.4, jitter=0.3), MockProfile(latency=0.6, jitter=0.3)),
+    "degraded": (
+        MockProfile(latency=0.8, jitter=0.8, tail_rate=0.05, tail_latency=12, error_rate=0.1),
+        MockProfile(latency=0.6, jitter=0.3),
+    ),
+    "outage": (MockProfile(latency=0.2, error_rate=1.0), MockProfile(latency=0.6, jitter=0.3)),
+    "quota": (MockProfile(latency=0.4, quota_rate=0.3), MockProfile(latency=0.6, jitter=0.3)),
+    "junk": (MockProfile(latency=0.3, disclaimer_rate=0.4), MockProfile(latency=0.6, jitter=0.3)),
+}
+
+
+def percentile(samples, p):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def latency_line(title, samples, wall):
+    return (
+        f"{title}: {len(samples)} за {wall:.1f}s = {len(samples) / wall:.1f}/s, "
+        f"p50 {percentile(samples, 50):.2f}s, p99 {percentile(samples, 99):.2f}s, max {max(samples, default=0):.2f}s"
+    )
+
+
+async def bench_requests(main, args):
+    """Fire `requests` prompts through get_ai_response, at most `concurrency` at once."""
+    pool = [f"Вопрос #{i}: расскажи что-нибудь полезное про тему {i}" for i in range(max(1, int(args.requests * args.unique)))]
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies, failures = [], 0
+
+    async def one(i):
+        nonlocal failures
+        prompt = random.choice(pool)
+        async with semaphore:
+            started = time.monotonic()
+            answer = await main.get_ai_response(prompt, user_id=1000 + i % args.users)
+            latencies.append(time.monotonic() - started)
+            if answer in (main.AI_BUSY_TEXT, main.AI_QUOTA_TEXT):
+                failures += 1
+
+    started = time.monotonic()
+    await asyncio.gather(*(one(i) for i in range(args.requests)))
+    print(latency_line("get_ai_response", latencies, time.monotonic() - started) + f", неудач {failures}")
+
+
+async def bench_stream(main, args):
+    semaphore = asyncio.Semaphore(args.concurrency)
+    first_chunk, total = [], []
+
+    async def one(i):
+        async with semaphore:
+            started = time.monotonic()
+            first = None
+            async for _ in main.ai_router.stream(f"Потоковый вопрос {i}"):
+                if first is None:
+                    first = time.monotonic() - started
+            if first is not None:
+                first_chunk.append(first)
+                total.append(time.monotonic() - started)
+
+    started = time.monotonic()
+    await asyncio.gather(*(one(i) for i in range(args.requests)))
+    wall = time.monotonic() - started
+    print(latency_line("stream (полный ответ)", total, wall))
+    print(f"stream (первый фрагмент): p50 {percentile(first_chunk, 50):.2f}s, p99 {percentile(first_chunk, 99):.2f}s, "
+          f"без ответа {args.requests - len(total)}")
+
+
+async def bench_summaries(main, args):
+    words = ("рынок", "данные", "исследование", "компания", "рост", "модель", "город", "проект", "система", "итог")
+    latencies, chunks = [], 0
+
+    async def ask(prompt):
+        answer = await main.get_ai_response(prompt, 2000, "summary")
+        return None if answer in (main.AI_BUSY_TEXT, main.AI_QUOTA_TEXT) else answer
+
+    started = time.monotonic()
+    for n in range(args.summaries):
+        rng = random.Random(n % max(1, args.summaries // 2)) # half the documents repeat: exercises the cache
+        text = " ".join(
+            " ".join(rng.choice(words) for _ in range(12)) + "." for _ in range(args.summary_words // 12)
+        )
+        doc_started = time.monotonic()
+        summary, used, total = await main.summarizer.summarize(text, ask, "Итог:\n{text}")
+        latencies.append(time.monotonic() - doc_started)
+        chunks += used
+        if not summary:
+            print(f"документ {n}: пересказ не получен")
+    print(latency_line("summarize", latencies, time.monotonic() - started) + f", частей {chunks}")
+
+
+async def run(args):
+    groq_profile, openai_profile = SCENARIOS[args.scenario]
+    groq, openai = MockLLM(groq_profile, "groq"), MockLLM(openai_profile, "openai")
+    groq_port, openai_port = await groq.start(), await openai.start()
+
+    # The bot reads its config at import time: point it at the mocks first
+    os.environ.update({
+        "BOT_TOKEN": "123456:BENCHMARK", "ADMIN_ID": "0", "API_ID": "", "API_HASH": "", "GIGACHAT_CREDENTIALS": "",
+        "GROQ_API_KEY": "mock", "GROQ_BASE_URL": f"http://127.0.0.1:{groq_port}",
+        "OPENAI_API_KEY": "mock", "OPENAI_BASE_URL": f"http://127.0.0.1:{openai_port}/v1",
+        "AI_HEDGING": "1" if args.hedging else "0",
+        "AI_STREAMING": "1",
+    })
+    if not args.quotas:
+        os.environ["AI_DAILY_TOKENS"] = os.environ["AI_DAILY_TOKENS_HARD"] = str(10 ** 12)
+
+    import database
+    database.DB_PATH = os.path.join(tempfile.mkdtemp(prefix="bench_ai_"), "bench.db")
+    import main
+    database.init_db()
+
+    fallbacks = {"routed": 0, "fallback": 0, "failed": 0, "winners": {}}
+    log_decision = main.ai_router.log_decision
+
+    def count_decision(tried, winner):
+        fallbacks["routed"] += 1
+        fallbacks["fallback"] += len(tried) > 1
+        fallbacks["failed"] += winner is None
+        fallbacks["winners"][winner] = fallbacks["winners"].get(winner, 0) + 1
+        log_decision(tried, winner)
+    main.ai_router.log_decision = count_decision
+
+    print(f"Сценарий '{args.scenario}', запросов {args.requests}, параллельно {args.concurrency}, "
+          f"уникальных {args.unique:.0%}, хеджирование {'вкл' if args.hedging else 'выкл'}\n")
+    try:
+        if args.requests:
+            await bench_requests(main, args)
+        if args.stream:
+            await bench_stream(main, args)
+        if args.summaries:
+            await bench_summaries(main, args)
+    finally:
+        print(
+            f"\nМаршрутов {fallbacks['routed']}: с переключением {fallbacks['fallback']}, "
+            f"без ответа {fallbacks['failed']}, победители {fallbacks['winners']}"
+        )
+        for mock in (groq, openai):
+            s = mock.stats
+            print(f"mock {mock.name}: запросов {s.requests} (stream {s.streams}), 500: {s.errors}, 429: {s.quota}, "
+                  f"дисклеймеров {s.disclaimers}")
+        print("\n" + main.ai_router.report())
+        print(main.ai_cache.report())
+        print("\n" + main.usage.report())
+        await groq.stop()
+        await openai.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the AI path against local mock LLMs")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="degraded")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--unique", type=float, default=0.7, help="share of distinct prompts (the rest hit the cache)")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--no-hedging", dest="hedging", action="store_false")
+    parser.add_argument("--stream", action="store_true", help="also measure streaming answers")
+    parser.add_argument("--summaries", type=int, default=0, help="number of long documents to summarize")
+    parser.add_argument("--summary-words", type=int, default=12000)
+    parser.add_argument("--quotas", action="store_true", help="keep the configured daily token quotas")
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,29 @@
+from datetime import datetime, timezone
+
+import database
+
+FIELDS = ("cached", "deleted", "edited")
+
+
+class ActivityCounters:
+    """Buffers per (user, chat, day) activity counters in memory.
+    Handlers only bump a dict; flush() writes all deltas in one transaction."""
+
+    def __init__(self):
+        self.pending = {} # (user_id, chat_id, day) -> [cached, deleted, edited, title]
+
+    def bump(self, user_id: int, chat_id: int, field: str, title: str = None, amount: int = 1):
+        day = datetime.now(timezone.utc).date().isoformat()
+        entry = self.pending.get((user_id, chat_id, day))
+        if entry is None:
+            entry = self.pending[(user_id, chat_id, day)] = [0, 0, 0, None]
+        entry[FIELDS.index(field)] += amount
+        if title:
+            entry[3] = title
+
+    def flush(self):
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, {}
+        rows = [(uid, cid, day, c, d, e, title) for (uid, cid, day), (c, d, e, title) in pending.items()]
+        database.add_chat_stats(rows)
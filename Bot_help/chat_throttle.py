@@ -0,0 +1,112 @@
+import math
+import time
+
+import config
+import database
+
+POLICY_ALL = "all"            # cache everything
+POLICY_TEXT = "text"          # cache text only, skip media capture
+POLICY_SAMPLE = "sample"      # cache every Nth message
+POLICY_CONTACTS = "contacts"  # cache only contacts, mentions and replies to me
+
+# Automatic escalation order, mildest first
+LADDER = [POLICY_ALL, POLICY_TEXT, POLICY_SAMPLE, POLICY_CONTACTS]
+
+POLICY_LABELS = {
+    POLICY_ALL: "сохранять всё",
+    POLICY_TEXT: "только текст (без медиа)",
+    POLICY_SAMPLE: "выборочно",
+    POLICY_CONTACTS: "только контакты и ответы мне",
+}
+
+RATE_WINDOW = 60.0 # seconds, EWMA time constant
+
+
+class ChatRate:
+    __slots__ = ("rate", "last", "policy", "auto", "changed_at")
+
+    def __init__(self, policy=POLICY_ALL, auto=True):
+        self.rate = 0.0 # messages per minute
+        self.last = time.monotonic()
+        self.policy = policy
+        self.auto = auto # False when the user pinned the policy manually
+        self.changed_at = 0.0
+
+
+class ChatThrottle:
+    """Tracks per-chat message rates and picks a caching policy for noisy groups."""
+
+    def __init__(self):
+        self.chats = {} # (user_id, chat_id) -> ChatRate
+        self.loaded = set() # user_ids with policies loaded from DB
+
+    def thresholds(self):
+        # Rate (msg/min) at which each policy of the ladder kicks in
+        return {
+            POLICY_TEXT: config.THROTTLE_TEXT_RATE,
+            POLICY_SAMPLE: config.THROTTLE_SAMPLE_RATE,
+            POLICY_CONTACTS: config.THROTTLE_CONTACTS_RATE,
+        }
+
+    def _state(self, user_id, chat_id):
+        if user_id not in self.loaded:
+            for cid, policy, auto, _ in database.get_chat_policies(user_id):
+                state = self.chats[(user_id, cid)] = ChatRate(policy, bool(auto))
+                state.changed_at = time.monotonic() # Let the rate build up again before relaxing
+            self.loaded.add(user_id)
+        state = self.chats.get((user_id, chat_id))
+        if state is None:
+            state = self.chats[(user_id, chat_id)] = ChatRate()
+        return state
+
+    def on_message(self, user_id: int, chat_id: int, title: str = None):
+        """Register one message. Returns (policy, rate, changed)."""
+        state = self._state(user_id, chat_id)
+        now = time.monotonic()
+        decay = math.exp(-(now - state.last) / RATE_WINDOW)
+        state.rate = state.rate * decay + 60.0 / RATE_WINDOW
+        state.last = now
+
+        if not state.auto or now - state.changed_at < config.THROTTLE_COOLDOWN:
+            return state.policy, state.rate, False
+
+        target = POLICY_ALL
+        for policy, threshold in self.thresholds().items():
+            if state.rate >= threshold:
+                target = policy
+
+        current = LADDER.index(state.policy)
+        wanted = LADDER.index(target)
+        if wanted < current:
+            # Relax one step at a time, and only well below the current threshold
+            if state.rate >= self.thresholds()[state.policy] / 2:
+                return state.policy, state.rate, False
+            target = LADDER[current - 1]
+
+        if target == state.policy:
+            return state.policy, state.rate, False
+
+        state.policy = target
+        state.changed_at = now
+        database.set_chat_policy(user_id, chat_id, target, auto=True, title=title)
+        return state.policy, state.rate, True
+
+    def policy(self, user_id: int, chat_id: int) -> str:
+        """Current policy of the chat, without registering a message."""
+        return self._state(user_id, chat_id).policy
+
+    def set_policy(self, user_id: int, chat_id: int, policy: str = None, title: str = None):
+        """Pin a policy manually, or pass None to return the chat to automatic mode."""
+        state = self._state(user_id, chat_id)
+        state.auto = policy is None
+        state.policy = policy or POLICY_ALL
+        state.changed_at = time.monotonic()
+        if policy is None:
+            database.delete_chat_policy(user_id, chat_id)
+        else:
+            database.set_chat_policy(user_id, chat_id, policy, auto=False, title=title)
+
+    def drop(self, user_id: int):
+        self.loaded.discard(user_id)
+        for key in [k for k in self.chats if k[0] == user_id]:
+            del self.chats[key]
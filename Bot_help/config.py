@@ -13,8 +13,152 @@ CITY = os.getenv("CITY", "Moscow")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
+# Override the API endpoints, e.g. to point at mock_llm.py for load testing
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL") or None
 
 # UserBot Sync
 API_ID = os.getenv("API_ID")
 API_HASH = os.getenv("API_HASH")
 WEBAPP_URL = "https://4riz7.github.io/4riz-github.io/index.html?v=2.0"
+
+# UserBot Backfill (messages missed while the bot was offline)
+BACKFILL_DIALOGS = int(os.getenv("BACKFILL_DIALOGS", 50))           # most recent dialogs to inspect
+BACKFILL_CONCURRENCY = int(os.getenv("BACKFILL_CONCURRENCY", 3))    # chats walked in parallel per user
+BACKFILL_MAX_MESSAGES = int(os.getenv("BACKFILL_MAX_MESSAGES", 2000))  # API budget per user per start
+BACKFILL_MAX_PER_CHAT = int(os.getenv("BACKFILL_MAX_PER_CHAT", 500))
+
+# In-memory index of recent UserBot messages (per user)
+MESSAGE_INDEX_MAX_RECORDS = int(os.getenv("MESSAGE_INDEX_MAX_RECORDS", 2000))
+MESSAGE_INDEX_MAX_KB = int(os.getenv("MESSAGE_INDEX_MAX_KB", 1024))
+
+# Auto-throttling of noisy group chats (messages per minute)
+THROTTLE_TEXT_RATE = float(os.getenv("THROTTLE_TEXT_RATE", 20))         # stop capturing media
+THROTTLE_SAMPLE_RATE = float(os.getenv("THROTTLE_SAMPLE_RATE", 60))     # cache every Nth message
+THROTTLE_CONTACTS_RATE = float(os.getenv("THROTTLE_CONTACTS_RATE", 150))  # contacts and replies only
+THROTTLE_SAMPLE_EVERY = int(os.getenv("THROTTLE_SAMPLE_EVERY", 5))
+THROTTLE_COOLDOWN = int(os.getenv("THROTTLE_COOLDOWN", 600))  # seconds between automatic switches
+
+# Activity statistics
+STATS_FLUSH_SECONDS = int(os.getenv("STATS_FLUSH_SECONDS", 30))
+
+# AI provider limits
+AI_TIMEOUT = float(os.getenv("AI_TIMEOUT", 30))             # seconds per provider request
+AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", 20))  # across all providers
+AI_THREADS = int(os.getenv("AI_THREADS", 8))                 # pool for sync-only SDKs
+GIGACHAT_CONCURRENCY = int(os.getenv("GIGACHAT_CONCURRENCY", 5))
+GROQ_CONCURRENCY = int(os.getenv("GROQ_CONCURRENCY", 10))
+OPENAI_CONCURRENCY = int(os.getenv("OPENAI_CONCURRENCY", 10))
+
+# AI router
+AI_ROUTER_WINDOW = int(os.getenv("AI_ROUTER_WINDOW", 50))               # requests kept per provider
+AI_ROUTER_PRIOR_LATENCY = float(os.getenv("AI_ROUTER_PRIOR_LATENCY", 3))  # assumed p50 before any data
+AI_BREAKER_FAILURES = int(os.getenv("AI_BREAKER_FAILURES", 3))          # consecutive errors to open
+AI_BREAKER_COOLDOWN = float(os.getenv("AI_BREAKER_COOLDOWN", 60))       # seconds before a probe
+AI_ROUTER_STATS_TTL = float(os.getenv("AI_ROUTER_STATS_TTL", 600))      # seconds before outcomes expire
+
+# Hedged AI requests (fire the next provider when the first is slow)
+AI_HEDGING = os.getenv("AI_HEDGING", "1") == "1"
+AI_HEDGE_DELAY = float(os.getenv("AI_HEDGE_DELAY", 8))          # seconds, until p90 is known
+AI_HEDGE_MIN_DELAY = float(os.getenv("AI_HEDGE_MIN_DELAY", 1.5))
+AI_HEDGE_RATIO = float(os.getenv("AI_HEDGE_RATIO", 0.1))        # at most ~10% extra requests
+AI_HEDGE_BURST = float(os.getenv("AI_HEDGE_BURST", 5))
+AI_HEDGE_PER_USER_HOUR = int(os.getenv("AI_HEDGE_PER_USER_HOUR", 10))
+
+# AI response cache
+AI_CACHE_TTL = int(os.getenv("AI_CACHE_TTL", 24 * 3600))   # seconds
+AI_CACHE_MEMORY = int(os.getenv("AI_CACHE_MEMORY", 500))    # entries kept in memory
+AI_CACHE_MAX_ROWS = int(os.getenv("AI_CACHE_MAX_ROWS", 5000))  # entries kept in SQLite
+
+# Streaming AI replies (placeholder message edited as tokens arrive)
+AI_STREAMING = os.getenv("AI_STREAMING", "1") == "1"
+AI_STREAM_EDIT_INTERVAL = float(os.getenv("AI_STREAM_EDIT_INTERVAL", 1.5))  # seconds between edits
+
+# Conversation memory for chat with AI
+AI_MEMORY_TURNS = int(os.getenv("AI_MEMORY_TURNS", 6))                  # question/answer pairs kept verbatim
+AI_MEMORY_COMPACT_BATCH = int(os.getenv("AI_MEMORY_COMPACT_BATCH", 4))  # pairs folded per summary update
+AI_MEMORY_TOKEN_BUDGET = int(os.getenv("AI_MEMORY_TOKEN_BUDGET", 1500))
+AI_MEMORY_SUMMARY_CHARS = int(os.getenv("AI_MEMORY_SUMMARY_CHARS", 1500))
+
+# Notes passed to the AI as context
+AI_NOTES_LIMIT = int(os.getenv("AI_NOTES_LIMIT", 8))
+AI_NOTES_CHARS = int(os.getenv("AI_NOTES_CHARS", 1500))
+
+# AI usage quotas (estimated tokens per user per day, admin is exempt)
+AI_DAILY_TOKENS = int(os.getenv("AI_DAILY_TOKENS", 60000))            # above this: shorter context, cheaper provider
+AI_DAILY_TOKENS_HARD = int(os.getenv("AI_DAILY_TOKENS_HARD", 150000)) # above this: requests are refused
+AI_CHEAP_PROVIDER = os.getenv("AI_CHEAP_PROVIDER", "Groq")
+
+# Long article / PDF summaries (map-reduce)
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", 1500))
+SUMMARY_MAX_CHUNKS = int(os.getenv("SUMMARY_MAX_CHUNKS", 24))
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", 4))  # chunk requests in flight per document
+SUMMARY_MAX_PAGES = int(os.getenv("SUMMARY_MAX_PAGES", 150))
+SUMMARY_LINKS_MAX = int(os.getenv("SUMMARY_LINKS_MAX", 10))                 # links read from one message
+SUMMARY_LINKS_CONCURRENCY = int(os.getenv("SUMMARY_LINKS_CONCURRENCY", 5)) # links fetched/summarized at once
+
+# Shared outbound HTTP client
+HTTP2 = os.getenv("HTTP2", "1") == "1"                   # used only if the h2 package is installed
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", 15))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 100))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", 20))
+HTTP_PER_HOST = int(os.getenv("HTTP_PER_HOST", 10))      # concurrent requests per host
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", 2))
+HTTP_BACKOFF = float(os.getenv("HTTP_BACKOFF", 0.3))     # seconds, doubled per attempt, full jitter
+HTTP_RETRY_RATIO = float(os.getenv("HTTP_RETRY_RATIO", 0.2))  # retries earned per request
+HTTP_RETRY_BURST = int(os.getenv("HTTP_RETRY_BURST", 10))
+HTTP_MAX_RETRY_AFTER = float(os.getenv("HTTP_MAX_RETRY_AFTER", 10))
+HTTP_BREAKER_FAILURES = int(os.getenv("HTTP_BREAKER_FAILURES", 5))
+HTTP_BREAKER_COOLDOWN = float(os.getenv("HTTP_BREAKER_COOLDOWN", 30))
+
+# Weather cache (OpenWeatherMap)
+WEATHER_TTL = int(os.getenv("WEATHER_TTL", 900))                  # seconds a reading is reused
+WEATHER_ERROR_TTL = int(os.getenv("WEATHER_ERROR_TTL", 120))      # unknown city etc.
+WEATHER_STALE = int(os.getenv("WEATHER_STALE", 3 * 3600))         # max age served when the API fails
+WEATHER_GRID = float(os.getenv("WEATHER_GRID", 0.1))              # degrees per lat/lon cell (~10 km)
+WEATHER_MAX_ENTRIES = int(os.getenv("WEATHER_MAX_ENTRIES", 5000))
+WEATHER_CALLS_PER_MINUTE = int(os.getenv("WEATHER_CALLS_PER_MINUTE", 50))
+WEATHER_CONCURRENCY = int(os.getenv("WEATHER_CONCURRENCY", 5))
+WEATHER_PREFETCH_MINUTES = int(os.getenv("WEATHER_PREFETCH_MINUTES", 5))  # before the morning brief, 0 = off
+
+# Morning brief delivery
+BRIEF_SEND_RATE = float(os.getenv("BRIEF_SEND_RATE", 25))   # messages per second (Telegram allows ~30)
+BRIEF_SEND_WORKERS = int(os.getenv("BRIEF_SEND_WORKERS", 8))
+
+# Per-user time zones
+DEFAULT_TZ_OFFSET = int(os.getenv("DEFAULT_TZ_OFFSET", 180))      # minutes, for users without a zone (Moscow)
+BRIEF_HOUR = int(os.getenv("BRIEF_HOUR", 8))                      # local hour of the morning brief
+BRIEF_SPREAD_MINUTES = int(os.getenv("BRIEF_SPREAD_MINUTES", 10)) # users of one zone are spread over this window
+
+# Habit reminders
+HABIT_CATCHUP_MINUTES = int(os.getenv("HABIT_CATCHUP_MINUTES", 60))  # missed ticks replayed after a restart
+
+# Reminders (/remind)
+REMINDER_BATCH = int(os.getenv("REMINDER_BATCH", 500))        # due reminders read per query
+REMINDERS_PAGE = int(os.getenv("REMINDERS_PAGE", 20))         # shown by /reminders
+REMINDER_LATE_SECONDS = int(os.getenv("REMINDER_LATE_SECONDS", 120))  # later than this is marked as missed
+REMINDER_RETRY_HOURS = int(os.getenv("REMINDER_RETRY_HOURS", 24))     # failed sends are retried for this long
+
+# Exchange rates
+FX_API_URL = os.getenv("FX_API_URL", "https://open.er-api.com/v6/latest/USD")
+FX_REFRESH_MINUTES = int(os.getenv("FX_REFRESH_MINUTES", 60))
+FX_STALE_HOURS = float(os.getenv("FX_STALE_HOURS", 26))   # the free feed updates once a day
+DEFAULT_CURRENCY = os.getenv("DEFAULT_CURRENCY", "RUB")   # base currency for users who haven't picked one
+
+# Temporary mail
+MAIL_PROVIDER = os.getenv("MAIL_PROVIDER", "mailtm")          # "mailtm" or "1secmail"; the other is the fallback
+MAIL_TM_URL = os.getenv("MAIL_TM_URL", "https://api.mail.tm")
+ONESECMAIL_URL = os.getenv("ONESECMAIL_URL", "https://www.1secmail.com/api/v1/")
+MAIL_WATCH_HOURS = float(os.getenv("MAIL_WATCH_HOURS", 24))   # new mail is pushed this long after creating/checking
+MAIL_POLL_MIN = float(os.getenv("MAIL_POLL_MIN", 10))         # seconds between checks right after mail arrives
+MAIL_POLL_MAX = float(os.getenv("MAIL_POLL_MAX", 120))        # ... backing off to this while the inbox is quiet
+MAIL_WATCH_CONCURRENCY = int(os.getenv("MAIL_WATCH_CONCURRENCY", 10))
+MAIL_BODY_CONCURRENCY = int(os.getenv("MAIL_BODY_CONCURRENCY", 4))
+MAIL_PUSH_LIMIT = int(os.getenv("MAIL_PUSH_LIMIT", 5))        # messages pushed per inbox per check
+MAIL_TOKEN_TTL = int(os.getenv("MAIL_TOKEN_TTL", 600))        # if a mail.tm token has no readable expiry
+
+# Article fetching (link summaries)
+ARTICLE_MAX_BYTES = int(os.getenv("ARTICLE_MAX_BYTES", 3 * 1024 * 1024))  # download is cut here
+ARTICLE_MAX_CHARS = int(os.getenv("ARTICLE_MAX_CHARS", 200000))           # extracted text kept
+ARTICLE_FRESH_SECONDS = int(os.getenv("ARTICLE_FRESH_SECONDS", 600))      # reused without even a conditional GET
+ARTICLE_CACHE_ROWS = int(os.getenv("ARTICLE_CACHE_ROWS", 2000))
@@ -0,0 +1,91 @@
+import asyncio
+import logging
+
+import config
+import database
+from ai_providers import estimate_tokens
+
+SUMMARY_PROMPT = (
+    "Ниже краткая сводка предыдущего разговора и новые реплики. "
+    "Обнови сводку: сохрани факты о пользователе, его вопросы и договоренности, "
+    "убери повторы. Пиши кратко, не более {limit} символов, без вступлений.\n\n"
+    "Сводка:\n{summary}\n\nНовые реплики:\n{turns}"
+)
+
+
+class ConversationMemory:
+    """Per-user chat history for chat_with_ai: a rolling summary plus the last N turns.
+    Older turns are folded into the summary, so reads and prompt size stay bounded."""
+
+    def __init__(self, summarize):
+        self.summarize = summarize # async (prompt, user_id) -> str
+        self.compacting = set()
+        self.tasks = {} # user_id -> running compaction; the loop itself only holds tasks weakly
+
+    def context(self, user_id: int, token_budget: int = None) -> str:
+        """Prompt block with the summary and as many recent turns as fit the budget."""
+        budget = token_budget or config.AI_MEMORY_TOKEN_BUDGET
+        summary = database.get_ai_summary(user_id)
+        # Turns not yet folded into the summary: at most N + one compaction batch
+        turns = database.get_ai_turns(user_id, (config.AI_MEMORY_TURNS + config.AI_MEMORY_COMPACT_BATCH) * 2)
+
+        lines = []
+        used = estimate_tokens(summary)
+        for _, role, content in turns: # newest first, so the oldest are dropped when over budget
+            line = f"{'Пользователь' if role == 'user' else 'Ассистент'}: {content}"
+            used += estimate_tokens(line)
+            if used > budget:
+                break
+            lines.append(line)
+        lines.reverse()
+
+        block = ""
+        if summary:
+            block += f"Сводка предыдущего разговора:\n{summary}\n\n"
+        if lines:
+            block += "Последние сообщения:\n" + "\n".join(lines) + "\n\n"
+        return block
+
+    def append(self, user_id: int, question: str, answer: str):
+        database.add_ai_turns(user_id, [("user", question), ("assistant", answer)])
+        if user_id not in self.compacting:
+            # Summarization runs in the background so the reply isn't delayed.
+            # Marked before scheduling so a second append in the same tick doesn't start another
+            self.compacting.add(user_id)
+            task = self.tasks[user_id] = asyncio.create_task(self.compact(user_id))
+            task.add_done_callback(lambda done: self._forget(user_id, done))
+
+    def _forget(self, user_id: int, task):
+        if self.tasks.get(user_id) is task:
+            del self.tasks[user_id]
+            self.compacting.discard(user_id)
+
+    async def compact(self, user_id: int):
+        try:
+            keep = config.AI_MEMORY_TURNS * 2
+            batch = config.AI_MEMORY_COMPACT_BATCH * 2
+            # Only the overflow beyond the last N turns is read and summarized, a batch at a time
+            turns = database.get_ai_turns(user_id, keep + batch)
+            if len(turns) < keep + batch:
+                return
+            old = list(reversed(turns[keep:])) # oldest first
+            transcript = "\n".join(
+                f"{'Пользователь' if role == 'user' else 'Ассистент'}: {content[:1000]}" for _, role, content in old
+            )
+            summary = database.get_ai_summary(user_id)
+            new_summary = await self.summarize(
+                SUMMARY_PROMPT.format(limit=config.AI_MEMORY_SUMMARY_CHARS, summary=summary or "(пусто)", turns=transcript),
+                user_id,
+            )
+            if new_summary:
+                database.compact_ai_turns(user_id, new_summary[:config.AI_MEMORY_SUMMARY_CHARS], old[-1][0])
+        except Exception as e:
+            logging.error(f"Conversation compaction failed for {user_id}: {e}")
+
+    def clear(self, user_id: int):
+        # A summary of the old turns must not be written back after the wipe
+        task = self.tasks.pop(user_id, None)
+        if task is not None:
+            task.cancel()
+        self.compacting.discard(user_id)
+        database.clear_ai_memory(user_id)
@@ -1,6 +1,8 @@
 import sqlite3
+import time
 
 DB_PATH = "bot_database.db"
+NOTES_FTS = True
 
 def init_db():
     conn = sqlite3.connect(DB_PATH)
@@ -58,6 +60,18 @@ def init_db():
         conn.commit()
     except sqlite3.OperationalError:
         pass
+    # reminder_time is local "HH:MM"; reminder_minute is the same moment as a UTC minute-of-day
+    try:
+        cursor.execute("ALTER TABLE habits ADD COLUMN reminder_minute INTEGER")
+    except sqlite3.OperationalError:
+        pass
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_habits_reminder_minute ON habits (reminder_minute)")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS scheduler_state (
+            name TEXT PRIMARY KEY,
+            value INTEGER
+        )
+    """)
         
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS cached_messages (
@@ -92,6 +106,155 @@ def init_db():
     except sqlite3.OperationalError:
         pass
     
+    # Edit history: chain of compact diffs on top of the original cached content.
+    # One chain per tenant: each diff applies to the text that tenant had cached
+    revisions_sql = """
+        CREATE TABLE IF NOT EXISTS message_revisions (
+            user_id INTEGER,
+            message_id INTEGER,
+            chat_id INTEGER,
+            revision INTEGER,
+            diff TEXT,
+            edited_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, message_id, chat_id, revision)
+        )
+    """
+    cursor.execute(revisions_sql)
+    # Migration: chains used to be keyed without user_id
+    pk = {row[1]: row[5] for row in cursor.execute("PRAGMA table_info(message_revisions)").fetchall()}
+    if not pk.get("user_id"):
+        cursor.execute("ALTER TABLE message_revisions RENAME TO message_revisions_old")
+        cursor.execute(revisions_sql)
+        cursor.execute("""
+            INSERT OR IGNORE INTO message_revisions (user_id, message_id, chat_id, revision, diff, edited_at)
+            SELECT user_id, message_id, chat_id, revision, diff, edited_at FROM message_revisions_old
+        """)
+        cursor.execute("DROP TABLE message_revisions_old")
+        conn.commit()
+
+    # Activity counters, maintained incrementally (see chat_stats.py)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS chat_stats_daily (
+            user_id INTEGER,
+            chat_id INTEGER,
+            day DATE,
+            cached INTEGER DEFAULT 0,
+            deleted INTEGER DEFAULT 0,
+            edited INTEGER DEFAULT 0,
+            PRIMARY KEY (user_id, chat_id, day)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS chat_stats_total (
+            user_id INTEGER,
+            chat_id INTEGER,
+            title TEXT,
+            cached INTEGER DEFAULT 0,
+            deleted INTEGER DEFAULT 0,
+            edited INTEGER DEFAULT 0,
+            PRIMARY KEY (user_id, chat_id)
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_chat_stats_total_cached ON chat_stats_total (user_id, cached DESC)")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_stats_daily (
+            user_id INTEGER,
+            day DATE,
+            cached INTEGER DEFAULT 0,
+            deleted INTEGER DEFAULT 0,
+            edited INTEGER DEFAULT 0,
+            PRIMARY KEY (user_id, day)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_stats_total (
+            user_id INTEGER PRIMARY KEY,
+            cached INTEGER DEFAULT 0,
+            deleted INTEGER DEFAULT 0,
+            edited INTEGER DEFAULT 0
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_stats_total_cached ON user_stats_total (cached DESC)")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS global_stats_daily (
+            day DATE PRIMARY KEY,
+            cached INTEGER DEFAULT 0,
+            deleted INTEGER DEFAULT 0,
+            edited INTEGER DEFAULT 0
+        )
+    """)
+
+    # Conversation memory for chat_with_ai (see conversation.py)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ai_turns (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            role TEXT,
+            content TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_ai_turns_user ON ai_turns (user_id, id)")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ai_memory (
+            user_id INTEGER PRIMARY KEY,
+            summary TEXT,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # AI token metering (see ai_usage.py)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ai_usage (
+            user_id INTEGER,
+            day TEXT,
+            feature TEXT,
+            provider TEXT,
+            requests INTEGER DEFAULT 0,
+            prompt_tokens INTEGER DEFAULT 0,
+            completion_tokens INTEGER DEFAULT 0,
+            PRIMARY KEY (user_id, day, feature, provider)
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_ai_usage_day ON ai_usage (day)")
+
+    # AI response cache (see ai_cache.py)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ai_cache (
+            key TEXT PRIMARY KEY,
+            provider TEXT,
+            response TEXT,
+            created_at REAL,
+            last_used REAL
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_ai_cache_last_used ON ai_cache (last_used)")
+
+    # Extracted article text per URL with the validators for conditional GETs (see articles.py)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS article_cache (
+            url TEXT PRIMARY KEY,
+            etag TEXT,
+            last_modified TEXT,
+            title TEXT,
+            text TEXT,
+            fetched_at REAL,
+            checked_at REAL
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_article_cache_checked ON article_cache (checked_at)")
+
+    # Last seen message per chat, used to backfill messages missed while offline
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS chat_sync_state (
+            user_id INTEGER,
+            chat_id INTEGER,
+            last_message_id INTEGER DEFAULT 0,
+            backfill_from INTEGER,
+            PRIMARY KEY (user_id, chat_id)
+        )
+    """)
+    
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS user_sessions (
             user_id INTEGER PRIMARY KEY,
@@ -141,6 +304,64 @@ def init_db():
     except sqlite3.OperationalError:
         pass
 
+    # Time zone (IANA name if set explicitly, offset in minutes) and the UTC minute-of-day of the brief
+    for column in ("tz TEXT", "tz_offset INTEGER", "brief_minute INTEGER"):
+        try:
+            cursor.execute(f"ALTER TABLE users ADD COLUMN {column}")
+        except sqlite3.OperationalError:
+            pass
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_brief_minute ON users (brief_minute)")
+
+    # Temp mail: which service the inbox lives on, its password (mail.tm) and how long to watch it
+    for column in ("provider TEXT", "secret TEXT", "watch_until INTEGER"):
+        try:
+            cursor.execute(f"ALTER TABLE temp_emails ADD COLUMN {column}")
+        except sqlite3.OperationalError:
+            pass
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS temp_mail_seen (
+            user_id INTEGER,
+            message_id TEXT,
+            PRIMARY KEY (user_id, message_id)
+        )
+    """)
+
+    # Expense currency (NULL: recorded before currencies, i.e. DEFAULT_CURRENCY) and the user's base currency
+    for table, column in (("expenses", "currency TEXT"), ("users", "base_currency TEXT")):
+        try:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column}")
+        except sqlite3.OperationalError:
+            pass
+    # Latest exchange rates, units per 1 USD
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS fx_rates (
+            currency TEXT PRIMARY KEY,
+            rate REAL,
+            updated_at INTEGER
+        )
+    """)
+
+    # /remind reminders: run_at is UTC epoch seconds, tz_offset the user's zone when it was computed,
+    # anchor_day the local day of month of the first run (monthly ones come back to it after short months)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS reminders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            text TEXT,
+            run_at INTEGER,
+            repeat TEXT,
+            tz_offset INTEGER,
+            created_at INTEGER,
+            anchor_day INTEGER
+        )
+    """)
+    try:
+        cursor.execute("ALTER TABLE reminders ADD COLUMN anchor_day INTEGER")
+    except sqlite3.OperationalError:
+        pass
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_reminders_run_at ON reminders (run_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_reminders_user ON reminders (user_id, run_at)")
+
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS categories (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -155,6 +376,17 @@ def init_db():
         INSERT OR IGNORE INTO categories (user_id, name)
         SELECT DISTINCT user_id, category FROM expenses
     """)
+
+    # Full-text index over notes for AI context (rowid = notes.id)
+    global NOTES_FTS
+    try:
+        cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(content, user_id UNINDEXED)")
+        cursor.execute("""
+            INSERT INTO notes_fts (rowid, content, user_id)
+            SELECT id, content, user_id FROM notes WHERE id NOT IN (SELECT rowid FROM notes_fts)
+        """)
+    except sqlite3.OperationalError:
+        NOTES_FTS = False # SQLite built without FTS5: fall back to recent notes
     init_settings(conn)
     conn.commit()
     conn.close()
@@ -215,6 +447,65 @@ def get_user_city_2(user_id: int):
     conn.close()
     return row[0] if row else None
 
+def get_user_timezone(user_id: int):
+    """(tz_name | None, offset_minutes | None)"""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("SELECT tz, tz_offset FROM users WHERE user_id = ?", (user_id,))
+    row = cursor.fetchone()
+    conn.close()
+    return row if row else (None, None)
+
+def set_user_timezone(user_id: int, tz_name, offset: int, brief_minute: int):
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("INSERT OR IGNORE INTO users (user_id) VALUES (?)", (user_id,))
+    cursor.execute("UPDATE users SET tz = ?, tz_offset = ?, brief_minute = ? WHERE user_id = ?", (tz_name, offset, brief_minute, user_id))
+    # Habit reminders stay at the same local time
+    cursor.execute(f"""
+        UPDATE habits SET reminder_minute = {HABIT_UTC_MINUTE.format(offset="?")}
+        WHERE user_id = ? AND reminder_time LIKE '%:%'
+    """, (offset, user_id))
+    conn.commit()
+    conn.close()
+
+def get_named_timezones():
+    """[(user_id, tz, tz_offset), ...] for users with an IANA zone (their offset changes with DST)"""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("SELECT user_id, tz, tz_offset FROM users WHERE tz IS NOT NULL")
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+def get_brief_offsets(only_new: bool = True):
+    """[(user_id, tz_offset | None), ...] of users whose brief_minute needs (re)computing"""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT user_id, tz_offset FROM users {'WHERE brief_minute IS NULL' if only_new else ''}")
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+def set_brief_minutes(rows):
+    """rows: [(brief_minute, user_id), ...]"""
+    if not rows:
+        return
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.executemany("UPDATE users SET brief_minute = ? WHERE user_id = ?", rows)
+    conn.commit()
+    conn.close()
+
+def get_brief_users(minute: int):
+    """[(user_id, city, latitude, longitude), ...] whose brief is due at this UTC minute (indexed)"""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("SELECT user_id, city, latitude, longitude FROM users WHERE brief_minute = ?", (minute,))
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
 def get_user_location(user_id: int):
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
@@ -233,11 +524,11 @@ def get_user_count():
     conn.close()
     return count
 
-def add_expense(user_id: int, amount: float, category: str):
+def add_expense(user_id: int, amount: float, category: str, currency: str = None):
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
-    cursor.execute("INSERT INTO expenses (user_id, amount, category) VALUES (?, ?, ?)", 
-                   (user_id, amount, category))
+    cursor.execute("INSERT INTO expenses (user_id, amount, category, currency) VALUES (?, ?, ?, ?)", 
+                   (user_id, amount, category, currency))
     # Also ensure category exists
     cursor.execute("INSERT OR IGNORE INTO categories (user_id, name) VALUES (?, ?)", (user_id, category))
     conn.commit()
@@ -269,15 +560,62 @@ def delete_expenses_by_category(user_id: int, category: str):
 def get_expenses(user_id: int):
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
-    cursor.execute("SELECT amount, category, timestamp FROM expenses WHERE user_id = ? ORDER BY timestamp DESC", (user_id,))
+    cursor.execute("SELECT amount, category, timestamp, currency FROM expenses WHERE user_id = ? ORDER BY timestamp DESC", (user_id,))
     rows = cursor.fetchall()
     conn.close()
     return rows
 
+def get_expense_totals(user_id: int, default_currency: str):
+    """[(category, currency, total), ...] in the currencies the expenses were recorded in"""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT category, COALESCE(currency, ?) AS cur, SUM(amount) FROM expenses
+        WHERE user_id = ? GROUP BY category, cur
+    """, (default_currency, user_id))
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+def get_base_currency(user_id: int):
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("SELECT base_currency FROM users WHERE user_id = ?", (user_id,))
+    row = cursor.fetchone()
+    conn.close()
+    return row[0] if row else None
+
+def set_base_currency(user_id: int, currency: str):
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("INSERT OR IGNORE INTO users (user_id) VALUES (?)", (user_id,))
+    cursor.execute("UPDATE users SET base_currency = ? WHERE user_id = ?", (currency, user_id))
+    conn.commit()
+    conn.close()
+
+def save_fx_rates(rates: dict, updated_at: int):
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.executemany("INSERT OR REPLACE INTO fx_rates (currency, rate, updated_at) VALUES (?, ?, ?)",
+                       [(code, rate, updated_at) for code, rate in rates.items()])
+    conn.commit()
+    conn.close()
+
+def get_fx_rates():
+    """({currency: rate}, updated_at | None)"""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("SELECT currency, rate, updated_at FROM fx_rates")
+    rows = cursor.fetchall()
+    conn.close()
+    return {code: rate for code, rate, _ in rows}, max((row[2] for row in rows), default=None)
+
 def add_note(user_id: int, content: str):
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     cursor.execute("INSERT INTO notes (user_id, content) VALUES (?, ?)", (user_id, content))
+    if NOTES_FTS:
+        cursor.execute("INSERT INTO notes_fts (rowid, content, user_id) VALUES (?, ?, ?)", (cursor.lastrowid, content, user_id))
     conn.commit()
     conn.close()
 
@@ -293,6 +631,8 @@ def delete_note(note_id: int):
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     cursor.execute("DELETE FROM notes WHERE id = ?", (note_id,))
+    if NOTES_FTS:
+        cursor.execute("DELETE FROM notes_fts WHERE rowid = ?", (note_id,))
     conn.commit()
     conn.close()
 
@@ -300,8 +640,33 @@ def clear_notes(user_id: int):
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     cursor.execute("DELETE FROM notes WHERE user_id = ?", (user_id,))
+    if NOTES_FTS:
+        cursor.execute("DELETE FROM notes_fts WHERE user_id = ?", (user_id,))
     conn.commit()
     conn.close()
+
+def search_notes(user_id: int, match: str, limit: int):
+    """Best-matching notes first (FTS5 bm25): [(id, content), ...]"""
+    if not NOTES_FTS or not match:
+        return []
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT rowid, content FROM notes_fts
+        WHERE notes_fts MATCH ? AND user_id = ?
+        ORDER BY bm25(notes_fts) LIMIT ?
+    """, (match, user_id, limit))
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+def get_recent_notes(user_id: int, limit: int):
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("SELECT id, content FROM notes WHERE user_id = ? ORDER BY id DESC LIMIT ?", (user_id, limit))
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
 # To-Do List Functions
 def add_task(user_id: int, text: str):
     conn = sqlite3.connect(DB_PATH)
@@ -326,10 +691,11 @@ def complete_task(task_id: int):
     conn.close()
 
 # Habit Tracker Functions
-def add_habit(user_id: int, name: str, reminder_time: str = None):
+def add_habit(user_id: int, name: str, reminder_time: str = None, reminder_minute: int = None):
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
-    cursor.execute("INSERT INTO habits (user_id, name, reminder_time) VALUES (?, ?, ?)", (user_id, name, reminder_time))
+    cursor.execute("INSERT INTO habits (user_id, name, reminder_time, reminder_minute) VALUES (?, ?, ?, ?)",
+                   (user_id, name, reminder_time, reminder_minute))
     conn.commit()
     conn.close()
 
@@ -341,15 +707,113 @@ def get_habits(user_id: int):
     conn.close()
     return habits
 
-def get_habits_with_reminders():
-    """Get all habits that have a reminder set"""
+# Local "HH:MM" -> UTC minute-of-day for a given offset (same as timezones.to_utc_minute)
+HABIT_UTC_MINUTE = """((CAST(substr(reminder_time, 1, instr(reminder_time, ':') - 1) AS INTEGER) * 60
+    + CAST(substr(reminder_time, instr(reminder_time, ':') + 1) AS INTEGER) - {offset}) % 1440 + 1440) % 1440"""
+
+def assign_habit_minutes(default_offset: int):
+    """Fill reminder_minute for reminders saved before it existed."""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    offset = "COALESCE((SELECT tz_offset FROM users WHERE users.user_id = habits.user_id), ?)"
+    cursor.execute(f"""
+        UPDATE habits SET reminder_minute = {HABIT_UTC_MINUTE.format(offset=offset)}
+        WHERE reminder_time IS NOT NULL AND reminder_time LIKE '%:%' AND reminder_minute IS NULL
+    """, (default_offset,))
+    conn.commit()
+    conn.close()
+
+def get_due_habits(minutes):
+    """[(id, user_id, name, reminder_minute), ...] with a reminder at any of these UTC minutes (indexed)"""
+    if not minutes:
+        return []
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT id, user_id, name, reminder_minute FROM habits
+        WHERE reminder_minute IN ({",".join("?" * len(minutes))})
+        ORDER BY user_id, reminder_minute
+    """, list(minutes))
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+def get_scheduler_state(name: str):
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("SELECT value FROM scheduler_state WHERE name = ?", (name,))
+    row = cursor.fetchone()
+    conn.close()
+    return row[0] if row else None
+
+def set_scheduler_state(name: str, value: int):
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("INSERT OR REPLACE INTO scheduler_state (name, value) VALUES (?, ?)", (name, value))
+    conn.commit()
+    conn.close()
+
+# Reminders
+def add_reminder(user_id: int, text: str, run_at: int, repeat: str, tz_offset: int, anchor_day: int = None):
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute(
+        "INSERT INTO reminders (user_id, text, run_at, repeat, tz_offset, anchor_day, created_at) VALUES (?, ?, ?, ?, ?, ?, strftime('%s', 'now'))",
+        (user_id, text, run_at, repeat, tz_offset, anchor_day)
+    )
+    reminder_id = cursor.lastrowid
+    conn.commit()
+    conn.close()
+    return reminder_id
+
+def get_user_reminders(user_id: int, limit: int):
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
-    cursor.execute("SELECT id, user_id, name, reminder_time FROM habits WHERE reminder_time IS NOT NULL")
+    cursor.execute("SELECT id, text, run_at, repeat, tz_offset FROM reminders WHERE user_id = ? ORDER BY run_at LIMIT ?", (user_id, limit))
     rows = cursor.fetchall()
     conn.close()
     return rows
 
+def count_user_reminders(user_id: int):
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM reminders WHERE user_id = ?", (user_id,))
+    count = cursor.fetchone()[0]
+    conn.close()
+    return count
+
+def delete_reminder(reminder_id: int, user_id: int):
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM reminders WHERE id = ? AND user_id = ?", (reminder_id, user_id))
+    deleted = cursor.rowcount > 0
+    conn.commit()
+    conn.close()
+    return deleted
+
+def get_due_reminders(until: float, limit: int):
+    """[(id, user_id, text, run_at, repeat, tz_offset, current_offset, anchor_day), ...] due by `until`,
+    oldest first (indexed). current_offset is the user's zone now (NULL if never set)."""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT r.id, r.user_id, r.text, r.run_at, r.repeat, r.tz_offset, u.tz_offset, r.anchor_day
+        FROM reminders r LEFT JOIN users u ON u.user_id = r.user_id
+        WHERE r.run_at <= ? ORDER BY r.run_at LIMIT ?
+    """, (until, limit))
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+def finish_reminders(done_ids, rescheduled):
+    """Delete sent one-off reminders and move recurring ones: rescheduled = [(run_at, tz_offset, id), ...]"""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.executemany("DELETE FROM reminders WHERE id = ?", [(rid,) for rid in done_ids])
+    cursor.executemany("UPDATE reminders SET run_at = ?, tz_offset = ? WHERE id = ?", rescheduled)
+    conn.commit()
+    conn.close()
+
 def log_habit(habit_id: int, user_id: int, date_str: str):
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
@@ -359,10 +823,14 @@ def log_habit(habit_id: int, user_id: int, date_str: str):
     conn.close()
 
 # Temp Mail Functions
-def save_temp_email(user_id: int, email: str):
+def save_temp_email(user_id: int, email: str, provider: str = None, secret: str = None, watch_until: int = None):
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
-    cursor.execute("INSERT OR REPLACE INTO temp_emails (user_id, email) VALUES (?, ?)", (user_id, email))
+    cursor.execute(
+        "INSERT OR REPLACE INTO temp_emails (user_id, email, provider, secret, watch_until) VALUES (?, ?, ?, ?, ?)",
+        (user_id, email, provider, secret, watch_until)
+    )
+    cursor.execute("DELETE FROM temp_mail_seen WHERE user_id = ?", (user_id,))
     conn.commit()
     conn.close()
 
@@ -374,6 +842,47 @@ def get_temp_email(user_id: int):
     conn.close()
     return row[0] if row else None
 
+def get_temp_mailbox(user_id: int):
+    """(email, provider, secret, watch_until) or None"""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("SELECT email, provider, secret, watch_until FROM temp_emails WHERE user_id = ?", (user_id,))
+    row = cursor.fetchone()
+    conn.close()
+    return row
+
+def set_mail_watch(user_id: int, watch_until: int):
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("UPDATE temp_emails SET watch_until = ? WHERE user_id = ?", (watch_until, user_id))
+    conn.commit()
+    conn.close()
+
+def get_watched_mailboxes(now: float):
+    """[(user_id, provider, email, secret, watch_until), ...] still being watched"""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("SELECT user_id, provider, email, secret, watch_until FROM temp_emails WHERE watch_until > ?", (now,))
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+def get_seen_mail(user_id: int):
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("SELECT message_id FROM temp_mail_seen WHERE user_id = ?", (user_id,))
+    ids = {row[0] for row in cursor.fetchall()}
+    conn.close()
+    return ids
+
+def add_seen_mail(user_id: int, message_ids):
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.executemany("INSERT OR IGNORE INTO temp_mail_seen (user_id, message_id) VALUES (?, ?)",
+                       [(user_id, str(mid)) for mid in message_ids])
+    conn.commit()
+    conn.close()
+
 # Message Cache Functions (for UserBot)
 def cache_message(message_id: int, chat_id: int, user_id: int, text: str):
     conn = sqlite3.connect(DB_PATH)
@@ -437,6 +946,61 @@ def cache_message(message_id, chat_id, user_id, sender_id, content, sender_name,
         (message_id, chat_id, user_id, sender_id, content, sender_name, media_type, file_id, sender_username, chat_title) 
         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
     """, (message_id, chat_id, user_id, sender_id, content, sender_name, media_type, file_id, sender_username, chat_title))
+    cursor.execute(SYNC_STATE_UPSERT, (user_id, chat_id, message_id))
+    conn.commit()
+    conn.close()
+
+def cache_messages_bulk(rows):
+    """Insert backfilled messages in one transaction.
+    rows: [(message_id, chat_id, user_id, sender_id, content, sender_name,
+            media_type, file_id, sender_username, chat_title, timestamp), ...]
+    Messages that are already cached are left untouched."""
+    if not rows:
+        return
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.executemany("""
+        INSERT OR IGNORE INTO cached_messages 
+        (message_id, chat_id, user_id, sender_id, content, sender_name, media_type, file_id, sender_username, chat_title, timestamp) 
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, rows)
+    cursor.executemany(SYNC_STATE_UPSERT, [(r[2], r[1], r[0]) for r in rows])
+    conn.commit()
+    conn.close()
+
+# Backfill State (messages missed while the UserBot was offline)
+SYNC_STATE_UPSERT = """
+    INSERT INTO chat_sync_state (user_id, chat_id, last_message_id) VALUES (?, ?, ?)
+    ON CONFLICT(user_id, chat_id) DO UPDATE SET last_message_id = MAX(last_message_id, excluded.last_message_id)
+"""
+
+def mark_backfill_pending(user_id):
+    """Freeze the current watermark of every chat as the backfill lower bound.
+    Chats left pending by an interrupted run keep their older bound."""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("UPDATE chat_sync_state SET backfill_from = COALESCE(backfill_from, last_message_id) WHERE user_id = ?", (user_id,))
+    conn.commit()
+    conn.close()
+
+def get_backfill_pending(user_id):
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("SELECT chat_id, backfill_from FROM chat_sync_state WHERE user_id = ? AND backfill_from IS NOT NULL", (user_id,))
+    rows = dict(cursor.fetchall())
+    conn.close()
+    return rows # {chat_id: backfill_from}
+
+def finish_backfill(user_id, chats):
+    """chats: [(chat_id, top_message_id), ...]"""
+    if not chats:
+        return
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.executemany("""
+        UPDATE chat_sync_state SET backfill_from = NULL, last_message_id = MAX(last_message_id, ?)
+        WHERE user_id = ? AND chat_id = ?
+    """, [(top_id, user_id, cid) for cid, top_id in chats])
     conn.commit()
     conn.close()
 
@@ -449,20 +1013,68 @@ def get_messages_for_check(user_id):
     conn.close()
     return rows
 
-def delete_cached_message(message_id, chat_id):
+def delete_cached_message(message_id, chat_id, user_id):
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     cursor.execute("DELETE FROM cached_messages WHERE message_id = ? AND chat_id = ?", (message_id, chat_id))
+    cursor.execute("DELETE FROM message_revisions WHERE user_id = ? AND message_id = ? AND chat_id = ?", (user_id, message_id, chat_id))
     conn.commit()
     conn.close()
 
-def get_cached_message_content(message_id, chat_id):
+def get_cached_message_row(message_id, chat_id):
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
-    cursor.execute("SELECT content, media_type, sender_name, sender_username, chat_title FROM cached_messages WHERE message_id = ? AND chat_id = ?", (message_id, chat_id))
+    cursor.execute("SELECT message_id, chat_id, sender_id, content, sender_name, media_type, file_id, sender_username, chat_title FROM cached_messages WHERE message_id = ? AND chat_id = ?", (message_id, chat_id))
     row = cursor.fetchone()
     conn.close()
-    return row # (content, media_type, name, username, title)
+    return row # Same shape as get_messages_for_check
+
+# Message Revisions (edit history)
+def add_message_revision(message_id, chat_id, user_id, diff):
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO message_revisions (user_id, message_id, chat_id, revision, diff)
+        VALUES (?, ?, ?, (SELECT COALESCE(MAX(revision), 0) + 1 FROM message_revisions WHERE user_id = ? AND message_id = ? AND chat_id = ?), ?)
+    """, (user_id, message_id, chat_id, user_id, message_id, chat_id, diff))
+    cursor.execute("SELECT MAX(revision) FROM message_revisions WHERE user_id = ? AND message_id = ? AND chat_id = ?", (user_id, message_id, chat_id))
+    revision = cursor.fetchone()[0]
+    conn.commit()
+    conn.close()
+    return revision
+
+def get_message_revisions(message_id, chat_id, user_id):
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("SELECT revision, diff, edited_at FROM message_revisions WHERE user_id = ? AND message_id = ? AND chat_id = ? ORDER BY revision", (user_id, message_id, chat_id))
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+def get_revisions_for_check(user_id):
+    """Diffs of the messages returned by get_messages_for_check: {(message_id, chat_id): [diff, ...]}"""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT r.message_id, r.chat_id, r.diff FROM message_revisions r
+        JOIN (SELECT message_id, chat_id FROM cached_messages WHERE user_id = ? ORDER BY timestamp DESC LIMIT 100) c
+        ON r.message_id = c.message_id AND r.chat_id = c.chat_id
+        WHERE r.user_id = ?
+        ORDER BY r.revision
+    """, (user_id, user_id))
+    chains = {}
+    for mid, cid, diff in cursor.fetchall():
+        chains.setdefault((mid, cid), []).append(diff)
+    conn.close()
+    return chains
+
+def get_original_message(message_id, chat_id, user_id):
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("SELECT content, sender_name, chat_title, timestamp FROM cached_messages WHERE message_id = ? AND chat_id = ? AND user_id = ?", (message_id, chat_id, user_id))
+    row = cursor.fetchone()
+    conn.close()
+    return row
 
 # Settings & Exclusions
 def init_settings(conn):
@@ -481,6 +1093,17 @@ def init_settings(conn):
             PRIMARY KEY (user_id, chat_id)
         )
     """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS chat_policies (
+            user_id INTEGER,
+            chat_id INTEGER,
+            title TEXT,
+            policy TEXT,
+            auto BOOLEAN DEFAULT 1,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, chat_id)
+        )
+    """)
     conn.commit()
 
 def set_track_groups(user_id: int, enabled: bool):
@@ -522,3 +1145,257 @@ def get_excluded_chats(user_id: int):
     rows = cursor.fetchall()
     conn.close()
     return rows
+
+# Caching policies for noisy chats
+def get_chat_policies(user_id: int):
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("SELECT chat_id, policy, auto, title FROM chat_policies WHERE user_id = ?", (user_id,))
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+def set_chat_policy(user_id: int, chat_id: int, policy: str, auto: bool = True, title: str = None):
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("INSERT OR REPLACE INTO chat_policies (user_id, chat_id, title, policy, auto) VALUES (?, ?, ?, ?, ?)",
+                   (user_id, chat_id, title, policy, 1 if auto else 0))
+    conn.commit()
+    conn.close()
+
+def delete_chat_policy(user_id: int, chat_id: int):
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM chat_policies WHERE user_id = ? AND chat_id = ?", (user_id, chat_id))
+    conn.commit()
+    conn.close()
+
+# Activity Counters
+STATS_ADD = "cached = cached + excluded.cached, deleted = deleted + excluded.deleted, edited = edited + excluded.edited"
+
+def add_chat_stats(rows):
+    """rows: [(user_id, chat_id, day, cached, deleted, edited, title), ...] - deltas, not totals"""
+    users_daily, users_total, global_daily = {}, {}, {}
+    for uid, cid, day, c, d, e, _ in rows:
+        for bucket, key in ((users_daily, (uid, day)), (users_total, uid), (global_daily, day)):
+            acc = bucket.setdefault(key, [0, 0, 0])
+            acc[0] += c; acc[1] += d; acc[2] += e
+
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.executemany(f"""
+        INSERT INTO chat_stats_daily (user_id, chat_id, day, cached, deleted, edited) VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(user_id, chat_id, day) DO UPDATE SET {STATS_ADD}
+    """, [r[:6] for r in rows])
+    cursor.executemany(f"""
+        INSERT INTO chat_stats_total (user_id, chat_id, title, cached, deleted, edited) VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(user_id, chat_id) DO UPDATE SET {STATS_ADD}, title = COALESCE(excluded.title, title)
+    """, [(uid, cid, title, c, d, e) for uid, cid, _, c, d, e, title in rows])
+    cursor.executemany(f"""
+        INSERT INTO user_stats_daily (user_id, day, cached, deleted, edited) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(user_id, day) DO UPDATE SET {STATS_ADD}
+    """, [(uid, day, *v) for (uid, day), v in users_daily.items()])
+    cursor.executemany(f"""
+        INSERT INTO user_stats_total (user_id, cached, deleted, edited) VALUES (?, ?, ?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET {STATS_ADD}
+    """, [(uid, *v) for uid, v in users_total.items()])
+    cursor.executemany(f"""
+        INSERT INTO global_stats_daily (day, cached, deleted, edited) VALUES (?, ?, ?, ?)
+        ON CONFLICT(day) DO UPDATE SET {STATS_ADD}
+    """, [(day, *v) for day, v in global_daily.items()])
+    conn.commit()
+    conn.close()
+
+def get_user_activity(user_id: int, since_day: str):
+    """Per-day totals for one user since `since_day` (at most a week of rows)."""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("SELECT day, cached, deleted, edited FROM user_stats_daily WHERE user_id = ? AND day >= ? ORDER BY day", (user_id, since_day))
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+def get_top_chats(user_id: int, limit: int = 5):
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("SELECT chat_id, title, cached, deleted, edited FROM chat_stats_total WHERE user_id = ? ORDER BY cached DESC LIMIT ?", (user_id, limit))
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+def get_global_activity(since_day: str):
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("SELECT day, cached, deleted, edited FROM global_stats_daily WHERE day >= ? ORDER BY day", (since_day,))
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+def get_top_users_by_activity(limit: int = 5):
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("SELECT user_id, cached, deleted, edited FROM user_stats_total ORDER BY cached DESC LIMIT ?", (limit,))
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+# AI Usage
+def add_ai_usage(rows):
+    """rows: [(user_id, day, feature, provider, requests, prompt_tokens, completion_tokens), ...] - deltas"""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.executemany("""
+        INSERT INTO ai_usage (user_id, day, feature, provider, requests, prompt_tokens, completion_tokens)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(user_id, day, feature, provider) DO UPDATE SET
+            requests = requests + excluded.requests,
+            prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+            completion_tokens = completion_tokens + excluded.completion_tokens
+    """, rows)
+    conn.commit()
+    conn.close()
+
+def get_user_tokens(user_id: int, day: str):
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("SELECT COALESCE(SUM(prompt_tokens + completion_tokens), 0) FROM ai_usage WHERE user_id = ? AND day = ?", (user_id, day))
+    total = cursor.fetchone()[0]
+    conn.close()
+    return total
+
+def get_ai_usage_breakdown(since_day: str):
+    """[(feature, provider, requests, prompt_tokens, completion_tokens), ...] since `since_day`"""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT feature, provider, SUM(requests), SUM(prompt_tokens), SUM(completion_tokens)
+        FROM ai_usage WHERE day >= ? GROUP BY feature, provider
+        ORDER BY SUM(prompt_tokens + completion_tokens) DESC
+    """, (since_day,))
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+def get_top_ai_users(since_day: str, limit: int = 5):
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT user_id, SUM(requests), SUM(prompt_tokens + completion_tokens) AS tokens
+        FROM ai_usage WHERE day >= ? GROUP BY user_id ORDER BY tokens DESC LIMIT ?
+    """, (since_day, limit))
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+# AI Response Cache
+def get_ai_cache(key: str):
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("SELECT response, provider, created_at FROM ai_cache WHERE key = ?", (key,))
+    row = cursor.fetchone()
+    conn.close()
+    return row
+
+def save_ai_cache(key: str, provider: str, response: str, created_at: float):
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("INSERT OR REPLACE INTO ai_cache (key, provider, response, created_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                   (key, provider, response, created_at, created_at))
+    conn.commit()
+    conn.close()
+
+def touch_ai_cache(keys):
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.executemany("UPDATE ai_cache SET last_used = strftime('%s', 'now') WHERE key = ?", [(key,) for key in keys])
+    conn.commit()
+    conn.close()
+
+def prune_ai_cache(expired_before: float, max_rows: int):
+    """Drop expired answers, then the least recently used ones beyond max_rows."""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM ai_cache WHERE created_at < ?", (expired_before,))
+    cursor.execute("DELETE FROM ai_cache WHERE key IN (SELECT key FROM ai_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (max_rows,))
+    conn.commit()
+    conn.close()
+
+# Article Cache
+def get_article_cache(url: str):
+    """(etag, last_modified, title, text, checked_at) or None"""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("SELECT etag, last_modified, title, text, checked_at FROM article_cache WHERE url = ?", (url,))
+    row = cursor.fetchone()
+    conn.close()
+    return row
+
+def save_article_cache(url: str, etag: str, last_modified: str, title: str, text: str):
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    now = time.time()
+    cursor.execute(
+        "INSERT OR REPLACE INTO article_cache (url, etag, last_modified, title, text, fetched_at, checked_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (url, etag, last_modified, title, text, now, now)
+    )
+    conn.commit()
+    conn.close()
+
+def touch_article_cache(url: str):
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("UPDATE article_cache SET checked_at = ? WHERE url = ?", (time.time(), url))
+    conn.commit()
+    conn.close()
+
+def prune_article_cache(max_rows: int):
+    """Keep the max_rows most recently used articles."""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM article_cache WHERE url IN (SELECT url FROM article_cache ORDER BY checked_at DESC LIMIT -1 OFFSET ?)", (max_rows,))
+    conn.commit()
+    conn.close()
+
+# Conversation Memory
+def add_ai_turns(user_id: int, turns):
+    """turns: [(role, content), ...]"""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.executemany("INSERT INTO ai_turns (user_id, role, content) VALUES (?, ?, ?)",
+                       [(user_id, role, content) for role, content in turns])
+    conn.commit()
+    conn.close()
+
+def get_ai_turns(user_id: int, limit: int):
+    """Newest first: [(id, role, content), ...]"""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("SELECT id, role, content FROM ai_turns WHERE user_id = ? ORDER BY id DESC LIMIT ?", (user_id, limit))
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+def get_ai_summary(user_id: int):
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("SELECT summary FROM ai_memory WHERE user_id = ?", (user_id,))
+    row = cursor.fetchone()
+    conn.close()
+    return row[0] if row else ""
+
+def compact_ai_turns(user_id: int, summary: str, up_to_id: int):
+    """Replace the summary and drop the turns it now covers."""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("INSERT OR REPLACE INTO ai_memory (user_id, summary, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)", (user_id, summary))
+    cursor.execute("DELETE FROM ai_turns WHERE user_id = ? AND id <= ?", (user_id, up_to_id))
+    conn.commit()
+    conn.close()
+
+def clear_ai_memory(user_id: int):
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM ai_turns WHERE user_id = ?", (user_id,))
+    cursor.execute("DELETE FROM ai_memory WHERE user_id = ?", (user_id,))
+    conn.commit()
+    conn.close()
@@ -0,0 +1,206 @@
+"""Local stand-in for the mail.tm and 1secmail APIs, for trying the temp-mail flow offline.
+
+    python fake_mail_api.py --port 8902 --auto-mail 30 --token-ttl 120
+
+Point the bot at it with MAIL_TM_URL=http://127.0.0.1:8902 and
+ONESECMAIL_URL=http://127.0.0.1:8902/api/v1/. Drop a letter into any inbox with
+
+    curl -X POST http://127.0.0.1:8902/deliver -d '{"address": "...", "subject": "Hi", "text": "Code: 1234"}'
+"""
+import argparse
+import asyncio
+import base64
+import json
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+
+from aiohttp import web
+
+DOMAIN = "fakemail.test"
+
+
+@dataclass
+class FakeMailStats:
+    accounts: int = 0
+    logins: int = 0
+    lists: int = 0
+    reads: int = 0
+    unauthorized: int = 0
+    delivered: int = 0
+    started: float = field(default_factory=time.monotonic)
+
+
+def make_token(address: str, ttl: float) -> str:
+    """Unsigned JWT-shaped token with an `exp` claim, like mail.tm's."""
+    def part(data):
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip("=")
+    return f"{part({'alg': 'none'})}.{part({'username': address, 'exp': int(time.time() + ttl)})}.fake"
+
+
+class FakeMailApi:
+    def __init__(self, token_ttl: float = 600):
+        self.token_ttl = token_ttl
+        self.passwords = {} # address -> mail.tm password (None for 1secmail inboxes)
+        self.inboxes = {} # address -> [message dict, newest first]
+        self.tokens = {} # token -> (address, expires_at)
+        self.next_id = 1
+        self.stats = FakeMailStats()
+        self.runner = None
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        # mail.tm
+        app.router.add_get("/domains", self.domains)
+        app.router.add_post("/accounts", self.accounts)
+        app.router.add_post("/token", self.token)
+        app.router.add_get("/messages", self.list_messages)
+        app.router.add_get("/messages/{id}", self.read_message)
+        # 1secmail
+        app.router.add_get("/api/v1/", self.onesecmail)
+        # control
+        app.router.add_post("/deliver", self.deliver_request)
+        app.router.add_get("/stats", self.get_stats)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        """Run in the current event loop. Returns the bound port (port=0 picks a free one)."""
+        self.runner = web.AppRunner(self.app())
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        return self.runner.addresses[0][1]
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+
+    def deliver(self, address: str, sender: str = "robot@example.com", subject: str = "Тестовое письмо",
+                text: str = "Ваш код подтверждения: 123456", html: str = None) -> int:
+        message_id = self.next_id
+        self.next_id += 1
+        self.inboxes.setdefault(address, []).insert(0, {
+            "id": message_id, "from": sender, "subject": subject, "text": text,
+            "html": html or f"<p>{text}</p>", "date": datetime.now(timezone.utc),
+        })
+        self.stats.delivered += 1
+        return message_id
+
+    def authorized(self, request: web.Request):
+        token = request.headers.get("Authorization", "").removeprefix("Bearer ")
+        entry = self.tokens.get(token)
+        if entry is None or entry[1] < time.time():
+            self.stats.unauthorized += 1
+            raise web.HTTPUnauthorized(text=json.dumps({"code": 401, "message": "Expired JWT Token"}),
+                                       content_type="application/json")
+        return entry[0]
+
+    # mail.tm
+
+    async def domains(self, request: web.Request):
+        return web.json_response({"hydra:member": [{"domain": DOMAIN, "isActive": True}]})
+
+    async def accounts(self, request: web.Request):
+        data = await request.json()
+        address = data.get("address", "")
+        if not address.endswith("@" + DOMAIN) or address in self.passwords:
+            return web.json_response({"detail": "address is not valid or already used"}, status=422)
+        self.passwords[address] = data.get("password")
+        self.inboxes.setdefault(address, [])
+        self.stats.accounts += 1
+        return web.json_response({"id": address, "address": address}, status=201)
+
+    async def token(self, request: web.Request):
+        data = await request.json()
+        address = data.get("address")
+        if address not in self.passwords or self.passwords[address] != data.get("password"):
+            return web.json_response({"code": 401, "message": "Invalid credentials."}, status=401)
+        token = make_token(address, self.token_ttl)
+        self.tokens[token] = (address, time.time() + self.token_ttl)
+        self.stats.logins += 1
+        return web.json_response({"id": address, "token": token})
+
+    async def list_messages(self, request: web.Request):
+        address = self.authorized(request)
+        self.stats.lists += 1
+        return web.json_response({"hydra:member": [
+            {
+                "id": str(m["id"]), "from": {"address": m["from"], "name": ""}, "subject": m["subject"],
+                "intro": m["text"][:100], "createdAt": m["date"].isoformat(),
+            }
+            for m in self.inboxes.get(address, [])
+        ]})
+
+    async def read_message(self, request: web.Request):
+        address = self.authorized(request)
+        self.stats.reads += 1
+        for m in self.inboxes.get(address, []):
+            if str(m["id"]) == request.match_info["id"]:
+                return web.json_response({"id": str(m["id"]), "text": m["text"], "html": [m["html"]]})
+        raise web.HTTPNotFound()
+
+    # 1secmail
+
+    async def onesecmail(self, request: web.Request):
+        action = request.query.get("action")
+        if action == "getDomainList":
+            return web.json_response([DOMAIN])
+        address = f"{request.query.get('login')}@{request.query.get('domain')}"
+        if action == "getMessages":
+            self.stats.lists += 1
+            return web.json_response([
+                {"id": m["id"], "from": m["from"], "subject": m["subject"], "date": m["date"].strftime("%Y-%m-%d %H:%M:%S")}
+                for m in self.inboxes.get(address, [])
+            ])
+        if action == "readMessage":
+            self.stats.reads += 1
+            for m in self.inboxes.get(address, []):
+                if str(m["id"]) == request.query.get("id"):
+                    return web.json_response({"id": m["id"], "textBody": m["text"], "htmlBody": m["html"]})
+            return web.Response(text="Message not found")
+        return web.Response(status=400, text="Wrong action")
+
+    # control
+
+    async def deliver_request(self, request: web.Request):
+        data = await request.json()
+        kwargs = {k: data[k] for k in ("sender", "subject", "text", "html") if k in data}
+        return web.json_response({"id": self.deliver(data["address"], **kwargs)})
+
+    async def get_stats(self, request: web.Request):
+        data = dict(self.stats.__dict__)
+        data["uptime"] = time.monotonic() - data.pop("started")
+        data["inboxes"] = {address: len(messages) for address, messages in self.inboxes.items()}
+        return web.json_response(data)
+
+
+async def auto_mail(api: FakeMailApi, every: float):
+    """Drop a numbered letter into every known inbox every `every` seconds."""
+    n = 0
+    while True:
+        await asyncio.sleep(every)
+        n += 1
+        for address in list(api.inboxes):
+            api.deliver(address, subject=f"Письмо #{n}", text=f"Код подтверждения: {100000 + n}")
+
+
+async def serve(args):
+    api = FakeMailApi(args.token_ttl)
+    port = await api.start(args.host, args.port)
+    print(f"Fake mail API on http://{args.host}:{port} (mail.tm: /, 1secmail: /api/v1/)")
+    if args.auto_mail:
+        await auto_mail(api, args.auto_mail)
+    else:
+        await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake mail.tm / 1secmail API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8902)
+    parser.add_argument("--token-ttl", type=float, default=600, help="lifetime of mail.tm tokens, seconds")
+    parser.add_argument("--auto-mail", type=float, default=0, help="deliver a letter to every inbox this often, seconds")
+    try:
+        asyncio.run(serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
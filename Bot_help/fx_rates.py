@@ -0,0 +1,141 @@
+import logging
+import re
+import time
+from datetime import datetime
+
+import config
+import database
+
+# Spellings users type after the amount -> ISO code. In an expense line only these, the codes
+# of SYMBOLS and uppercase ISO codes count as a currency, so "100 top ..." stays a category
+ALIASES = {
+    "₽": "RUB", "р": "RUB", "руб": "RUB", "рубль": "RUB", "рублей": "RUB", "рубля": "RUB",
+    "$": "USD", "долл": "USD", "доллар": "USD", "долларов": "USD", "доллара": "USD", "бакс": "USD", "баксов": "USD",
+    "€": "EUR", "евро": "EUR",
+    "£": "GBP", "фунт": "GBP", "фунтов": "GBP",
+    "¥": "CNY", "юань": "CNY", "юаней": "CNY",
+    "₸": "KZT", "тенге": "KZT",
+    "₴": "UAH", "грн": "UAH", "гривен": "UAH",
+    "₺": "TRY", "лир": "TRY", "лира": "TRY",
+    "₾": "GEL", "лари": "GEL",
+    "֏": "AMD", "драм": "AMD",
+}
+SYMBOLS = {"RUB": "₽", "USD": "$", "EUR": "€", "GBP": "£", "CNY": "¥", "KZT": "₸", "UAH": "₴", "TRY": "₺", "GEL": "₾", "AMD": "֏"}
+# ISO 4217 currencies without a minor unit
+NO_MINOR_UNIT = {"JPY", "KRW", "VND", "CLP", "ISK", "PYG", "UGX", "XAF", "XOF", "XPF", "KMF", "GNF", "RWF", "DJF", "BIF", "VUV"}
+
+EXPENSE_RE = re.compile(r"^(\d+(?:[.,]\d+)?)\s*([$€£¥₽₸₴₺₾֏])?\s+(.+)$", re.DOTALL)
+
+
+def format_money(amount: float, currency: str) -> str:
+    """Two decimals, none for whole amounts or currencies without a minor unit: 500₽, 12.50$."""
+    whole = currency in NO_MINOR_UNIT or float(round(amount, 2)).is_integer()
+    number = f"{amount:.0f}" if whole else f"{amount:.2f}"
+    symbol = SYMBOLS.get(currency)
+    return f"{number}{symbol}" if symbol else f"{number} {currency}"
+
+
+class FxRates:
+    """Exchange rates against USD, kept in memory and in the fx_rates table.
+    refresh() runs on a schedule; lookups never touch the network."""
+
+    def __init__(self, http):
+        self.http = http
+        self.rates = {} # ISO code -> units per 1 USD
+        self.updated_at = None # when the provider published the rates (epoch)
+        self.fetched_at = None
+        self.refreshes = 0
+        self.failures = 0
+        self.last_error = None
+
+    def load(self):
+        """Restore the last saved rates so conversions work before the first refresh."""
+        self.rates, self.updated_at = database.get_fx_rates()
+
+    async def refresh(self):
+        try:
+            r = await self.http.get(config.FX_API_URL)
+            data = r.json()
+            if r.status_code != 200 or data.get("result") == "error" or not data.get("rates"):
+                raise ValueError(data.get("error-type") or f"HTTP {r.status_code}")
+        except Exception as e:
+            self.failures += 1
+            self.last_error = str(e)
+            logging.warning(f"FX refresh failed, keeping rates from {self.published()}: {e}")
+            return False
+
+        rates = {code.upper(): float(rate) for code, rate in data["rates"].items() if rate}
+        updated_at = int(data.get("time_last_update_unix") or time.time())
+        database.save_fx_rates(rates, updated_at)
+        self.rates, self.updated_at = rates, updated_at
+        self.fetched_at = time.time()
+        self.refreshes += 1
+        self.last_error = None
+        return True
+
+    def age(self):
+        return None if self.updated_at is None else time.time() - self.updated_at
+
+    @property
+    def stale(self) -> bool:
+        age = self.age()
+        return age is None or age > config.FX_STALE_HOURS * 3600
+
+    def published(self) -> str:
+        return "никогда" if self.updated_at is None else f"{datetime.fromtimestamp(self.updated_at):%d.%m %H:%M}"
+
+    def currency(self, token: str):
+        """'руб', '$', 'usd' -> ISO code, or None if it isn't a currency we have a rate for."""
+        token = token.strip().lower().rstrip(".")
+        code = ALIASES.get(token) or token.upper()
+        return code if code in self.rates or code in SYMBOLS else None
+
+    def expense_currency(self, token: str):
+        """Stricter currency() for the word after an amount: an alias, a SYMBOLS code in any
+        case, or another ISO code only when typed in uppercase ("100 top" is a category)."""
+        word = token.strip().rstrip(".")
+        code = ALIASES.get(word.lower())
+        if code is None and (word.upper() in SYMBOLS or (word.isupper() and len(word) == 3)):
+            code = word.upper()
+        return code if code in self.rates or code in SYMBOLS else None
+
+    def convert(self, amount: float, source: str, target: str):
+        """None when either currency has no rate yet."""
+        if source == target:
+            return amount
+        if source not in self.rates or target not in self.rates:
+            return None
+        return amount / self.rates[source] * self.rates[target]
+
+    def parse_expense(self, text: str):
+        """'500 обед', '12.5 $ кофе', '20 eur такси' -> (amount, currency | None, category), or None."""
+        match = EXPENSE_RE.match(text.strip())
+        if not match:
+            return None
+        amount = float(match.group(1).replace(",", "."))
+        currency = ALIASES.get(match.group(2)) if match.group(2) else None
+        category = match.group(3).strip()
+        if currency is None:
+            first, _, rest = category.partition(" ")
+            code = self.expense_currency(first)
+            if code and rest.strip():
+                currency, category = code, rest.strip()
+        return amount, currency, category
+
+    def usd_rub(self) -> str:
+        if "RUB" not in self.rates:
+            return "нет данных"
+        text = f"{self.rates['RUB']:.2f} руб."
+        if self.stale:
+            text += f" (курс от {self.published()})"
+        return text
+
+    def report(self) -> str:
+        age = self.age()
+        age_text = "нет данных" if age is None else f"{age / 3600:.1f} ч"
+        state = "устарели" if self.stale else "актуальны"
+        error = f", последняя ошибка: {self.last_error}" if self.last_error else ""
+        return (
+            f"💱 Курсы валют: {len(self.rates)} валют, {state} (возраст {age_text}, от {self.published()}), "
+            f"обновлений {self.refreshes}, сбоев {self.failures}{error}"
+        )
@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import random
+import time
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+
+import httpx
+
+import config
+from resilience import CircuitBreaker, LatencyWindow
+
+try:
+    import h2 # noqa: F401 - httpx needs it for HTTP/2
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+IDEMPOTENT = {"GET", "HEAD", "OPTIONS"}
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+
+
+class HostUnavailable(Exception):
+    """The host's circuit breaker is open; the request was not sent."""
+
+    def __init__(self, host: str, retry_in: float):
+        super().__init__(f"{host} is unavailable, retry in {retry_in:.0f}s")
+        self.host = host
+        self.retry_in = retry_in
+
+
+class HostState:
+    def __init__(self):
+        self.semaphore = asyncio.Semaphore(config.HTTP_PER_HOST)
+        self.breaker = CircuitBreaker(failures=config.HTTP_BREAKER_FAILURES, cooldown=config.HTTP_BREAKER_COOLDOWN)
+        self.latency = LatencyWindow(100)
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.rejected = 0
+        # Retries are earned by requests, so a struggling host can't be hammered by a retry storm
+        self.retry_tokens = float(config.HTTP_RETRY_BURST)
+
+
+class HttpClient:
+    """One pooled keep-alive client for all outbound HTTP, with per-host
+    concurrency caps, budgeted jittered retries, circuit breakers and latency stats."""
+
+    def __init__(self):
+        self._client = None
+        self.hosts = {}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                http2=config.HTTP2 and HTTP2_AVAILABLE,
+                limits=httpx.Limits(
+                    max_connections=config.HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=config.HTTP_MAX_KEEPALIVE,
+                    keepalive_expiry=30,
+                ),
+                timeout=httpx.Timeout(config.HTTP_TIMEOUT, connect=5.0),
+                headers={"User-Agent": USER_AGENT},
+                follow_redirects=True,
+            )
+        return self._client
+
+    def host(self, url: str) -> HostState:
+        name = urlsplit(str(url)).hostname or "?"
+        state = self.hosts.get(name)
+        if state is None:
+            state = self.hosts[name] = HostState()
+        return state
+
+    async def request(self, method: str, url: str, retries: int = None, **kwargs) -> httpx.Response:
+        """Send a request. 5xx/429 responses are returned to the caller after retries run out;
+        transport errors are raised. Only idempotent methods are retried unless `retries` is given."""
+        method = method.upper()
+        if retries is None:
+            retries = config.HTTP_RETRIES if method in IDEMPOTENT else 0
+        state = self.host(url)
+        state.requests += 1
+        state.retry_tokens = min(config.HTTP_RETRY_BURST, state.retry_tokens + config.HTTP_RETRY_RATIO)
+
+        attempt = 0
+        while True:
+            if not state.breaker.allow():
+                state.rejected += 1
+                raise HostUnavailable(urlsplit(str(url)).hostname, state.breaker.retry_in())
+
+            delay = None
+            started = time.monotonic()
+            try:
+                async with state.semaphore:
+                    response = await self.client.request(method, url, **kwargs)
+            except (httpx.TransportError, asyncio.TimeoutError) as e:
+                state.errors += 1
+                state.breaker.record_failure()
+                if not self._retry(state, attempt, retries):
+                    raise
+                logging.warning(f"HTTP {method} {url} failed ({type(e).__name__}), retrying")
+            else:
+                state.latency.add(time.monotonic() - started)
+                if response.status_code < 500 and response.status_code != 429:
+                    state.breaker.record_success()
+                    return response
+                state.errors += 1
+                if response.status_code >= 500:
+                    state.breaker.record_failure()
+                else:
+                    state.breaker.release() # Rate limited, but the host is alive
+                if not self._retry(state, attempt, retries):
+                    return response
+                delay = self._retry_after(response)
+
+            attempt += 1
+            # Exponential backoff with full jitter
+            await asyncio.sleep(delay if delay is not None else random.uniform(0, config.HTTP_BACKOFF * 2 ** attempt))
+
+    def _retry(self, state: HostState, attempt: int, retries: int) -> bool:
+        if attempt >= retries or state.retry_tokens < 1:
+            return False
+        state.retry_tokens -= 1
+        state.retries += 1
+        return True
+
+    @staticmethod
+    def _retry_after(response: httpx.Response):
+        value = response.headers.get("Retry-After")
+        if value and value.isdigit():
+            return min(float(value), config.HTTP_MAX_RETRY_AFTER)
+        return None
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, **kwargs):
+        """Like request(), but yields the response with the body unread (use response.aiter_bytes()),
+        so callers can cap how much they download. Not retried; the host slot is held until the block exits."""
+        state = self.host(url)
+        state.requests += 1
+        if not state.breaker.allow():
+            state.rejected += 1
+            raise HostUnavailable(urlsplit(str(url)).hostname, state.breaker.retry_in())
+
+        started = time.monotonic()
+        async with state.semaphore:
+            try:
+                async with self.client.stream(method.upper(), url, **kwargs) as response:
+                    state.latency.add(time.monotonic() - started) # Time to headers
+                    if response.status_code >= 500:
+                        state.errors += 1
+                        state.breaker.record_failure()
+                    else:
+                        state.breaker.record_success()
+                    yield response
+            except (httpx.TransportError, asyncio.TimeoutError):
+                state.errors += 1
+                state.breaker.record_failure()
+                raise
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def report(self) -> str:
+        if not self.hosts:
+            return "🌐 HTTP: запросов ещё не было."
+        lines = [f"🌐 HTTP ({'HTTP/2' if config.HTTP2 and HTTP2_AVAILABLE else 'HTTP/1.1'}, keep-alive):"]
+        for name, s in sorted(self.hosts.items(), key=lambda item: -item[1].requests):
+            p50 = s.latency.percentile(50)
+            p95 = s.latency.percentile(95)
+            timing = f"p50 {p50 * 1000:.0f}ms / p95 {p95 * 1000:.0f}ms" if p50 is not None else "нет данных"
+            lines.append(
+                f"• {name}: {s.requests} запр., ошибки {s.errors}, повторы {s.retries}, "
+                f"отклонено {s.rejected}, {timing}, {s.breaker.state}"
+            )
+        return "\n".join(lines)
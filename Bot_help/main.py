@@ -2,20 +2,18 @@ import asyncio
 import logging
 import re
 import os
-import httpx
+import time
+import html
 import json
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from aiogram import Bot, Dispatcher, types, F, BaseMiddleware
 from aiogram.filters import Command, CommandObject, ChatMemberUpdatedFilter, JOIN_TRANSITION, StateFilter
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, FSInputFile, ReplyKeyboardMarkup, KeyboardButton, ChatMemberUpdated, WebAppInfo
-from openai import OpenAI
-from groq import Groq
-from gigachat import GigaChat
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 import yt_dlp
-from bs4 import BeautifulSoup
 from pypdf import PdfReader
 import speech_recognition as sr
 
@@ -34,6 +32,26 @@ from pyrogram.types import Message as PyMessage
 
 import config
 import database
+import ai_providers
+import ai_usage
+from ai_router import AIRouter, is_acceptable
+from ai_cache import ResponseCache
+from conversation import ConversationMemory
+from message_index import MessageIndex, MessageRecord
+import text_diff
+import note_search
+import summarizer
+import articles
+import weather
+import temp_mail
+import fx_rates
+import morning_brief
+import timezones
+import reminders
+import chat_throttle
+from chat_throttle import ChatThrottle
+from chat_stats import ActivityCounters
+from http_client import HttpClient
 
 # Extract Bot ID for filtering loopback messages
 try:
@@ -57,46 +75,147 @@ userbot = Client(
     device_model="Antigravity Logger"
 ) if config.API_ID and config.API_HASH else None
 
-# Initialize AI Clients
-ai_client = GigaChat(credentials=config.GIGACHAT_CREDENTIALS, verify_ssl_certs=False)
-
-openai_client = OpenAI(api_key=config.OPENAI_API_KEY) if config.OPENAI_API_KEY else None
-groq_client = Groq(api_key=config.GROQ_API_KEY) if config.GROQ_API_KEY else None
-
-async def get_ai_response(prompt: str):
+# Initialize AI Clients (async, with per-provider limits and timeouts)
+ai_backends = ai_providers.build_providers()
+ai_router = AIRouter(ai_backends)
+AI_BUSY_TEXT = "Прости, мои ИИ-мозги временно перегружены. Попробуй позже!"
+AI_QUOTA_TEXT = "⏳ Дневной лимит запросов к ИИ исчерпан. Возвращайся завтра!"
+# Estimated token spend per user/feature/provider, with daily quotas
+usage = ai_usage.UsageMeter()
+ai_cache = ResponseCache(config.AI_CACHE_TTL, config.AI_CACHE_MEMORY, config.AI_CACHE_MAX_ROWS)
+
+# Hot index of recent UserBot messages, looked up before SQLite
+recent_messages = MessageIndex(config.MESSAGE_INDEX_MAX_RECORDS, config.MESSAGE_INDEX_MAX_KB * 1024)
+# Per-chat volume tracking and caching policies for noisy groups
+chat_policies = ChatThrottle()
+# Per (user, chat, day) counters, flushed to SQLite periodically
+activity = ActivityCounters()
+# Shared keep-alive HTTP client for weather, currency, mail and articles
+http = HttpClient()
+weather_cache = weather.WeatherCache(http, config.WEATHER_API_KEY)
+fx = fx_rates.FxRates(http)
+mailboxes = temp_mail.TempMail(http)
+mail_watcher = temp_mail.MailWatcher(mailboxes)
+# One pacer for every broadcast (briefs, reminders, mail): Telegram's limit is per bot
+sender = morning_brief.RateLimitedSender(bot)
+last_brief_report = None
+habit_tick_lock = asyncio.Lock()
+reminder_tick_lock = asyncio.Lock()
+
+def ai_budget(user_id: int, size: int) -> int:
+    """Context size for a prompt part: halved once the user is over the soft daily quota."""
+    return size // 2 if usage.level(user_id) == ai_usage.ECONOMY else size
+
+def ai_preference(user_id: int):
+    return config.AI_CHEAP_PROVIDER if usage.level(user_id) == ai_usage.ECONOMY else None
+
+async def get_ai_response(prompt: str, user_id: int = None, feature: str = "chat"):
     """Universal function to get AI response with fallbacks."""
-    # 1. Try GigaChat (Default)
+    if usage.level(user_id) == ai_usage.BLOCKED:
+        return AI_QUOTA_TEXT
+    prefer = ai_preference(user_id)
+
+    # Identical prompts are answered from the cache or share one in-flight request.
+    # The router picks the fastest healthy provider and falls back down its ranking.
+    content, provider, source = await ai_cache.get_or_compute(
+        prompt, lambda: ai_router.complete(prompt, user_id, prefer), scope=prefer or "auto"
+    )
+    usage.record(user_id, feature, provider if source == "miss" else "cache", prompt, content)
+    if content:
+        return content
+
+    return AI_BUSY_TEXT
+
+async def summarize_conversation(prompt: str, user_id: int):
+    # Straight to the router: a failed summary must not be cached or stored as memory
+    content, provider = await ai_router.complete(prompt, user_id, ai_preference(user_id))
+    usage.record(user_id, "memory", provider, prompt, content)
+    return content
+
+conversations = ConversationMemory(summarize_conversation)
+
+async def answer_streaming(message: types.Message, prompt: str, user_id: int = None, feature: str = "chat"):
+    """Send a placeholder and edit it as the answer streams in.
+    Falls back to a regular answer when no provider can stream. Returns the final text."""
+    if usage.level(user_id) == ai_usage.BLOCKED:
+        await message.answer(AI_QUOTA_TEXT)
+        return AI_QUOTA_TEXT
+    if not config.AI_STREAMING:
+        text = await get_ai_response(prompt, user_id, feature)
+        await send_ai_text(message, text)
+        return text
+
+    prefer = ai_preference(user_id)
+    found = await ai_cache.cached(prompt, prefer or "auto")
+    if found:
+        usage.record(user_id, feature, "cache", prompt, found[0])
+        text = found[0] or AI_BUSY_TEXT
+        await send_ai_text(message, text)
+        return text
+
+    # Identical prompts arriving meanwhile wait for this stream instead of starting their own
+    cache_key = ai_cache.begin(prompt, prefer or "auto")
+    content = provider = None
     try:
-        response = ai_client.chat(prompt)
-        content = response.choices[0].message.content
-        if "Как и любая языковая модель" not in content and len(content) > 50:
-            return content
-    except Exception as e:
-        logging.error(f"GigaChat Error: {e}")
-
-    # 2. Try Groq (Llama 3) - Fast and reliable
-    if groq_client:
-        try:
-            response = groq_client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
-                messages=[{"role": "user", "content": prompt}],
-            )
-            return response.choices[0].message.content
-        except Exception as e:
-            logging.error(f"Groq Error: {e}")
-
-    # 3. Try OpenAI (GPT-4o-mini)
-    if openai_client:
-        try:
-            response = openai_client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": prompt}],
-            )
-            return response.choices[0].message.content
-        except Exception as e:
-            logging.error(f"OpenAI Error: {e}")
-
-    return "Прости, мои ИИ-мозги временно перегружены. Попробуй позже!"
+        placeholder = await message.answer("✍️ …")
+        text = ""
+        shown = ""
+        meta = {}
+        next_edit = time.monotonic() + config.AI_STREAM_EDIT_INTERVAL
+        async for chunk in ai_router.stream(prompt, meta, prefer):
+            text += chunk
+            # Throttle edits to stay under Telegram's per-chat edit limits
+            if time.monotonic() >= next_edit and len(text) - len(shown) >= 20 and len(text) < 4000:
+                try:
+                    await placeholder.edit_text(text + " ▌")
+                    shown = text
+                except TelegramRetryAfter as e:
+                    next_edit = time.monotonic() + e.retry_after
+                    continue
+                except TelegramBadRequest:
+                    pass
+                next_edit = time.monotonic() + config.AI_STREAM_EDIT_INTERVAL
+
+        content, provider = text, meta.get("provider")
+        if not is_acceptable(content, provider):
+            content, provider = await ai_router.complete(prompt, user_id, prefer)
+    finally:
+        ai_cache.finish(cache_key, content, provider)
+
+    # Only the delivered answer is metered, not a discarded stream
+    usage.record(user_id, feature, provider, prompt, content)
+    text = content or AI_BUSY_TEXT
+    await send_ai_text(message, text, placeholder)
+    return text
+
+async def send_ai_text(message: types.Message, text: str, placeholder: types.Message = None):
+    """Send (or finalize the placeholder with) an AI answer: Markdown if it parses, plain text otherwise."""
+    parts = [text[i:i + 4096] for i in range(0, len(text), 4096)] or ["…"]
+    for n, part in enumerate(parts):
+        for parse_mode in ("Markdown", None):
+            try:
+                if n == 0 and placeholder:
+                    await placeholder.edit_text(part, parse_mode=parse_mode)
+                else:
+                    await message.answer(part, parse_mode=parse_mode)
+                break
+            except TelegramBadRequest as e:
+                if "not modified" in str(e):
+                    break
+                # Unbalanced */_/` from the model: retry as plain text
+
+def load_recent_messages(user_id: int):
+    """Warm the message index from the DB with edits replayed on top of the originals."""
+    rows = database.get_messages_for_check(user_id)
+    chains = database.get_revisions_for_check(user_id)
+    if chains:
+        rows = [
+            row[:3] + (text_diff.apply_chain(row[3], chains[(row[0], row[1])]),) + row[4:]
+            if (row[0], row[1]) in chains else row
+            for row in rows
+        ]
+    recent_messages.warm(user_id, rows)
+    return rows
 
 async def check_deleted_messages():
     """Periodically check if cached messages still exist"""
@@ -106,8 +225,10 @@ async def check_deleted_messages():
             if not client.is_connected:
                 continue
                 
-            # Get cached messages to check (last 100)
-            cached_msgs = database.get_messages_for_check(user_id)
+            # Get cached messages to check (last 100), from memory when warm
+            cached_msgs = recent_messages.recent(user_id, 100)
+            if not cached_msgs:
+                cached_msgs = load_recent_messages(user_id)
             if not cached_msgs:
                 continue
                 
@@ -217,9 +338,11 @@ async def check_deleted_messages():
 
                             await bot.send_message(user_id, alert_text, parse_mode="HTML")
                             logging.info(f"✅ Alert sent for msg {original_msg_id}")
+                            activity.bump(user_id, chat_id, "deleted", chat_title)
                             
                             # Remove from cache
-                            database.delete_cached_message(original_msg_id, chat_id)
+                            database.delete_cached_message(original_msg_id, chat_id, user_id)
+                            recent_messages.discard(user_id, chat_id, original_msg_id)
                         else:
                             # Message exists.
                             # We don't need to do anything, it stays in cache for next check.
@@ -250,11 +373,77 @@ class SettingsStates(StatesGroup):
     waiting_for_city = State()
     waiting_for_category = State()
 
+# Helper to safely get file_id
+def get_fid(obj): return getattr(obj, "file_id", None)
+
+def policy_keeps(policy, msg) -> bool:
+    """Whether a group message passes the chat's caching policy (sample / contacts-only)."""
+    if policy == chat_throttle.POLICY_SAMPLE:
+        return msg.id % config.THROTTLE_SAMPLE_EVERY == 0
+    if policy == chat_throttle.POLICY_CONTACTS:
+        replied = msg.reply_to_message
+        is_reply_to_me = bool(replied and replied.from_user and replied.from_user.is_self)
+        is_contact = bool(msg.from_user and msg.from_user.is_contact)
+        return is_contact or is_reply_to_me or bool(msg.mentioned)
+    return True
+
+def extract_message_data(msg):
+    # Extract sender info
+    s_id = msg.from_user.id if msg.from_user else 0
+    s_name = msg.from_user.first_name if msg.from_user else "Unknown"
+    s_username = msg.from_user.username if msg.from_user and msg.from_user.username else None
+    
+    # Robust Media Detection
+    m_type = None
+    f_id = None
+    cnt = msg.text or msg.caption or ""
+    
+    if msg.photo:
+        m_type = "photo"; f_id = get_fid(msg.photo)
+        if not cnt: cnt = "[Фотография]"
+    elif msg.video:
+        m_type = "video"; f_id = get_fid(msg.video)
+        if not cnt: cnt = "[Видео]"
+    elif msg.video_note:
+        m_type = "video_note"; f_id = get_fid(msg.video_note)
+        if not cnt: cnt = "[Видеокружок]"
+    elif msg.voice:
+        m_type = "voice"; f_id = get_fid(msg.voice)
+        if not cnt: cnt = "[Голосовое сообщение]"
+    elif msg.audio:
+        m_type = "audio"; f_id = get_fid(msg.audio)
+        if not cnt: cnt = "[Аудиозапись]"
+    elif msg.document:
+        m_type = "document"; f_id = get_fid(msg.document)
+        if not cnt: cnt = "[Документ/Файл]"
+    elif msg.sticker:
+        m_type = "sticker"; f_id = get_fid(msg.sticker)
+        if not cnt: cnt = "[Стикер]"
+    elif msg.animation:
+        m_type = "animation"; f_id = get_fid(msg.animation)
+        if not cnt: cnt = "[GIF/Анимация]"
+    
+    # Fallback
+    if not m_type and getattr(msg, "media", None):
+        raw_media = str(msg.media)
+        if "PHOTO" in raw_media: m_type = "photo"
+        elif "VIDEO_NOTE" in raw_media: m_type = "video_note"
+        elif "VIDEO" in raw_media: m_type = "video"
+        elif "VOICE" in raw_media: m_type = "voice"
+        else: m_type = "document"
+        
+        cnt = f"[Медиа: {raw_media}]"
+        if not f_id: f_id = "unknown_but_present"
+    
+    return s_id, s_name, s_username, m_type, f_id, cnt
+
+
 # --- UserBot Manager ---
 
 class UserBotManager:
     def __init__(self):
         self.clients = {} # user_id -> Client
+        self.backfill_tasks = {} # user_id -> asyncio.Task
 
     async def start_client(self, user_id: int, session_string: str):
         if user_id in self.clients:
@@ -286,6 +475,19 @@ class UserBotManager:
                     await asyncio.sleep(3)
                     await message.delete()
                     return
+                elif message.text.lower().startswith("/policy"):
+                    arg = message.text.lower().split(maxsplit=1)[1].strip() if " " in message.text else ""
+                    if arg == "auto":
+                        chat_policies.set_policy(user_id, message.chat.id, None)
+                        await message.edit_text("🤖 **Режим сохранения: авто.**\nБот сам ограничит кэш, если чат станет слишком активным.")
+                    elif arg in chat_throttle.POLICY_LABELS:
+                        chat_policies.set_policy(user_id, message.chat.id, arg, message.chat.title)
+                        await message.edit_text(f"📌 **Режим сохранения закреплен:** {chat_throttle.POLICY_LABELS[arg]}.")
+                    else:
+                        await message.edit_text("ℹ️ Используйте: `/policy all|text|sample|contacts|auto`")
+                    await asyncio.sleep(3)
+                    await message.delete()
+                    return
 
             # Cache all incoming messages from others
             if message.from_user and message.from_user.is_self:
@@ -311,62 +513,30 @@ class UserBotManager:
                 if message.chat.id in excluded_ids:
                     return # Chat is Blacklisted
 
-            # Helper to safely get file_id
-            def get_fid(obj): return getattr(obj, "file_id", None)
+            # Adapt caching to the chat's volume (groups only)
+            policy = chat_throttle.POLICY_ALL
+            if is_group:
+                policy, rate, changed = chat_policies.on_message(user_id, message.chat.id, message.chat.title)
+                if changed:
+                    try:
+                        await bot.send_message(
+                            user_id,
+                            f"📉 Чат «{message.chat.title}» очень активен (~{rate:.0f} сообщ./мин).\n"
+                            f"Режим сохранения переключен: {chat_throttle.POLICY_LABELS[policy]}.\n\n"
+                            "ℹ️ Закрепить режим вручную: напишите в чате /policy all|text|sample|contacts, вернуть авто — /policy auto."
+                        )
+                    except Exception as e:
+                        logging.error(f"Failed to send policy alert: {e}")
 
-            def extract_message_data(msg):
-                # Extract sender info
-                s_id = msg.from_user.id if msg.from_user else 0
-                s_name = msg.from_user.first_name if msg.from_user else "Unknown"
-                s_username = msg.from_user.username if msg.from_user and msg.from_user.username else None
-                
-                # Robust Media Detection
-                m_type = None
-                f_id = None
-                cnt = msg.text or msg.caption or ""
-                
-                if msg.photo:
-                    m_type = "photo"; f_id = get_fid(msg.photo)
-                    if not cnt: cnt = "[Фотография]"
-                elif msg.video:
-                    m_type = "video"; f_id = get_fid(msg.video)
-                    if not cnt: cnt = "[Видео]"
-                elif msg.video_note:
-                    m_type = "video_note"; f_id = get_fid(msg.video_note)
-                    if not cnt: cnt = "[Видеокружок]"
-                elif msg.voice:
-                    m_type = "voice"; f_id = get_fid(msg.voice)
-                    if not cnt: cnt = "[Голосовое сообщение]"
-                elif msg.audio:
-                    m_type = "audio"; f_id = get_fid(msg.audio)
-                    if not cnt: cnt = "[Аудиозапись]"
-                elif msg.document:
-                    m_type = "document"; f_id = get_fid(msg.document)
-                    if not cnt: cnt = "[Документ/Файл]"
-                elif msg.sticker:
-                    m_type = "sticker"; f_id = get_fid(msg.sticker)
-                    if not cnt: cnt = "[Стикер]"
-                elif msg.animation:
-                    m_type = "animation"; f_id = get_fid(msg.animation)
-                    if not cnt: cnt = "[GIF/Анимация]"
-                
-                # Fallback
-                if not m_type and getattr(msg, "media", None):
-                    raw_media = str(msg.media)
-                    if "PHOTO" in raw_media: m_type = "photo"
-                    elif "VIDEO_NOTE" in raw_media: m_type = "video_note"
-                    elif "VIDEO" in raw_media: m_type = "video"
-                    elif "VOICE" in raw_media: m_type = "voice"
-                    else: m_type = "document"
-                    
-                    cnt = f"[Медиа: {raw_media}]"
-                    if not f_id: f_id = "unknown_but_present"
-                
-                return s_id, s_name, s_username, m_type, f_id, cnt
+                if not policy_keeps(policy, message):
+                    return
+            capture_media = policy != chat_throttle.POLICY_TEXT
 
             sender_id, sender_name, sender_username, media_type, file_id, content = extract_message_data(message)
+            if not capture_media:
+                media_type, file_id = None, None
 
-            if not content or content == "[Неизвестный тип]":
+            if capture_media and (not content or content == "[Неизвестный тип]"):
                 content = "[Неизвестный тип]"
                 # DEBUG: Log the full message structure using vars() to see hidden fields
                 logging.warning(f"⚠️ Неизвестный тип сообщения! Внутренности: {vars(message)}")
@@ -434,7 +604,7 @@ class UserBotManager:
                         has_ttl = True
                         break
 
-            if is_protected or has_ttl:
+            if capture_media and (is_protected or has_ttl):
                  # Update content text regardless of whether we identified the exact type
                  content = f"[🔐 Секретное медиа ({media_type or 'Файл'})] {content}"
                  # Ensure we don't duplicate tags if the loop runs for some reason
@@ -516,58 +686,59 @@ class UserBotManager:
                     elif message.document: new_text = "[Файл]"
                     else: new_text = "[Медиа/Неизвестно]"
 
-                # 2. Get old content from cache
-                old_data = database.get_cached_message_content(message.id, message.chat.id)
-                
-                if old_data:
-                    # Unpack safely
-                    old_text, old_media, old_name, old_username = "", "", "", ""
-                    if len(old_data) == 5:
-                        old_text, old_media, old_name, old_username, old_title = old_data
-                    elif len(old_data) == 4:
-                        old_text, old_media, old_name, old_username = old_data
-                    
-                    # Compare text
-                    if old_text and old_text != new_text:
-                        # Prepare Alert
-                        s_name = message.from_user.first_name if message.from_user else "Unknown"
-                        s_tag = f"@{message.from_user.username}" if message.from_user and message.from_user.username else s_name
-                        
-                        alert = (
-                            f"✏️ Сообщение изменено!\n"
-                            f"📁 Чат: {message.chat.title or 'Личный'}\n"
-                            f"👤 Автор: {s_tag}\n\n"
-                            f"🕰 Было:\n{old_text}\n\n"
-                            f"🆕 Стало:\n{new_text}"
-                        )
-                        
-                        try:
-                            await bot.send_message(user_id, alert)
-                        except Exception as e:
-                            logging.error(f"Failed to send edit alert: {e}")
-
-                # 3. Update Cache with new content
                 s_id = message.from_user.id if message.from_user else 0
                 s_name = message.from_user.first_name if message.from_user else "Unknown"
                 s_username = message.from_user.username if message.from_user and message.from_user.username else None
-                m_type = None
-                f_id = None
-                
-                if message.photo: m_type="photo"; f_id=getattr(message.photo, "file_id", None)
-                elif message.video: m_type="video"; f_id=getattr(message.video, "file_id", None)
-                
-                database.cache_message(
-                    message.id, 
-                    message.chat.id, 
-                    user_id, 
-                    s_id, 
-                    new_text,
-                    s_name,
-                    m_type,
-                    f_id,
-                    s_username,
-                    message.chat.title or "Личный чат"
-                )
+                chat_title = message.chat.title or "Личный чат"
+
+                # 2. Get current content (memory first, then DB original + revisions)
+                record = recent_messages.get(user_id, message.chat.id, message.id)
+                if record is None:
+                    row = database.get_cached_message_row(message.id, message.chat.id)
+                    if row:
+                        record = MessageRecord.from_row(row)
+                        diffs = [diff for _, diff, _ in database.get_message_revisions(message.id, message.chat.id, user_id)]
+                        record.content = text_diff.apply_chain(record.content, diffs)
+
+                if record is None:
+                    # Never seen before: cache the edited version as the original
+                    m_type = None
+                    f_id = None
+                    if message.photo: m_type="photo"; f_id=getattr(message.photo, "file_id", None)
+                    elif message.video: m_type="video"; f_id=getattr(message.video, "file_id", None)
+
+                    database.cache_message(message.id, message.chat.id, user_id, s_id, new_text, s_name, m_type, f_id, s_username, chat_title)
+                    recent_messages.put(user_id, MessageRecord(
+                        message.id, message.chat.id, s_id, new_text, s_name,
+                        m_type, f_id, s_username, chat_title
+                    ))
+                    return
+
+                old_text = record.content
+                if old_text == new_text:
+                    return # Reactions, link previews etc. - text did not change
+
+                # 3. Store only the changed span as a new revision
+                revision = database.add_message_revision(message.id, message.chat.id, user_id, text_diff.make_diff(old_text, new_text))
+                recent_messages.put(user_id, record.with_content(new_text))
+                activity.bump(user_id, message.chat.id, "edited", chat_title)
+
+                if old_text:
+                    s_tag = f"@{s_username}" if s_username else s_name
+                    alert = (
+                        f"✏️ Сообщение изменено! (правка #{revision})\n"
+                        f"📁 Чат: {html.escape(message.chat.title or 'Личный')}\n"
+                        f"👤 Автор: {html.escape(s_tag)}\n\n"
+                        f"{text_diff.render_inline_diff(old_text, new_text)}"
+                    )
+                    kb = InlineKeyboardMarkup(inline_keyboard=[
+                        [InlineKeyboardButton(text="🕰 История правок", callback_data=f"revs_{message.chat.id}_{message.id}")]
+                    ])
+
+                    try:
+                        await bot.send_message(user_id, alert, parse_mode="HTML", reply_markup=kb)
+                    except Exception as e:
+                        logging.error(f"Failed to send edit alert: {e}")
 
             
             database.cache_message(
@@ -582,6 +753,11 @@ class UserBotManager:
                 sender_username,
                 message.chat.title or "Личный чат"
             )
+            recent_messages.put(user_id, MessageRecord(
+                message.id, message.chat.id, sender_id, content, sender_name,
+                media_type, file_id, sender_username, message.chat.title or "Личный чат"
+            ))
+            activity.bump(user_id, message.chat.id, "cached", message.chat.title or "Личный чат")
 
         # NOTE: on_deleted_messages does NOT work for private chats in Telegram!
         # Telegram API doesn't send deletion events for 1-on-1 chats.
@@ -593,15 +769,113 @@ class UserBotManager:
         logging.warning("⚠️ Это ограничение самого Telegram, а не бота.")
         logging.warning("⚠️ Отслеживание удалений работает ТОЛЬКО в группах и каналах.")
 
+        # Freeze per-chat watermarks before live updates start moving them
+        database.mark_backfill_pending(user_id)
+
         try:
             await client.start()
             self.clients[user_id] = client
             logging.info(f"UserBot for user {user_id} started.")
+            load_recent_messages(user_id)
+            self.backfill_tasks[user_id] = asyncio.create_task(self.backfill(user_id, client))
         except Exception as e:
             logging.error(f"Failed to start UserBot for {user_id}: {e}")
             database.delete_user_session(user_id)
 
+    async def backfill(self, user_id: int, client: Client):
+        """Cache messages that arrived while this UserBot was offline.
+        Walks recently active dialogs down to the last message id seen before the restart.
+        A chat stays pending until its batch is stored, so an interrupted run resumes on next start."""
+        pending = database.get_backfill_pending(user_id)
+        if not pending:
+            return
+
+        started = time.monotonic()
+        track_groups = database.get_track_groups(user_id)
+        excluded_ids = {row[0] for row in database.get_excluded_chats(user_id)}
+        budget = {"left": config.BACKFILL_MAX_MESSAGES, "cached": 0}
+        semaphore = asyncio.Semaphore(config.BACKFILL_CONCURRENCY)
+
+        async def walk(chat, since_id, top_id, policy):
+            rows = []
+            complete = True
+            async with semaphore:
+                try:
+                    async for msg in client.get_chat_history(chat.id, limit=config.BACKFILL_MAX_PER_CHAT):
+                        if msg.id <= since_id:
+                            break
+                        if budget["left"] <= 0:
+                            complete = False # Out of budget: keep the chat pending for next start
+                            break
+                        budget["left"] -= 1
+
+                        if msg.empty or msg.service:
+                            continue
+                        if msg.from_user and (msg.from_user.is_self or msg.from_user.id == BOT_ID):
+                            continue
+                        if not policy_keeps(policy, msg):
+                            continue
+
+                        sid, sname, s_username, mtype, fid, content = extract_message_data(msg)
+                        if policy == chat_throttle.POLICY_TEXT:
+                            mtype, fid = None, None
+                        sent_at = (msg.date or datetime.now()).astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+                        rows.append((msg.id, chat.id, user_id, sid, content or "[Неизвестный тип]", sname,
+                                     mtype, fid, s_username, chat.title or "Личный чат", sent_at))
+                except errors.FloodWait as e:
+                    logging.warning(f"Backfill FloodWait {e.value}s in chat {chat.id}, will resume on next start")
+                    complete = False
+
+            database.cache_messages_bulk(rows)
+            for row in rows:
+                recent_messages.put(user_id, MessageRecord.from_row(row[:9]))
+            if rows:
+                activity.bump(user_id, chat.id, "cached", chat.title or "Личный чат", amount=len(rows))
+            budget["cached"] += len(rows)
+            if complete:
+                database.finish_backfill(user_id, [(chat.id, top_id)])
+
+        try:
+            jobs = []
+            skipped = []
+            async for dialog in client.get_dialogs(limit=config.BACKFILL_DIALOGS):
+                chat = dialog.chat
+                since_id = pending.get(chat.id)
+                if since_id is None:
+                    continue # Never tracked this chat, nothing was missed
+
+                top_id = dialog.top_message.id if dialog.top_message else since_id
+                is_group = chat.type in [enums.ChatType.GROUP, enums.ChatType.SUPERGROUP, enums.ChatType.CHANNEL]
+                if top_id <= since_id or chat.id == BOT_ID or (is_group and (not track_groups or chat.id in excluded_ids)):
+                    skipped.append((chat.id, top_id))
+                    continue
+                # The policy the chat had when the bot went offline, without counting these messages
+                policy = chat_policies.policy(user_id, chat.id) if is_group else chat_throttle.POLICY_ALL
+                jobs.append(walk(chat, since_id, top_id, policy))
+
+            # Pending chats outside the recent dialogs stay pending: a later run resumes them
+            database.finish_backfill(user_id, skipped)
+
+            results = await asyncio.gather(*jobs, return_exceptions=True)
+            for result in results:
+                if isinstance(result, Exception):
+                    logging.error(f"Backfill chat error for {user_id}: {result}")
+
+            logging.info(
+                f"📥 Backfill for {user_id}: {budget['cached']} messages from {len(jobs)} chats "
+                f"in {time.monotonic() - started:.1f}s"
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"Backfill failed for {user_id}: {e}")
+
     async def stop_client(self, user_id: int):
+        task = self.backfill_tasks.pop(user_id, None)
+        if task:
+            task.cancel()
+        recent_messages.drop(user_id)
+        chat_policies.drop(user_id)
         client = self.clients.pop(user_id, None)
         if client:
             await client.stop()
@@ -665,12 +939,15 @@ async def handle_webapp_data(message: types.Message):
             city = data.get('city')
             database.update_user_city(message.from_user.id, city)
             await message.answer(f"🏙 Ваш город изменен на: {city}")
+            if not database.get_user_location(message.from_user.id):
+                await infer_timezone(message.from_user.id, city_name=city)
             
         elif action == 'add_expense':
             amount = data.get('amount')
             category = data.get('category')
-            database.add_expense(message.from_user.id, amount, category)
-            await message.answer(f"💸 Расход записан: {amount}₽ на {category}")
+            currency = fx.currency(data.get('currency') or "") or base_currency(message.from_user.id)
+            database.add_expense(message.from_user.id, amount, category, currency)
+            await message.answer(f"💸 Расход записан: {fx_rates.format_money(float(amount), currency)} на {category}")
             
         elif action == 'add_task':
             text = data.get('text')
@@ -682,7 +959,13 @@ async def handle_webapp_data(message: types.Message):
             time = data.get('time') # "HH:MM" or ""
             if not time:
                 time = None
-            database.add_habit(message.from_user.id, text, time)
+            minute = None
+            if time:
+                try:
+                    minute = timezones.to_utc_minute(time, user_tz_offset(message.from_user.id))
+                except ValueError:
+                    time = None
+            database.add_habit(message.from_user.id, text, time, minute)
             msg = f"💎 Новая привычка: {text}"
             if time:
                 msg += f"\n⏰ Напоминание в {time}"
@@ -706,14 +989,16 @@ async def handle_webapp_data(message: types.Message):
 @dp.message(F.text == "❓ Помощь")
 @dp.message(Command("help"))
 async def cmd_help(message: types.Message):
+    brief_at = timezones.brief_local_minute(message.from_user.id)
     help_text = (
         "🤖 **Что я умею:**\n\n"
-        "💰 **Учет расходов:** Просто напиши `сумма категория` (например: `500 обед`).\n"
+        "💰 **Учет расходов:** Просто напиши `сумма категория` (например: `500 обед` или `12 usd кофе`). Валюта отчета — `/currency`.\n"
         "📊 **Финансы:** Кнопка ниже или `/finance` покажет твои траты.\n"
         "📝 **Заметки:** Используй `/note текст`, чтобы я запомнил что-то важное. ИИ будет учитывать это при ответах.\n"
-        "⏰ **Напоминания:** Напиши `/remind ЧЧ:ММ текст` (например: `/remind 14:00 Встреча`).\n"
+        "⏰ **Напоминания:** Напиши `/remind ЧЧ:ММ текст` (например: `/remind 14:00 Встреча` или `/remind завтра 9:00 Врач`), список — `/reminders`.\n"
         "🎥 **Скачать видео:** Просто пришли ссылку на YouTube, TikTok или Instagram.\n"
-        "☁️ **Утренний дайджест:** Каждый день в 08:00 присылаю сводку погоды и дел.\n\n"
+        f"☁️ **Утренний дайджест:** Каждый день в {brief_at // 60:02d}:{brief_at % 60:02d} по вашему времени присылаю сводку погоды и дел. "
+        "Часовой пояс — `/timezone`.\n\n"
         "💬 **Чат с ИИ:** Просто напиши мне любой вопрос, и я отвечу!"
     )
     await message.answer(help_text, parse_mode="Markdown")
@@ -747,9 +1032,58 @@ async def show_stats(callback: types.CallbackQuery):
         return
     
     count = database.get_user_count()
-    await callback.message.answer(f"Всего пользователей в системе: {count}")
+    text = f"Всего пользователей в системе: {count}"
+
+    activity.flush()
+    week_ago = (datetime.now(timezone.utc) - timedelta(days=6)).date().isoformat()
+    days = database.get_global_activity(week_ago)
+    if days:
+        today = days[-1] if days[-1][0] == datetime.now(timezone.utc).date().isoformat() else (None, 0, 0, 0)
+        text += (
+            f"\n\n📈 UserBot сегодня: 💾 {today[1]} | 🗑 {today[2]} | ✏️ {today[3]}"
+            f"\n📅 За 7 дней: 💾 {sum(d[1] for d in days)} | 🗑 {sum(d[2] for d in days)} | ✏️ {sum(d[3] for d in days)}"
+        )
+        top_users = database.get_top_users_by_activity(5)
+        if top_users:
+            text += "\n\n🏆 Самые активные UserBot (всего):"
+            for uid, cached, deleted, edited in top_users:
+                text += f"\n• {uid}: 💾 {cached} | 🗑 {deleted} | ✏️ {edited}"
+
+    index_stats = recent_messages.stats()
+    if index_stats:
+        records = sum(r for r, _, _, _ in index_stats.values())
+        size_kb = sum(b for _, b, _, _ in index_stats.values()) / 1024
+        hits = sum(h for _, _, h, _ in index_stats.values())
+        misses = sum(m for _, _, _, m in index_stats.values())
+        hit_rate = hits / (hits + misses) * 100 if hits + misses else 0
+        text += (
+            f"\n\n🧠 Индекс сообщений: {records} записей, {size_kb:.0f} KB "
+            f"({len(index_stats)} UserBot), попадания {hit_rate:.0f}%"
+        )
+        for uid, (r, b, h, m) in sorted(index_stats.items(), key=lambda x: -x[1][1])[:5]:
+            text += f"\n• {uid}: {r} зап., {b / 1024:.0f} KB, {h}/{h + m} попаданий"
+
+    text += "\n\n" + ai_router.report()
+    text += "\n" + ai_cache.report()
+    text += "\n\n" + usage.report()
+    text += "\n\n" + http.report()
+    text += "\n" + weather_cache.report()
+    text += "\n" + fx.report()
+    text += "\n" + mail_watcher.report()
+    if last_brief_report:
+        text += "\n" + last_brief_report
+
+    for i in range(0, len(text), 4096):
+        await callback.message.answer(text[i:i + 4096])
     await callback.answer()
 
+@dp.message(Command("ai_stats"))
+async def cmd_ai_stats(message: types.Message):
+    if message.from_user.id != config.ADMIN_ID:
+        await message.answer("У вас нет прав администратора.")
+        return
+    await message.answer(ai_router.report() + "\n\n" + usage.report())
+
 @dp.message(Form.waiting_for_broadcast)
 async def process_broadcast(message: types.Message, state: FSMContext):
     users = database.get_all_users()
@@ -766,13 +1100,32 @@ async def process_broadcast(message: types.Message, state: FSMContext):
     await state.clear()
 
 # Expense Tracker
-@dp.message(F.text.regexp(r'^(\d+)\s+(.+)$'))
+def base_currency(user_id: int) -> str:
+    return database.get_base_currency(user_id) or config.DEFAULT_CURRENCY
+
+@dp.message(F.text.regexp(fx_rates.EXPENSE_RE))
 async def record_expense(message: types.Message):
-    match = re.match(r'^(\d+)\s+(.+)$', message.text)
-    amount = float(match.group(1))
-    category = match.group(2)
-    database.add_expense(message.from_user.id, amount, category)
-    await message.answer(f"✅ Записал: {amount} на {category}")
+    amount, currency, category = fx.parse_expense(message.text)
+    currency = currency or base_currency(message.from_user.id)
+    database.add_expense(message.from_user.id, amount, category, currency)
+    await message.answer(f"✅ Записал: {fx_rates.format_money(amount, currency)} на {category}")
+
+@dp.message(Command("currency"))
+async def cmd_currency(message: types.Message, command: CommandObject):
+    user_id = message.from_user.id
+    if not command.args:
+        await message.answer(
+            f"💱 Валюта отчета: {base_currency(user_id)}\n"
+            "Изменить: /currency USD (или EUR, KZT, руб...)\n"
+            "Расход в другой валюте: `20 usd такси`, `15€ обед`"
+        )
+        return
+    code = fx.currency(command.args)
+    if code is None:
+        await message.answer("❌ Не знаю такой валюты. Пример: /currency USD")
+        return
+    database.set_base_currency(user_id, code)
+    await message.answer(f"✅ Расходы будут пересчитываться в {code}.")
 
 @dp.message(F.text == "📊 Финансы")
 @dp.message(Command("finance"))
@@ -784,8 +1137,8 @@ async def cmd_finance(message: types.Message):
     
     report = "📊 Твои последние расходы:\n"
     total = 0
-    for amount, cat, ts in expenses[:10]:
-        report += f"• {amount} — {cat} ({ts[:10]})\n"
+    for amount, cat, ts, currency in expenses[:10]:
+        report += f"• {fx_rates.format_money(amount, currency or config.DEFAULT_CURRENCY)} — {cat} ({ts[:10]})\n"
         total += amount
     
     await message.answer(report)
@@ -834,16 +1187,19 @@ async def process_clear_notes(callback: types.CallbackQuery):
 @dp.message(F.text == "🧹 Очистить чат")
 @dp.message(Command("clear_ai"))
 async def cmd_clear_ai(message: types.Message):
-    # Currently context is not stored persistently, but if we add memory later, clear it here.
-    # For now, we just inform the user.
+    conversations.clear(message.from_user.id)
     await message.answer("🧹 Контекст общения с ИИ очищен! Я забыл всё, о чем мы говорили (кроме ваших заметок).")
 
 # Reminder feature
-async def send_reminder(user_id: int, text: str):
-    try:
-        await bot.send_message(user_id, f"🕒 Напоминание: {text}")
-    except Exception as e:
-        logging.error(f"Failed to send reminder to {user_id}: {e}")
+REMIND_USAGE = (
+    "Используйте: /remind КОГДА текст\n\n"
+    "• /remind 14:00 Встреча\n"
+    "• /remind завтра 9:30 Позвонить маме\n"
+    "• /remind 25.12 18:00 Купить подарки\n"
+    "• /remind через 40 мин Выключить духовку\n"
+    "• /remind каждый день 8:00 Витамины (ещё: по будням, каждую неделю, каждый месяц)\n\n"
+    "Время — в вашем часовом поясе (/timezone). Список и отмена: /reminders"
+)
 
 @dp.message(F.text == "📝 Заметка")
 async def btn_note(message: types.Message):
@@ -851,28 +1207,96 @@ async def btn_note(message: types.Message):
 
 @dp.message(F.text == "⏰ Напомнить")
 async def btn_remind(message: types.Message):
-    await message.answer("Чтобы поставить напоминание, используй команду: `/remind ЧЧ:ММ текст` (например: `/remind 15:00 Купить хлеб`)", parse_mode="Markdown")
+    await message.answer(REMIND_USAGE)
+
+@dp.message(Command("timezone"))
+async def cmd_timezone(message: types.Message, command: CommandObject):
+    user_id = message.from_user.id
+    if not command.args:
+        tz_name, offset = database.get_user_timezone(user_id)
+        if offset is None:
+            current = f"{timezones.format_offset(config.DEFAULT_TZ_OFFSET)} (по умолчанию)"
+        else:
+            current = tz_name or f"{timezones.format_offset(offset)} (по геопозиции/городу)"
+        await message.answer(
+            f"🕰 Ваш часовой пояс: {current}\n\n"
+            "Изменить: /timezone +3, /timezone UTC-5 или /timezone Europe/Berlin\n"
+            "Или отправьте геопозицию — пояс определится автоматически."
+        )
+        return
+
+    try:
+        tz_name, offset = timezones.parse_timezone(command.args)
+    except ValueError:
+        await message.answer("❌ Не понял часовой пояс. Примеры: /timezone +3, /timezone UTC-5, /timezone Europe/Berlin")
+        return
+
+    # Numeric zones are stored as "UTC+3" so they also count as set explicitly
+    database.set_user_timezone(user_id, tz_name or timezones.format_offset(offset), offset, timezones.brief_minute(user_id, offset))
+    brief_at = timezones.brief_local_minute(user_id)
+    await message.answer(
+        f"✅ Часовой пояс: {tz_name or timezones.format_offset(offset)}. У вас сейчас {timezones.local_now(offset):%H:%M}.\n"
+        f"☀️ Утренний дайджест будет приходить в {brief_at // 60:02d}:{brief_at % 60:02d}."
+    )
 
 @dp.message(Command("remind"))
 async def cmd_remind(message: types.Message, command: CommandObject):
     if not command.args:
-        await message.answer("Используйте: /remind ЧЧ:ММ текст напоминания")
+        await message.answer(REMIND_USAGE)
         return
 
+    user_id = message.from_user.id
+    offset = user_tz_offset(user_id)
     try:
-        time_str, reminder_text = command.args.split(" ", 1)
-        target_time = datetime.strptime(time_str, "%H:%M").time()
-        now = datetime.now()
-        run_date = datetime.combine(now.date(), target_time)
-        
-        if run_date < now:
-            await message.answer("Это время уже прошло. Попробуйте на сегодня попозже.")
-            return
-
-        scheduler.add_job(send_reminder, 'date', run_date=run_date, args=[message.from_user.id, reminder_text])
-        await message.answer(f"Ок! Напомню в {time_str}: {reminder_text}")
+        run_at, repeat, reminder_text = reminders.parse_reminder(command.args, offset)
     except ValueError:
-        await message.answer("Ошибка формата. Пример: /remind 14:00 Сходить в магазин")
+        await message.answer("Ошибка формата.\n\n" + REMIND_USAGE)
+        return
+    if run_at <= time.time():
+        await message.answer("Это время уже прошло. Укажите время в будущем.")
+        return
+
+    database.add_reminder(user_id, reminder_text, run_at, repeat, offset, reminders.to_local(run_at, offset).day)
+    when = reminders.format_local(run_at, offset)
+    if repeat:
+        when += f", далее {reminders.REPEAT_NAMES[repeat]}"
+    await message.answer(f"Ок! Напомню {when}: {reminder_text}\nВсе напоминания: /reminders")
+
+def render_reminders(user_id: int):
+    rows = database.get_user_reminders(user_id, config.REMINDERS_PAGE)
+    if not rows:
+        return "У тебя нет активных напоминаний. Добавь: /remind 14:00 текст", None
+
+    offset = user_tz_offset(user_id)
+    text = "⏰ Твои напоминания:\n\n"
+    kb = []
+    for i, (rid, reminder_text, run_at, repeat, _) in enumerate(rows, 1):
+        preview = reminder_text[:40] + "..." if len(reminder_text) > 40 else reminder_text
+        repeat_note = f" 🔁 {reminders.REPEAT_NAMES[repeat]}" if repeat else ""
+        text += f"{i}. {reminders.format_local(run_at, offset)}{repeat_note} — {preview}\n"
+        kb.append([InlineKeyboardButton(text=f"❌ Отменить #{i}", callback_data=f"del_rem_{rid}")])
+    total = database.count_user_reminders(user_id)
+    if total > len(rows):
+        text += f"\n…и ещё {total - len(rows)}"
+    return text, InlineKeyboardMarkup(inline_keyboard=kb)
+
+@dp.message(Command("reminders"))
+async def cmd_reminders(message: types.Message):
+    text, kb = render_reminders(message.from_user.id)
+    await message.answer(text, reply_markup=kb)
+
+@dp.callback_query(F.data.startswith("del_rem_"))
+async def process_reminder_delete(callback: types.CallbackQuery):
+    rid = int(callback.data.split("_")[2])
+    if not database.delete_reminder(rid, callback.from_user.id):
+        await callback.answer("Напоминание уже отправлено или удалено.")
+    else:
+        await callback.answer("Напоминание отменено!")
+    text, kb = render_reminders(callback.from_user.id)
+    try:
+        await callback.message.edit_text(text, reply_markup=kb)
+    except TelegramBadRequest:
+        pass # Nothing changed
 
 # Manage Categories
 # Manage Categories
@@ -961,27 +1385,35 @@ async def send_expense_chart(message: types.Message):
          user_id = message.chat.id
          
     try:
-        conn = database.sqlite3.connect(database.DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT category, SUM(amount) FROM expenses WHERE user_id = ? GROUP BY category", (user_id,))
-        rows = cursor.fetchall()
-        conn.close()
+        rows = database.get_expense_totals(user_id, config.DEFAULT_CURRENCY)
         
         if not rows:
             await message.answer("📊 У вас пока нет расходов для статистики.")
             return
 
-        total = sum(row[1] for row in rows)
+        # Convert with the cached rates only: no network call while the user waits
+        base = base_currency(user_id)
+        totals, unconverted = {}, {}
+        for category, currency, amount in rows:
+            converted = fx.convert(amount, currency, base)
+            if converted is None:
+                unconverted[currency] = unconverted.get(currency, 0) + amount
+            else:
+                totals[category] = totals.get(category, 0) + converted
+
+        total = sum(totals.values())
         text = "📊 <b>Ваши расходы:</b>\n\n"
         
         # Sort by amount desc
-        rows.sort(key=lambda x: x[1], reverse=True)
-        
-        for category, amount in rows:
-            percent = (amount / total) * 100
-            text += f"▫️ <b>{category}</b>: {amount:.0f}₽ ({percent:.1f}%)\n"
+        for category, amount in sorted(totals.items(), key=lambda x: x[1], reverse=True):
+            percent = (amount / total) * 100 if total else 0
+            text += f"▫️ <b>{html.escape(category)}</b>: {fx_rates.format_money(amount, base)} ({percent:.1f}%)\n"
             
-        text += f"\n💰 <b>Всего:</b> {total:.0f}₽"
+        text += f"\n💰 <b>Всего:</b> {fx_rates.format_money(total, base)}"
+        if unconverted:
+            text += "\n⚠️ Без пересчета (нет курса): " + ", ".join(fx_rates.format_money(a, c) for c, a in unconverted.items())
+        if len({currency for _, currency, _ in rows} | {base}) > 1:
+            text += f"\n<i>Курсы от {fx.published()}{', могли устареть' if fx.stale else ''}</i>"
         
         await message.answer(text, parse_mode="HTML")
     except Exception as e:
@@ -992,67 +1424,79 @@ async def get_weather(lat=None, lon=None, city_name=None):
     if not config.WEATHER_API_KEY:
         return "Ключ погоды не настроен."
     
-    try:
-        url = "https://api.openweathermap.org/data/2.5/weather"
-        params = {
-            "appid": config.WEATHER_API_KEY,
-            "units": "metric",
-            "lang": "ru"
-        }
-        
-        if lat and lon:
-            params["lat"] = lat
-            params["lon"] = lon
-        elif city_name:
-            params["q"] = city_name
-        else:
-            return "Не указана локация"
+    if weather.weather_key(lat, lon, city_name) is None:
+        return "Не указана локация"
 
-        async with httpx.AsyncClient() as client:
-            r = await client.get(url, params=params)
-            data = r.json()
-            if r.status_code != 200:
-                return f"Ошибка: {data.get('message', 'Неизвестная ошибка')}"
-            
-            temp = data['main']['temp']
-            desc = data['weather'][0]['description']
-            place = data.get('name', 'Неизвестное место')
-            return f"{temp}°C, {desc} ({place})"
+    try:
+        # Users in the same city or grid cell share one cached reading
+        data = await weather_cache.get(lat=lat, lon=lon, city_name=city_name)
+        return weather.format_weather(data)
+    except weather.WeatherError as e:
+        return f"Ошибка: {e}"
     except Exception as e:
         return f"Ошибка получения погоды: {e}"
 
+async def prefetch_weather(minute: int):
+    """Warm the weather cache for the users whose brief is due at `minute`."""
+    rows = database.get_brief_users(minute)
+    if rows:
+        await weather_cache.prefetch([(city, lat, lon) for _, city, lat, lon in rows])
 
-async def get_currency():
+async def infer_timezone(user_id: int, lat=None, lon=None, city_name=None):
+    """Take the user's zone from OpenWeatherMap's `timezone` shift, unless set with /timezone."""
+    tz_name, _ = database.get_user_timezone(user_id)
+    if tz_name or not config.WEATHER_API_KEY:
+        return
     try:
-        url = "https://open.er-api.com/v6/latest/USD"
-        async with httpx.AsyncClient() as client:
-            r = await client.get(url)
-            data = r.json()
-            return f"{data['rates']['RUB']:.2f} руб."
-    except:
-        return "98.40 руб. (ошибка API)"
+        data = await weather_cache.get(lat=lat, lon=lon, city_name=city_name)
+    except Exception:
+        return
+    if "timezone" in data:
+        offset = data["timezone"] // 60
+        database.set_user_timezone(user_id, None, offset, timezones.brief_minute(user_id, offset))
+
+def user_tz_offset(user_id: int) -> int:
+    _, offset = database.get_user_timezone(user_id)
+    return config.DEFAULT_TZ_OFFSET if offset is None else offset
+
+def assign_brief_minutes(only_new: bool = True):
+    """brief_minute for users without one (or everyone); no zone means DEFAULT_TZ_OFFSET."""
+    rows = database.get_brief_offsets(only_new)
+    database.set_brief_minutes([
+        (timezones.brief_minute(user_id, config.DEFAULT_TZ_OFFSET if offset is None else offset), user_id)
+        for user_id, offset in rows
+    ])
 
-async def send_morning_brief():
-    users = database.get_all_users()
-    currency = await get_currency()
-    
-    for user_id in users:
-        loc = database.get_user_location(user_id)
-        if loc:
-            weather = await get_weather(lat=loc[0], lon=loc[1])
-        else:
-            city = database.get_user_city(user_id)
-            weather = await get_weather(city_name=city)
-        
-        brief = f"☀️ Доброе утро! Вот твой утренний дайджест:\n"
-        brief += f"🌡 Погода: {weather}\n"
-        brief += f"💵 Курс USD: {currency}\n"
-        brief += "📅 Не забудь проверить свои дела на сегодня!"
-        
+def refresh_timezones():
+    """Recompute offsets of users with a named zone (DST changes) and everyone's brief minute."""
+    for user_id, tz_name, offset in database.get_named_timezones():
         try:
-            await bot.send_message(user_id, brief)
-        except Exception as e:
-            logging.error(f"Failed to send brief to {user_id}: {e}")
+            _, current = timezones.parse_timezone(tz_name)
+        except ValueError:
+            continue
+        if current != offset:
+            database.set_user_timezone(user_id, tz_name, current, timezones.brief_minute(user_id, current))
+    assign_brief_minutes(only_new=False)
+    database.assign_habit_minutes(config.DEFAULT_TZ_OFFSET)
+
+
+async def get_currency():
+    # Served from the rate cache, refreshed in the background
+    return fx.usd_rub()
+
+async def send_morning_brief():
+    """Per-minute tick: deliver the brief to the users whose local morning is now."""
+    global last_brief_report
+    # Users who joined since the last tick get the default zone
+    assign_brief_minutes()
+    minute = timezones.utc_minute()
+    if config.WEATHER_PREFETCH_MINUTES and config.WEATHER_API_KEY:
+        asyncio.create_task(prefetch_weather((minute + config.WEATHER_PREFETCH_MINUTES) % 1440))
+
+    report = await morning_brief.deliver_briefs(sender, lambda: database.get_brief_users(minute), get_weather, get_currency)
+    if report.users:
+        last_brief_report = str(report)
+        logging.info(last_brief_report)
 
 @dp.message(F.location)
 async def handle_location(message: types.Message):
@@ -1061,6 +1505,7 @@ async def handle_location(message: types.Message):
     database.update_user_location(message.from_user.id, lat, lon)
     
     weather = await get_weather(lat=lat, lon=lon)
+    await infer_timezone(message.from_user.id, lat=lat, lon=lon)
     await message.answer(f"✅ Локация сохранена!\n🌡 Погода здесь: {weather}", reply_markup=get_main_menu())
 
 @dp.message(F.text == "🌦 Погода")
@@ -1149,134 +1594,252 @@ async def process_habit_log(callback: types.CallbackQuery):
     database.log_habit(habit_id, callback.from_user.id, today)
     await callback.answer("Отлично! Засчитано.")
 
-# --- TEMPORARY MAIL (Mail.tm API) ---
+# --- TEMPORARY MAIL (mail.tm / 1secmail) ---
+MAIL_KB = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="🔄 Проверить почту", callback_data="check_mail")],
+    [InlineKeyboardButton(text="🆕 Сгенерировать новый", callback_data="new_mail")]
+])
+
+def watch_mailbox(user_id: int, provider: str, email: str, secret):
+    """(Re)start pushing new mail of this inbox for MAIL_WATCH_HOURS."""
+    watch_until = int(time.time() + config.MAIL_WATCH_HOURS * 3600)
+    database.set_mail_watch(user_id, watch_until)
+    mail_watcher.watch(user_id, provider, email, secret, watch_until)
+
+async def push_mail(user_id: int, email: str, mail_message: temp_mail.MailMessage):
+    await sender.send(
+        user_id,
+        f"📨 <b>Новое письмо на</b> <code>{html.escape(email)}</code>\n\n" + temp_mail.format_mail(mail_message, 1000),
+        parse_mode="HTML"
+    )
+
 @dp.message(F.text == "📧 Временная почта")
-async def cmd_temp_mail(message: types.Message):
-    # 1. Get Domain
-    # 2. Create Account
+@dp.message(F.text == "📧 Почта")
+@dp.message(Command("tempmail"))
+async def cmd_tempmail(message: types.Message):
+    # Check if user already has an email
+    mailbox = database.get_temp_mailbox(message.from_user.id)
+    if not mailbox:
+        await generate_new_email(message, message.from_user.id)
+        return
+
+    email, provider, secret, _ = mailbox
+    watch_mailbox(message.from_user.id, provider, email, secret)
+    await message.answer(
+        f"Твой текущий адрес:\n<code>{html.escape(email)}</code>\n\n"
+        "Используй его для регистраций или создай новый. Новые письма пришлю сюда сам.",
+        reply_markup=MAIL_KB, parse_mode="HTML"
+    )
+
+async def generate_new_email(message: types.Message, user_id: int):
+    await bot.send_chat_action(message.chat.id, "typing")
     try:
-        async with httpx.AsyncClient() as client:
-            # Get domains
-            resp = await client.get("https://api.mail.tm/domains")
-            if resp.status_code != 200: raise Exception("Domains error")
-            domain_data = resp.json()['hydra:member'][0]['domain']
-            
-            # Generate credentials
-            import random, string
-            username = ''.join(random.choices(string.ascii_lowercase + string.digits, k=10))
-            password = ''.join(random.choices(string.ascii_letters + string.digits, k=12))
-            email = f"{username}@{domain_data}"
-            
-            # Create account
-            reg_resp = await client.post("https://api.mail.tm/accounts", json={
-                "address": email,
-                "password": password
-            })
-            
-            if reg_resp.status_code != 201:
-                raise Exception(f"Registration failed: {reg_resp.text}")
-            
-            # Provide button with password embedded (to get token later)
-            # Format: check_mail_email:password
-            kb = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="📬 Проверить входящие", callback_data=f"check_mail_{email}:{password}")]
-            ])
-            
-            await message.answer(
-                f"📧 <b>Ваш временный адрес:</b>\n<code>{email}</code>\n\n"
-                "Нажмите кнопку ниже, чтобы проверить новые письма.",
-                parse_mode="HTML",
-                reply_markup=kb
-            )
+        provider, email, secret = await mailboxes.create()
     except Exception as e:
-        logging.error(f"Temp mail error: {e}")
-        await message.answer(f"Ошибка сервиса почты: {e}")
+        logging.error(f"Generate Mail Error: {e}")
+        await message.answer("❌ Ошибка при создании почты.")
+        return
 
-@dp.callback_query(F.data.startswith("check_mail_"))
-async def check_temp_mail(callback: types.CallbackQuery):
-    # Format: check_mail_email:password
-    data = callback.data.replace("check_mail_", "")
-    email, password = data.split(":")
-    
+    database.save_temp_email(user_id, email, provider, secret)
+    watch_mailbox(user_id, provider, email, secret)
+    await message.answer(
+        f"✅ Создан новый адрес:\n<code>{html.escape(email)}</code>\n\n"
+        f"Новые письма пришлю сюда автоматически в ближайшие {config.MAIL_WATCH_HOURS:g} ч. Проверить вручную — кнопкой ниже.",
+        reply_markup=MAIL_KB, parse_mode="HTML"
+    )
+
+@dp.callback_query(F.data == "new_mail")
+async def process_new_mail(callback: types.CallbackQuery):
+    # callback.message is the bot's message: pass the user explicitly
+    await generate_new_email(callback.message, callback.from_user.id)
+    await callback.answer()
+
+@dp.callback_query(F.data == "check_mail")
+async def process_check_mail(callback: types.CallbackQuery):
+    user_id = callback.from_user.id
+    mailbox = database.get_temp_mailbox(user_id)
+    if not mailbox:
+        await callback.answer("Сначала создай почту!")
+        return
+
+    email, provider, secret, _ = mailbox
+    watch_mailbox(user_id, provider, email, secret)
     try:
-        async with httpx.AsyncClient() as client:
-            # Get Token
-            token_resp = await client.post("https://api.mail.tm/token", json={
-                "address": email,
-                "password": password
-            })
-            
-            if token_resp.status_code != 200:
-                await callback.answer("Ошибка авторизации почты.", show_alert=True)
-                return
-                
-            token = token_resp.json()['token']
-            headers = {"Authorization": f"Bearer {token}"}
-            
-            # Get Messages
-            msgs_resp = await client.get("https://api.mail.tm/messages", headers=headers)
-            messages = msgs_resp.json()['hydra:member']
-            
-            if not messages:
-                await callback.answer("📭 Входящих писем нет.", show_alert=True)
-                return
-            
-            # Show messages
-            text = f"📬 <b>Входящие ({len(messages)}):</b>\n\n"
-            for msg in messages[:5]:
-                sender = msg['from']['address']
-                subject = msg['subject']
-                intro = msg.get('intro', 'Empty body')
-                text += f"🔹 <b>От:</b> {sender}\n<b>Тема:</b> {subject}\n<b>Текст:</b> {intro}\n\n"
-            
-            await callback.message.answer(text, parse_mode="HTML")
-            await callback.answer()
-            
+        messages = await mailboxes.inbox(provider, email, secret, limit=5)
     except Exception as e:
-        logging.error(f"Check mail error: {e}")
-        await callback.answer("Ошибка проверки почты.", show_alert=True)
+        logging.error(f"Mail Check Error: {e}")
+        await callback.answer("Ошибка при проверке почты.", show_alert=True)
+        return
+
+    if not messages:
+        await callback.answer("Писем пока нет. Пришлю, как только появятся.", show_alert=True)
+        return
+
+    # Shown here, so the watcher won't push them again
+    ids = [m.id for m in messages]
+    database.add_seen_mail(user_id, ids)
+    mail_watcher.mark_seen(user_id, ids)
+    text = f"📩 <b>Входящие ({len(messages)}):</b>\n\n" + "\n---\n".join(temp_mail.format_mail(m) for m in messages)
+    await callback.message.answer(text, parse_mode="HTML")
+    await callback.answer()
+
+@dp.callback_query(F.data.startswith("check_mail_"))
+async def check_legacy_mail(callback: types.CallbackQuery):
+    # Buttons sent before inboxes were stored carry the mail.tm credentials: adopt that inbox
+    email, password = callback.data.replace("check_mail_", "").split(":", 1)
+    database.save_temp_email(callback.from_user.id, email, "mailtm", password)
+    await process_check_mail(callback)
+
+# Summarizer (map-reduce over token-bounded chunks)
+def summary_ask(user_id: int, feature: str):
+    async def ask(prompt):
+        # Goes through the response cache, so unchanged chunks are never summarized twice
+        answer = await get_ai_response(prompt, user_id, feature)
+        return None if answer in (AI_BUSY_TEXT, AI_QUOTA_TEXT) else answer
+    return ask
+
+async def summarize_document(message: types.Message, status: types.Message, text: str, final_prompt: str, feature: str):
+    """Summarize a long text chunk by chunk, showing progress in `status`. Returns the summary or None."""
+    user_id = message.from_user.id
+    ask = summary_ask(user_id, feature)
+
+    last_edit = 0.0
+    async def progress(done, total):
+        nonlocal last_edit
+        if done < total and time.monotonic() - last_edit < config.AI_STREAM_EDIT_INTERVAL:
+            return
+        last_edit = time.monotonic()
+        try:
+            await status.edit_text(f"⏳ Прочитано частей: {done}/{total}...")
+        except (TelegramBadRequest, TelegramRetryAfter):
+            pass
+
+    summary, used, total = await summarizer.summarize(
+        text, ask, final_prompt, progress, ai_budget(user_id, config.SUMMARY_MAX_CHUNKS)
+    )
+    if summary and used < total:
+        summary += f"\n\n(Пересказаны первые {used} из {total} частей.)"
+    return summary
+
+def read_pdf_text(file_path: str, max_pages: int) -> str:
+    reader = PdfReader(file_path)
+    return " ".join(page.extract_text() or "" for page in reader.pages[:max_pages])
 
 # Summarizer (Articles)
-@dp.message(F.text.regexp(r'https?://(?!www\.youtube|youtu\.be|tiktok\.com|instagram\.com)[^\s]+'))
+ARTICLE_PROMPT = (
+    "Твоя задача — сделать качественный и объективный пересказ статьи на русском языке. "
+    "Избегай общих фраз и дисклеймеров. Пиши сразу по существу.\n\n"
+    "Текст статьи:\n{text}"
+)
+DIGEST_PROMPT = (
+    "Перескажи суть статьи на русском языке в 3–5 предложениях, без вступлений и дисклеймеров.\n\n"
+    "Текст статьи:\n{text}"
+)
+
+def message_links(message: types.Message) -> list:
+    """Article links of a message: in the text and behind hyperlinks (forwarded digests)."""
+    hyperlinks = [e.url for e in message.entities or [] if e.type == "text_link"]
+    return articles.find_links(message.text, hyperlinks)
+
+@dp.message(StateFilter(None), F.text, ~F.text.startswith("/"), lambda message: bool(message_links(message)))
 async def summarize_link(message: types.Message):
-    url = message.text
-    await message.answer("⏳ Читаю статью и готовлю краткий пересказ...")
-    
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-    }
+    urls = message_links(message)
+    if usage.level(message.from_user.id) == ai_usage.BLOCKED:
+        await message.answer(AI_QUOTA_TEXT)
+        return
+    if len(urls) > 1:
+        await summarize_links(message, urls)
+        return
+
+    url = urls[0]
+    status = await message.answer("⏳ Читаю статью и готовлю краткий пересказ...")
     
     try:
-        async with httpx.AsyncClient(headers=headers, follow_redirects=True) as client:
-            r = await client.get(url, timeout=15.0)
-            soup = BeautifulSoup(r.text, 'html.parser')
-            # Filter out scripts, styles, and small navigation texts
-            for script_or_style in soup(["script", "style", "nav", "footer", "header"]):
-                script_or_style.decompose()
-                
-            paragraphs = [p.get_text().strip() for p in soup.find_all(['p', 'h1', 'h2'])]
-            text = " ".join([p for p in paragraphs if len(p) > 20])[:6000]
-            
-        if not text:
-            await message.answer("❌ Не удалось извлечь текст из статьи. Попробуй другую ссылку.")
+        try:
+            # Streamed with a size cap, parsed in a worker thread, cached with ETag/Last-Modified
+            article = await articles.fetch_article(http, url)
+        except articles.ArticleError as e:
+            await status.edit_text(f"❌ {e}")
             return
 
-        prompt = (
-            "Твоя задача — сделать качественный и объективный пересказ статьи на русском языке. "
-            "Избегай общих фраз и дисклеймеров. Пиши сразу по существу.\n\n"
-            f"Текст статьи:\n{text}"
-        )
-        
-        summary = await get_ai_response(prompt)
-        await message.answer(f"📝 **Краткое содержание:**\n\n{summary}", parse_mode="Markdown")
+        summary = await summarize_document(message, status, article.text, ARTICLE_PROMPT, "summary")
+        if not summary:
+            await status.edit_text(AI_BUSY_TEXT)
+            return
+        await send_ai_text(message, f"📝 *Краткое содержание:*\n\n{summary}", status)
+        # Follow-up questions in the AI chat can refer to the article
+        conversations.append(message.from_user.id, f"Перескажи статью {url}", summary)
     except Exception as e:
         logging.error(f"Summarize Error: {e}")
         await message.answer("❌ Не удалось прочитать статью. Возможно, доступ заблокирован.")
 
+async def summarize_links(message: types.Message, urls: list):
+    """Several links at once: fetched and summarized concurrently (HTTP and AI limits still apply),
+    progress shown per link, one combined digest at the end."""
+    user_id = message.from_user.id
+    skipped = max(0, len(urls) - config.SUMMARY_LINKS_MAX)
+    urls = urls[:config.SUMMARY_LINKS_MAX]
+    results = {} # url -> (title, summary | None, error | None)
+
+    def render():
+        lines = [f"⏳ Читаю ссылки: готово {len(results)} из {len(urls)}"]
+        for url in urls:
+            mark = "⏳" if url not in results else ("✅" if results[url][1] else "❌")
+            lines.append(f"{mark} {articles.short_url(url)}")
+        return "\n".join(lines)
+
+    status = await message.answer(render(), disable_web_page_preview=True)
+    last_edit = time.monotonic()
+
+    async def show_progress():
+        nonlocal last_edit
+        if len(results) < len(urls) and time.monotonic() - last_edit < config.AI_STREAM_EDIT_INTERVAL:
+            return
+        last_edit = time.monotonic()
+        try:
+            await status.edit_text(render(), disable_web_page_preview=True)
+        except (TelegramBadRequest, TelegramRetryAfter):
+            pass
+
+    ask = summary_ask(user_id, "summary")
+    # The chunk budget is shared, so a digest of many links costs about as much as one long article
+    max_chunks = max(2, ai_budget(user_id, config.SUMMARY_MAX_CHUNKS) // len(urls))
+    semaphore = asyncio.Semaphore(config.SUMMARY_LINKS_CONCURRENCY)
+
+    async def summarize_one(url):
+        async with semaphore:
+            try:
+                article = await articles.fetch_article(http, url)
+                summary, used, total = await summarizer.summarize(article.text, ask, DIGEST_PROMPT, max_chunks=max_chunks)
+                results[url] = (article.title, summary, None if summary else "ИИ сейчас недоступен")
+            except articles.ArticleError as e:
+                results[url] = (None, None, str(e))
+            except Exception as e:
+                logging.error(f"Summarize Error ({url}): {e}")
+                results[url] = (None, None, "не удалось прочитать страницу")
+        await show_progress()
+
+    await asyncio.gather(*(summarize_one(url) for url in urls))
+
+    done = sum(1 for _, summary, _ in results.values() if summary)
+    parts = [f"📰 *Дайджест по ссылкам ({done} из {len(urls)}):*"]
+    for n, url in enumerate(urls, 1):
+        title, summary, error = results[url]
+        parts.append(f"*{n}. {title or articles.short_url(url)}*\n{url}\n" + (summary or f"❌ {error}"))
+    if skipped:
+        parts.append(f"(Ещё {skipped} ссылок пропущено: за раз читаю не больше {config.SUMMARY_LINKS_MAX}.)")
+    digest = "\n\n".join(parts)
+    await send_ai_text(message, digest, status)
+    if done:
+        conversations.append(user_id, "Перескажи ссылки:\n" + "\n".join(urls), digest)
+
 # Summarizer (PDF)
 @dp.message(F.document.mime_type == "application/pdf")
 async def summarize_pdf(message: types.Message):
-    await message.answer("⏳ Анализирую PDF-документ...")
+    if usage.level(message.from_user.id) == ai_usage.BLOCKED:
+        await message.answer(AI_QUOTA_TEXT)
+        return
+    status = await message.answer("⏳ Анализирую PDF-документ...")
     
     file_id = message.document.file_id
     file = await bot.get_file(file_id)
@@ -1286,19 +1849,25 @@ async def summarize_pdf(message: types.Message):
     await bot.download_file(file.file_path, file_path)
     
     try:
-        reader = PdfReader(file_path)
-        text = ""
-        for page in reader.pages[:5]: # Only first 5 pages for brevity
-            text += page.extract_text() + " "
-        text = text[:4000]
-        
-        prompt = f"Сделай краткий пересказ этого документа (самая суть):\n\n{text}"
-        summary = await get_ai_response(prompt)
-        await message.answer(f"📄 **Суть документа:**\n\n{summary}", parse_mode="Markdown")
-        os.remove(file_path)
+        # pypdf is CPU-bound: keep it off the event loop
+        text = await asyncio.to_thread(read_pdf_text, file_path, config.SUMMARY_MAX_PAGES)
+        if not text.strip():
+            await status.edit_text("❌ В PDF нет текстового слоя.")
+            return
+
+        prompt = "Сделай краткий пересказ этого документа (самая суть):\n\n{text}"
+        summary = await summarize_document(message, status, text, prompt, "pdf")
+        if not summary:
+            await status.edit_text(AI_BUSY_TEXT)
+            return
+        await send_ai_text(message, f"📄 *Суть документа:*\n\n{summary}", status)
+        conversations.append(message.from_user.id, f"Перескажи документ {message.document.file_name or 'PDF'}", summary)
     except Exception as e:
         logging.error(f"PDF Error: {e}")
         await message.answer("❌ Ошибка при чтении PDF.")
+    finally:
+        if os.path.exists(file_path):
+            os.remove(file_path)
 
 # Voice-to-Text
 @dp.message(F.voice)
@@ -1331,7 +1900,7 @@ async def handle_voice(message: types.Message):
         await message.answer(f"🗣 **Я услышал:**\n_{text}_\n\n(Передаю этот запрос нейросети...)", parse_mode="Markdown")
         
         # Pass recognized text to AI
-        await message.answer(await get_ai_response(text))
+        await answer_streaming(message, text, message.from_user.id, "voice")
         
         os.remove(ogg_path)
         os.remove(wav_path)
@@ -1339,92 +1908,6 @@ async def handle_voice(message: types.Message):
         logging.error(f"Voice Error: {e}")
         await message.answer("❌ Не удалось распознать голос. Попробуй говорить четче!")
 
-@dp.message(F.text == "📧 Почта")
-@dp.message(Command("tempmail"))
-async def cmd_tempmail(message: types.Message):
-    # Check if user already has an email
-    existing_email = database.get_temp_email(message.from_user.id)
-    
-    kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="🔄 Проверить почту", callback_data="check_mail")],
-        [InlineKeyboardButton(text="🆕 Сгенерировать новый", callback_data="new_mail")]
-    ])
-    
-    if existing_email:
-        await message.answer(f"Твой текущий адрес:\n`{existing_email}`\n\nИспользуй его для регистраций или создай новый.", reply_markup=kb, parse_mode="Markdown")
-    else:
-        await generate_new_email(message, kb)
-
-async def generate_new_email(message, kb):
-    await bot.send_chat_action(message.chat.id, "typing")
-    try:
-        async with httpx.AsyncClient() as client:
-            # Get available domains
-            dr = await client.get("https://www.1secmail.com/api/v1/?action=getDomainList")
-            domains = dr.json()
-            domain = domains[0] if domains else "1secmail.com"
-            
-            import random
-            import string
-            login = ''.join(random.choices(string.ascii_lowercase + string.digits, k=10))
-            email = f"{login}@{domain}"
-            
-            database.save_temp_email(message.from_user.id, email)
-            await message.answer(f"✅ Создан новый адрес:\n`{email}`\n\nОжидай письма и нажимай кнопку ниже.", reply_markup=kb, parse_mode="Markdown")
-    except Exception as e:
-        logging.error(f"Generate Mail Error: {e}")
-        await message.answer("❌ Ошибка при создании почты.")
-
-@dp.callback_query(F.data == "new_mail")
-async def process_new_mail(callback: types.CallbackQuery):
-    kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="🔄 Проверить почту", callback_data="check_mail")],
-        [InlineKeyboardButton(text="🆕 Сгенерировать новый", callback_data="new_mail")]
-    ])
-    await generate_new_email(callback.message, kb)
-    await callback.answer()
-
-@dp.callback_query(F.data == "check_mail")
-async def process_check_mail(callback: types.CallbackQuery):
-    email = database.get_temp_email(callback.from_user.id)
-    if not email:
-        await callback.answer("Сначала создай почту!")
-        return
-        
-    login, domain = email.split("@")
-    url = f"https://www.1secmail.com/api/v1/?action=getMessages&login={login}&domain={domain}"
-    
-    try:
-        async with httpx.AsyncClient() as client:
-            r = await client.get(url)
-            messages = r.json()
-            
-            if not messages:
-                await callback.answer("Писем пока нет. Попробуй позже.", show_alert=True)
-                return
-            
-            res_text = "📩 **Новые письма:**\n\n"
-            for m in messages[:5]: # Last 5 messages
-                m_id = m['id']
-                m_from = m['from']
-                m_subject = m['subject']
-                m_date = m['date']
-                
-                # Fetch full message content
-                msg_url = f"https://www.1secmail.com/api/v1/?action=readMessage&login={login}&domain={domain}&id={m_id}"
-                mr = await client.get(msg_url)
-                msg_data = mr.json()
-                content = msg_data['textBody'] if msg_data['textBody'] else msg_data['htmlBody']
-                
-                res_text += f"👤 От: {m_from}\n📅 Дата: {m_date}\n📌 Тема: {m_subject}\n\n{content[:500]}...\n---\n"
-            
-            await callback.message.answer(res_text, parse_mode="Markdown")
-            await callback.answer()
-    except Exception as e:
-        logging.error(f"Mail Check Error: {e}")
-        await callback.answer("Ошибка при проверке почты.")
-
-
 @dp.message(F.text == "⚙️ Настройки")
 @dp.message(Command("settings"))
 async def cmd_settings(message: types.Message):
@@ -1434,7 +1917,8 @@ async def cmd_settings(message: types.Message):
     
     kb = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text=f"Мониторинг групп: {status_icon}", callback_data=f"settings_toggle")],
-        [InlineKeyboardButton(text="🚫 Список исключений", callback_data="show_exclusions")]
+        [InlineKeyboardButton(text="🚫 Список исключений", callback_data="show_exclusions")],
+        [InlineKeyboardButton(text="📉 Режимы сохранения", callback_data="show_policies")]
     ])
     
     await message.answer(
@@ -1457,7 +1941,8 @@ async def process_settings_toggle(callback: types.CallbackQuery):
     status_icon = "✅" if new_status else "❌"
     kb = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text=f"Мониторинг групп: {status_icon}", callback_data=f"settings_toggle")],
-        [InlineKeyboardButton(text="🚫 Список исключений", callback_data="show_exclusions")]
+        [InlineKeyboardButton(text="🚫 Список исключений", callback_data="show_exclusions")],
+        [InlineKeyboardButton(text="📉 Режимы сохранения", callback_data="show_policies")]
     ])
     
     await callback.message.edit_reply_markup(reply_markup=kb)
@@ -1482,6 +1967,25 @@ async def process_show_exclusions(callback: types.CallbackQuery):
     ])
     await callback.message.edit_text(text, reply_markup=kb, parse_mode="Markdown")
 
+@dp.callback_query(F.data == "show_policies")
+async def process_show_policies(callback: types.CallbackQuery):
+    user_id = callback.from_user.id
+    policies = database.get_chat_policies(user_id)
+
+    if not policies:
+        text = "✅ **Все чаты сохраняются полностью.**\nЕсли группа станет слишком активной, бот сам включит экономный режим и сообщит об этом."
+    else:
+        text = "📉 **Режимы сохранения:**\n\n"
+        for chat_id, policy, auto, title in policies:
+            mode = "авто" if auto else "вручную"
+            text += f"• {title or chat_id}: {chat_throttle.POLICY_LABELS.get(policy, policy)} ({mode})\n"
+
+    text += "\nℹ️ Изменить режим: напишите в чате `/policy all|text|sample|contacts|auto`."
+    kb = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text=f"🔙 Назад", callback_data="back_to_settings")]
+    ])
+    await callback.message.edit_text(text, reply_markup=kb, parse_mode="Markdown")
+
 @dp.callback_query(F.data == "back_to_settings")
 async def process_back_settings(callback: types.CallbackQuery):
     await callback.message.delete()
@@ -1492,7 +1996,8 @@ async def process_back_settings(callback: types.CallbackQuery):
     
     kb = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text=f"Мониторинг групп: {status_icon}", callback_data=f"settings_toggle")],
-        [InlineKeyboardButton(text="🚫 Список исключений", callback_data="show_exclusions")]
+        [InlineKeyboardButton(text="🚫 Список исключений", callback_data="show_exclusions")],
+        [InlineKeyboardButton(text="📉 Режимы сохранения", callback_data="show_policies")]
     ])
     
     await callback.message.answer(
@@ -1506,6 +2011,77 @@ async def process_back_settings(callback: types.CallbackQuery):
     )
 
 
+# --- Activity Stats ---
+
+@dp.message(Command("stats"))
+async def cmd_stats(message: types.Message):
+    user_id = message.from_user.id
+    activity.flush()
+
+    today = datetime.now(timezone.utc).date()
+    days = dict((d, (c, dl, e)) for d, c, dl, e in database.get_user_activity(user_id, (today - timedelta(days=6)).isoformat()))
+    top = database.get_top_chats(user_id, 5)
+    if not days and not top:
+        await message.answer("📊 Статистики пока нет. Она появится, когда UserBot начнет сохранять сообщения.")
+        return
+
+    c, d, e = days.get(today.isoformat(), (0, 0, 0))
+    text = (
+        "📊 <b>Активность UserBot</b>\n\n"
+        f"Сегодня: 💾 {c} сохранено | 🗑 {d} удалено | ✏️ {e} изменено\n"
+        f"За 7 дней: 💾 {sum(v[0] for v in days.values())} | 🗑 {sum(v[1] for v in days.values())} | ✏️ {sum(v[2] for v in days.values())}\n"
+    )
+    if top:
+        text += "\n🔥 <b>Самые активные чаты:</b>\n"
+        for chat_id, title, cached, deleted, edited in top:
+            text += f"• {html.escape(title or str(chat_id))}: 💾 {cached} | 🗑 {deleted} | ✏️ {edited}\n"
+    await message.answer(text, parse_mode="HTML")
+
+
+# --- Edit History ---
+
+async def send_revision_timeline(message: types.Message, user_id: int, chat_id: int, message_id: int):
+    original = database.get_original_message(message_id, chat_id, user_id)
+    if not original:
+        await message.answer("❌ Сообщение не найдено в кэше.")
+        return
+
+    content, sender_name, chat_title, ts = original
+    text = (
+        f"🕰 <b>История правок</b>\n"
+        f"📁 Чат: {html.escape(chat_title or 'Личный чат')}\n"
+        f"👤 Автор: {html.escape(sender_name or 'Unknown')}\n\n"
+        f"<b>Оригинал</b> ({ts}):\n{html.escape(content or '')}\n"
+    )
+
+    current = content or ""
+    for revision, diff, edited_at in database.get_message_revisions(message_id, chat_id, user_id):
+        new_text = text_diff.apply_diff(current, diff)
+        entry = f"\n<b>Правка #{revision}</b> ({edited_at}):\n{text_diff.render_inline_diff(current, new_text)}\n"
+        if len(text) + len(entry) > 4000:
+            text += "\n…"
+            break
+        text += entry
+        current = new_text
+
+    await message.answer(text[:4096], parse_mode="HTML")
+
+@dp.callback_query(F.data.startswith("revs_"))
+async def process_revisions(callback: types.CallbackQuery):
+    _, chat_id, message_id = callback.data.split("_")
+    await send_revision_timeline(callback.message, callback.from_user.id, int(chat_id), int(message_id))
+    await callback.answer()
+
+@dp.message(Command("history"))
+async def cmd_history(message: types.Message, command: CommandObject):
+    try:
+        chat_id, message_id = map(int, command.args.split())
+    except (AttributeError, ValueError):
+        await message.answer("Используйте: /history ID_чата ID_сообщения\n(или кнопку «🕰 История правок» под уведомлением)")
+        return
+    await send_revision_timeline(message, message.from_user.id, chat_id, message_id)
+
+
 # --- UserBot Setup Handlers ---
 
 @dp.message(F.text == "🕵️ UserBot")
@@ -1619,49 +2195,109 @@ async def chat_with_ai(message: types.Message):
 
     await bot.send_chat_action(message.chat.id, "typing")
     
-    # Get user notes for context
-    notes = database.get_notes(message.from_user.id)
-    notes_context = "\n".join(notes[-10:]) if notes else "Заметок нет."
+    # Only the notes relevant to the question, within a size budget
+    user_id = message.from_user.id
+    notes = note_search.select_notes(user_id, message.text, config.AI_NOTES_LIMIT, ai_budget(user_id, config.AI_NOTES_CHARS))
+    notes_context = "\n".join(f"- {note}" for note in notes) if notes else "Заметок нет."
     
     try:
-        prompt = f"Заметки пользователя:\n{notes_context}\n\nВопрос: {message.text}"
-        ai_response = await get_ai_response(prompt)
-        await message.answer(ai_response)
+        history = conversations.context(user_id, ai_budget(user_id, config.AI_MEMORY_TOKEN_BUDGET))
+        prompt = f"Заметки пользователя:\n{notes_context}\n\n{history}Вопрос: {message.text}"
+        answer = await answer_streaming(message, prompt, user_id)
+        if answer and answer not in (AI_BUSY_TEXT, AI_QUOTA_TEXT):
+            conversations.append(user_id, message.text, answer)
     except Exception as e:
         logging.error(f"AI Error: {e}")
         await message.answer("Прости, мой ИИ-мозг временно недоступен. Попробуй позже!")
 
 # Check Habit Reminders
 async def check_habit_reminders():
-    # Only run check if seconds are near 00 to avoid duplicates? APScheduler handles interval gracefully generally.
-    now = datetime.now()
-    current_time = now.strftime("%H:%M")
-    
-    habits = database.get_habits_with_reminders()
-    for row in habits:
-        # id, user_id, name, reminder_time
-        habit_id, user_id, name, reminder_time = row
-        
-        if reminder_time == current_time:
-            try:
-                await bot.send_message(user_id, f"💎 Напоминание о привычке:\n👉 {name}")
-                logging.info(f"Sent habit reminder to {user_id} for {name}")
-            except Exception as e:
-                logging.error(f"Failed to send habit reminder: {e}")
+    """Per-minute tick over the reminder_minute index: only habits due now are read.
+    Minutes missed while the bot was down (up to HABIT_CATCHUP_MINUTES) are replayed,
+    and each user gets one message per tick."""
+    if habit_tick_lock.locked():
+        return # Previous tick still sending; its minutes are picked up next time
+    async with habit_tick_lock:
+        now = int(time.time() // 60) # UTC epoch minute
+        last = database.get_scheduler_state("habit_reminders")
+        if last is not None and last >= now:
+            return
+        first = now if last is None else max(last + 1, now - config.HABIT_CATCHUP_MINUTES)
+        minutes = {m % 1440 for m in range(first, now + 1)}
+
+        by_user = {}
+        for habit_id, user_id, name, minute in database.get_due_habits(minutes):
+            by_user.setdefault(user_id, []).append((name, minute != now % 1440))
+
+        async def remind(user_id, habits):
+            title = "💎 Напоминание о привычке:" if len(habits) == 1 else "💎 Напоминание о привычках:"
+            lines = [f"👉 {name}" + (" (пропущено, пока бот был недоступен)" if late else "") for name, late in habits]
+            if await sender.send(user_id, title + "\n" + "\n".join(lines)):
+                logging.info(f"Sent {len(habits)} habit reminder(s) to {user_id}")
+
+        await asyncio.gather(*(remind(user_id, habits) for user_id, habits in by_user.items()))
+        database.set_scheduler_state("habit_reminders", now)
+
+async def check_reminders():
+    """Sends /remind reminders that are due, straight from the run_at index: nothing is loaded
+    at startup, and reminders that fell due while the bot was down go out on the first tick."""
+    if reminder_tick_lock.locked():
+        return
+    async with reminder_tick_lock:
+        now = time.time()
+
+        async def deliver(user_id, text, run_at):
+            late = " (с опозданием: бот был недоступен)" if now - run_at > config.REMINDER_LATE_SECONDS else ""
+            return await sender.deliver(user_id, f"🕒 Напоминание: {text}{late}")
+
+        while True:
+            due = database.get_due_reminders(now, config.REMINDER_BATCH)
+            if not due:
+                break
+            outcomes = await asyncio.gather(*(deliver(user_id, text, run_at) for _, user_id, text, run_at, *_ in due))
+
+            done, rescheduled, failed = [], [], 0
+            for (rid, user_id, text, run_at, repeat, old_offset, offset, anchor_day), outcome in zip(due, outcomes):
+                if outcome == "failed" and now - run_at < config.REMINDER_RETRY_HOURS * 3600:
+                    failed += 1 # Stays due: the next tick tries again
+                elif outcome != "sent" or not repeat:
+                    # Blocked the bot, failing for too long (logged by the sender) or a one-off that went out
+                    done.append(rid)
+                else:
+                    offset = config.DEFAULT_TZ_OFFSET if offset is None else offset
+                    rescheduled.append((reminders.next_run(run_at, repeat, old_offset, offset, now, anchor_day), offset, rid))
+            database.finish_reminders(done, rescheduled)
+            logging.info(f"Sent {len(due) - failed} reminder(s), {len(rescheduled)} rescheduled, {failed} failed")
+            # Failed ones would come back in the next batch right away: leave them to the next tick
+            if failed or len(due) < config.REMINDER_BATCH:
+                break
 
 async def main():
     database.init_db()
+    fx.load()
+    mail_watcher.load()
     
     # Write PID for update script
     pid = os.getpid()
     with open("bot.pid", "w") as f:
         f.write(str(pid))
 
-    scheduler = AsyncIOScheduler()
-    scheduler.add_job(send_morning_brief, "cron", hour=8, minute=0)
+    # Each user gets the brief at their own local morning: a small batch every minute
+    refresh_timezones()
+    scheduler.add_job(send_morning_brief, "cron", second=0, max_instances=3)
+    scheduler.add_job(refresh_timezones, "cron", minute=5)
     # database.cleanup_old_messages removed as it is not implemented
     scheduler.add_job(check_deleted_messages, "interval", seconds=60, max_instances=2)
     scheduler.add_job(check_habit_reminders, "cron", second=0) # Run every minute at 00 seconds
+    scheduler.add_job(check_reminders, "cron", second="*/15", max_instances=2)
+    scheduler.add_job(activity.flush, "interval", seconds=config.STATS_FLUSH_SECONDS)
+    scheduler.add_job(usage.flush, "interval", seconds=config.STATS_FLUSH_SECONDS)
+    scheduler.add_job(ai_cache.flush, "interval", seconds=config.STATS_FLUSH_SECONDS)
+    scheduler.add_job(ai_cache.prune, "interval", hours=1)
+    scheduler.add_job(database.prune_article_cache, "interval", hours=1, args=[config.ARTICLE_CACHE_ROWS])
+    # Refresh right away if the saved rates are too old, then on the interval
+    fx_first_run = {"next_run_time": datetime.now()} if fx.stale else {}
+    scheduler.add_job(fx.refresh, "interval", minutes=config.FX_REFRESH_MINUTES, **fx_first_run)
     scheduler.start()
     
     # Start saved user sessions
@@ -1669,8 +2305,18 @@ async def main():
     for user_id, session_str in sessions:
         await ub_manager.start_client(user_id, session_str)
     
+    mail_task = asyncio.create_task(mail_watcher.run(push_mail))
+
     logging.info("Starting Aiogram Bot...")
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        mail_task.cancel()
+        activity.flush()
+        usage.flush()
+        ai_cache.flush()
+        await http.close()
+        ai_providers.ai_executor.shutdown(wait=False)
 
 if __name__ == "__main__":
     try:
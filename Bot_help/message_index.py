@@ -0,0 +1,121 @@
+import sys
+from collections import OrderedDict
+
+
+class MessageRecord:
+    """Compact copy of a cached_messages row kept in memory."""
+    __slots__ = ("message_id", "chat_id", "sender_id", "content", "sender_name",
+                 "media_type", "file_id", "sender_username", "chat_title")
+
+    def __init__(self, message_id, chat_id, sender_id, content, sender_name,
+                 media_type=None, file_id=None, sender_username=None, chat_title=None):
+        self.message_id = message_id
+        self.chat_id = chat_id
+        self.sender_id = sender_id
+        self.content = content
+        self.sender_name = sender_name
+        self.media_type = media_type
+        self.file_id = file_id
+        self.sender_username = sender_username
+        self.chat_title = chat_title
+
+    @classmethod
+    def from_row(cls, row):
+        # Same column order as database.get_messages_for_check
+        return cls(*row)
+
+    def with_content(self, content):
+        """Copy with new text. Records in an index are never changed in place: it tracks their size."""
+        return MessageRecord(*self.as_row()[:3], content, *self.as_row()[4:])
+
+    def as_row(self):
+        return (self.message_id, self.chat_id, self.sender_id, self.content, self.sender_name,
+                self.media_type, self.file_id, self.sender_username, self.chat_title)
+
+    def size(self):
+        total = sys.getsizeof(self)
+        for name in ("content", "sender_name", "media_type", "file_id", "sender_username", "chat_title"):
+            value = getattr(self, name)
+            if value is not None:
+                total += sys.getsizeof(value)
+        return total
+
+
+class TenantRing:
+    """Bounded FIFO of one user's recent messages, keyed by (chat_id, message_id)."""
+    __slots__ = ("records", "bytes", "hits", "misses")
+
+    def __init__(self):
+        self.records = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+
+class MessageIndex:
+    """Per-user in-memory index of recent messages, checked before SQLite."""
+
+    def __init__(self, max_records: int, max_bytes: int):
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self.tenants = {} # user_id -> TenantRing
+
+    def _ring(self, user_id):
+        ring = self.tenants.get(user_id)
+        if ring is None:
+            ring = self.tenants[user_id] = TenantRing()
+        return ring
+
+    def put(self, user_id: int, record: MessageRecord):
+        ring = self._ring(user_id)
+        key = (record.chat_id, record.message_id)
+        old = ring.records.pop(key, None)
+        if old is not None:
+            ring.bytes -= old.size()
+        ring.records[key] = record
+        ring.bytes += record.size()
+
+        # Evict the oldest records once over either bound
+        while ring.records and (len(ring.records) > self.max_records or ring.bytes > self.max_bytes):
+            _, evicted = ring.records.popitem(last=False)
+            ring.bytes -= evicted.size()
+
+    def get(self, user_id: int, chat_id: int, message_id: int):
+        ring = self._ring(user_id)
+        record = ring.records.get((chat_id, message_id))
+        if record is None:
+            ring.misses += 1
+        else:
+            ring.hits += 1
+        return record
+
+    def discard(self, user_id: int, chat_id: int, message_id: int):
+        ring = self.tenants.get(user_id)
+        if ring:
+            record = ring.records.pop((chat_id, message_id), None)
+            if record is not None:
+                ring.bytes -= record.size()
+
+    def recent(self, user_id: int, limit: int = 100):
+        """Newest records first, same shape as database.get_messages_for_check."""
+        ring = self.tenants.get(user_id)
+        if not ring:
+            return []
+        rows = []
+        for record in reversed(ring.records.values()):
+            rows.append(record.as_row())
+            if len(rows) >= limit:
+                break
+        return rows
+
+    def warm(self, user_id: int, rows):
+        # rows come newest first from the DB, keep the newest at the tail
+        for row in reversed(rows):
+            self.put(user_id, MessageRecord.from_row(row))
+
+    def drop(self, user_id: int):
+        self.tenants.pop(user_id, None)
+
+    def stats(self):
+        """{user_id: (records, bytes, hits, misses)}"""
+        return {uid: (len(r.records), r.bytes, r.hits, r.misses) for uid, r in self.tenants.items()}
@@ -0,0 +1,184 @@
+"""Local stand-in for OpenAI-compatible chat APIs (OpenAI, Groq) for load testing.
+
+    python mock_llm.py --port 8901 --latency 0.8 --jitter 0.5 --error-rate 0.05 --quota-rate 0.02
+
+Point the bot at it with OPENAI_BASE_URL=http://127.0.0.1:8901/v1 and/or
+GROQ_BASE_URL=http://127.0.0.1:8901 (any API key works).
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from dataclasses import dataclass, field
+
+from aiohttp import web
+
+# Same marker ai_router.is_acceptable rejects; not imported so the server runs without a bot config
+DISCLAIMER = "Как и любая языковая модель"
+
+
+@dataclass
+class MockProfile:
+    latency: float = 0.5        # median seconds to the full answer (or to the first chunk when streaming)
+    jitter: float = 0.4         # lognormal sigma: 0 = constant latency, ~1 = heavy tail
+    tail_rate: float = 0.0      # share of requests that stall for tail_latency
+    tail_latency: float = 10.0
+    error_rate: float = 0.0     # HTTP 500
+    quota_rate: float = 0.0     # HTTP 429 insufficient_quota
+    disclaimer_rate: float = 0.0 # answers the router rejects on quality
+    answer_words: int = 60
+    chunk_delay: float = 0.02   # seconds between streamed chunks
+    seed: int = None
+
+
+@dataclass
+class MockStats:
+    requests: int = 0
+    streams: int = 0
+    errors: int = 0
+    quota: int = 0
+    disclaimers: int = 0
+    started: float = field(default_factory=time.monotonic)
+
+
+class MockLLM:
+    def __init__(self, profile: MockProfile = None, name: str = "mock"):
+        self.profile = profile or MockProfile()
+        self.name = name
+        self.stats = MockStats()
+        self.random = random.Random(self.profile.seed)
+        self.runner = None
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.chat_completions)
+        app.router.add_post("/openai/v1/chat/completions", self.chat_completions) # Groq SDK path
+        app.router.add_get("/stats", self.get_stats)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        """Run in the current event loop. Returns the bound port (port=0 picks a free one)."""
+        self.runner = web.AppRunner(self.app())
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        return self.runner.addresses[0][1]
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+
+    def delay(self) -> float:
+        p = self.profile
+        if p.tail_rate and self.random.random() < p.tail_rate:
+            return p.tail_latency
+        if p.jitter <= 0:
+            return p.latency
+        return p.latency * self.random.lognormvariate(0, p.jitter)
+
+    def answer(self, prompt: str) -> str:
+        if self.profile.disclaimer_rate and self.random.random() < self.profile.disclaimer_rate:
+            self.stats.disclaimers += 1
+            return f"{DISCLAIMER}, я не могу ответить на этот вопрос."
+        words = prompt.split()[:8]
+        filler = " ".join(self.random.choice(("данные", "итог", "важно", "пример", "факт", "вывод"))
+                          for _ in range(self.profile.answer_words))
+        return f"[{self.name}] Ответ на «{' '.join(words)}»: {filler}."
+
+    def error(self):
+        p = self.profile
+        roll = self.random.random()
+        if roll < p.quota_rate:
+            self.stats.quota += 1
+            return web.json_response({"error": {
+                "message": "You exceeded your current quota.", "type": "insufficient_quota", "code": "insufficient_quota"
+            }}, status=429)
+        if roll < p.quota_rate + p.error_rate:
+            self.stats.errors += 1
+            return web.json_response({"error": {"message": "Mock upstream failure", "type": "server_error"}}, status=500)
+        return None
+
+    async def chat_completions(self, request: web.Request):
+        self.stats.requests += 1
+        body = await request.json()
+        prompt = " ".join(m.get("content", "") for m in body.get("messages", []) if m.get("role") == "user")
+        model = body.get("model", "mock")
+
+        await asyncio.sleep(self.delay())
+        failure = self.error()
+        if failure is not None:
+            return failure
+
+        content = self.answer(prompt)
+        created = int(time.time())
+        if not body.get("stream"):
+            return web.json_response({
+                "id": f"chatcmpl-mock-{self.stats.requests}",
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": len(prompt) // 3, "completion_tokens": len(content) // 3,
+                          "total_tokens": (len(prompt) + len(content)) // 3},
+            })
+
+        self.stats.streams += 1
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+        words = content.split(" ")
+        for i in range(0, len(words), 3):
+            piece = " ".join(words[i:i + 3]) + (" " if i + 3 < len(words) else "")
+            chunk = {
+                "id": f"chatcmpl-mock-{self.stats.requests}", "object": "chat.completion.chunk",
+                "created": created, "model": model,
+                "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+            }
+            await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+            await asyncio.sleep(self.profile.chunk_delay)
+        done = {
+            "id": f"chatcmpl-mock-{self.stats.requests}", "object": "chat.completion.chunk",
+            "created": created, "model": model, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+        }
+        await response.write(f"data: {json.dumps(done)}\n\ndata: [DONE]\n\n".encode())
+        await response.write_eof()
+        return response
+
+    async def get_stats(self, request: web.Request):
+        data = dict(self.stats.__dict__)
+        data["uptime"] = time.monotonic() - data.pop("started")
+        return web.json_response(data)
+
+
+def profile_args(parser: argparse.ArgumentParser):
+    defaults = MockProfile()
+    parser.add_argument("--latency", type=float, default=defaults.latency, help="median latency, seconds")
+    parser.add_argument("--jitter", type=float, default=defaults.jitter, help="lognormal sigma of the latency")
+    parser.add_argument("--tail-rate", type=float, default=defaults.tail_rate)
+    parser.add_argument("--tail-latency", type=float, default=defaults.tail_latency)
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate)
+    parser.add_argument("--quota-rate", type=float, default=defaults.quota_rate)
+    parser.add_argument("--disclaimer-rate", type=float, default=defaults.disclaimer_rate)
+    parser.add_argument("--answer-words", type=int, default=defaults.answer_words)
+    parser.add_argument("--chunk-delay", type=float, default=defaults.chunk_delay)
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def profile_from_args(args) -> MockProfile:
+    return MockProfile(
+        latency=args.latency, jitter=args.jitter, tail_rate=args.tail_rate, tail_latency=args.tail_latency,
+        error_rate=args.error_rate, quota_rate=args.quota_rate, disclaimer_rate=args.disclaimer_rate,
+        answer_words=args.answer_words, chunk_delay=args.chunk_delay, seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible chat API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8901)
+    parser.add_argument("--name", default="mock")
+    profile_args(parser)
+    args = parser.parse_args()
+    mock = MockLLM(profile_from_args(args), args.name)
+    print(f"Mock LLM '{args.name}' on http://{args.host}:{args.port} (OpenAI: /v1, Groq: /)")
+    web.run_app(mock.app(), host=args.host, port=args.port, print=None)
@@ -0,0 +1,166 @@
+import asyncio
+import logging
+import time
+
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+
+import config
+from weather import weather_key
+
+
+class RateLimitedSender:
+    """Sends bot messages from a queue with a few workers, paced to stay under
+    Telegram's global limit (~30 msg/s) and backing off on RetryAfter.
+    The limit is per bot, so the bot has one sender shared by everything that broadcasts."""
+
+    def __init__(self, bot, rate: float = None, workers: int = None):
+        self.bot = bot
+        self.interval = 1 / (rate or config.BRIEF_SEND_RATE)
+        self.workers = workers or config.BRIEF_SEND_WORKERS
+        self.next_slot = 0.0
+        self.lock = asyncio.Lock()
+        self.sent = 0
+        self.failed = 0
+        self.blocked = 0
+
+    async def slot(self):
+        async with self.lock:
+            now = time.monotonic()
+            wait = self.next_slot - now
+            self.next_slot = max(now, self.next_slot) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def send(self, chat_id: int, text: str, **kwargs):
+        return await self.deliver(chat_id, text, **kwargs) == "sent"
+
+    async def deliver(self, chat_id: int, text: str, **kwargs) -> str:
+        """-> "sent", "blocked" or "failed"."""
+        for _ in range(3):
+            await self.slot()
+            try:
+                await self.bot.send_message(chat_id, text, **kwargs)
+                self.sent += 1
+                return "sent"
+            except TelegramRetryAfter as e:
+                # Flood control applies to the whole bot: pause every worker
+                async with self.lock:
+                    self.next_slot = max(self.next_slot, time.monotonic() + e.retry_after)
+            except TelegramForbiddenError:
+                self.blocked += 1 # User blocked the bot
+                return "blocked"
+            except Exception as e:
+                logging.error(f"Failed to send message to {chat_id}: {e}")
+                break
+        self.failed += 1
+        return "failed"
+
+    async def drain(self, queue: asyncio.Queue) -> dict:
+        """Run the workers until a None per worker is received. Returns the outcomes of
+        this queue alone ({"sent": n, ...}): the sender's counters include other traffic."""
+        outcomes = {"sent": 0, "blocked": 0, "failed": 0}
+
+        async def worker():
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                chat_id, text = item
+                outcomes[await self.deliver(chat_id, text)] += 1
+
+        await asyncio.gather(*(worker() for _ in range(self.workers)))
+        return outcomes
+
+
+class BriefReport:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.stages = {}
+        self.users = 0
+        self.locations = 0
+        self.outcomes = None
+
+    def stage(self, name: str, started: float):
+        self.stages[name] = time.monotonic() - started
+
+    def __str__(self):
+        total = time.monotonic() - self.started
+        stages = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.stages.items())
+        outcomes = self.outcomes
+        sent = f"отправлено {outcomes['sent']}, ошибок {outcomes['failed']}, заблокировали {outcomes['blocked']}" if outcomes else ""
+        return (
+            f"☀️ Утренний дайджест: {self.users} польз., {self.locations} мест погоды, {sent}. "
+            f"Этапы: {stages}; всего {total:.1f}s"
+        )
+
+
+def render_brief(weather: str, currency: str) -> str:
+    brief = f"☀️ Доброе утро! Вот твой утренний дайджест:\n"
+    brief += f"🌡 Погода: {weather}\n"
+    brief += f"💵 Курс USD: {currency}\n"
+    brief += "📅 Не забудь проверить свои дела на сегодня!"
+    return brief
+
+
+async def deliver_briefs(sender: RateLimitedSender, load, get_weather, get_currency) -> BriefReport:
+    """load() -> [(user_id, city, lat, lon), ...] in one query. Users are grouped by weather key,
+    each distinct location is fetched once (bounded concurrency), and briefs are queued
+    to the sender as soon as their location resolves."""
+    report = BriefReport()
+
+    started = time.monotonic()
+    rows = load()
+    report.users = len(rows)
+    report.stage("загрузка", started)
+    if not rows:
+        return report
+
+    started = time.monotonic()
+    groups = {} # weather key -> (lat, lon, city, [user_id, ...])
+    for user_id, city, lat, lon in rows:
+        if lat is None or lon is None:
+            lat = lon = None
+            city = city or "Moscow"
+        key = weather_key(lat, lon, city)
+        if key not in groups:
+            groups[key] = (lat, lon, city, [])
+        groups[key][3].append(user_id)
+    report.locations = len(groups)
+    report.stage("группировка", started)
+
+    started = time.monotonic()
+    currency = await get_currency()
+    report.stage("курс", started)
+
+    queue = asyncio.Queue(maxsize=sender.workers * 50)
+    semaphore = asyncio.Semaphore(config.WEATHER_CONCURRENCY)
+
+    async def produce(lat, lon, city, user_ids):
+        async with semaphore:
+            weather = await get_weather(lat=lat, lon=lon, city_name=city)
+        text = render_brief(weather, currency)
+        for user_id in user_ids:
+            await queue.put((user_id, text))
+
+    skipped = []
+
+    async def fetch_all():
+        fetch_started = time.monotonic()
+        try:
+            # One bad location only costs its own users their brief
+            results = await asyncio.gather(*(produce(*group) for group in groups.values()), return_exceptions=True)
+            for group, result in zip(groups.values(), results):
+                if isinstance(result, Exception):
+                    logging.error(f"Morning brief for {group[2] or (group[0], group[1])} failed: {result}")
+                    skipped.extend(group[3])
+            report.stage("погода", fetch_started)
+        finally:
+            # Without the sentinels the workers would wait on the queue forever
+            for _ in range(sender.workers):
+                await queue.put(None)
+
+    started = time.monotonic()
+    _, report.outcomes = await asyncio.gather(fetch_all(), sender.drain(queue))
+    report.outcomes["failed"] += len(skipped)
+    report.stage("отправка", started)
+    return report
@@ -0,0 +1,43 @@
+import re
+
+import database
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+STOP_WORDS = {
+    "и", "в", "во", "на", "не", "что", "как", "а", "но", "по", "с", "со", "к", "у", "о", "об", "за", "из",
+    "это", "то", "ли", "же", "мне", "меня", "мой", "моя", "мои", "я", "ты", "вы", "он", "она", "они",
+    "the", "a", "an", "and", "or", "of", "to", "in", "is", "what", "how", "my", "me",
+}
+
+
+def match_query(question: str) -> str:
+    """FTS5 MATCH expression: any of the question's words, with prefix matching
+    on long words as a crude stemmer for Russian endings."""
+    terms = []
+    for word in WORD_RE.findall(question.lower()):
+        if len(word) < 2 or word in STOP_WORDS:
+            continue
+        if len(word) > 5:
+            terms.append(f'"{word[:max(4, len(word) - 2)]}"*')
+        else:
+            terms.append(f'"{word}"')
+    return " OR ".join(dict.fromkeys(terms))
+
+
+def select_notes(user_id: int, question: str, limit: int, char_budget: int):
+    """Notes most relevant to the question that fit the budget.
+    Falls back to the most recent notes when nothing matches."""
+    notes = database.search_notes(user_id, match_query(question), limit)
+    if not notes:
+        notes = database.get_recent_notes(user_id, limit)
+
+    selected = []
+    used = 0
+    for _, content in notes:
+        if used + len(content) > char_budget:
+            if not selected:
+                selected.append(content[:char_budget])
+            break
+        selected.append(content)
+        used += len(content) + 1
+    return selected
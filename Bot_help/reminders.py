@@ -0,0 +1,126 @@
+import calendar
+import re
+from datetime import datetime, timedelta, timezone
+
+REPEATS = {
+    "daily": r"каждый\s+день|ежедневно",
+    "weekdays": r"по\s+будням",
+    "weekly": r"каждую\s+неделю|еженедельно",
+    "monthly": r"каждый\s+месяц|ежемесячно",
+}
+REPEAT_NAMES = {"daily": "каждый день", "weekdays": "по будням", "weekly": "каждую неделю", "monthly": "каждый месяц"}
+
+REMIND_RE = re.compile(
+    r"^(?:(?P<repeat>" + "|".join(REPEATS.values()) + r")\s+)?"
+    r"(?:через\s+(?P<amount>\d+)\s*(?P<unit>мин\w*|м|час\w*|ч|дн\w*|день|д)"
+    r"|(?:(?P<date>сегодня|завтра|послезавтра|\d{4}-\d{1,2}-\d{1,2}|\d{1,2}\.\d{1,2}(?:\.\d{2,4})?)\s+)?"
+    r"(?P<hour>\d{1,2}):(?P<minute>\d{2}))"
+    r"\s+(?P<text>\S.*)$",
+    re.IGNORECASE | re.DOTALL,
+)
+DAY_WORDS = {"сегодня": 0, "завтра": 1, "послезавтра": 2}
+
+
+def to_utc(local: datetime, offset: int) -> int:
+    """Naive local time of a user with this offset -> UTC epoch seconds."""
+    return int((local - timedelta(minutes=offset)).replace(tzinfo=timezone.utc).timestamp())
+
+
+def to_local(run_at: int, offset: int) -> datetime:
+    return datetime.fromtimestamp(run_at, timezone.utc).replace(tzinfo=None) + timedelta(minutes=offset)
+
+
+def format_local(run_at: int, offset: int) -> str:
+    return f"{to_local(run_at, offset):%d.%m.%Y %H:%M}"
+
+
+def repeat_of(text: str):
+    for name, pattern in REPEATS.items():
+        if re.fullmatch(pattern, text, re.IGNORECASE):
+            return name
+    return None
+
+
+def parse_date(text: str, today: datetime):
+    text = text.lower()
+    if text in DAY_WORDS:
+        return today + timedelta(days=DAY_WORDS[text]), True
+    if "-" in text:
+        return datetime.strptime(text, "%Y-%m-%d"), True
+    parts = text.split(".")
+    if len(parts) == 2:
+        return datetime(today.year, int(parts[1]), int(parts[0])), False
+    year = int(parts[2])
+    return datetime(year + 2000 if year < 100 else year, int(parts[1]), int(parts[0])), True
+
+
+def parse_reminder(args: str, offset: int, now: datetime = None):
+    """'/remind' arguments in the user's local time -> (run_at UTC epoch, repeat | None, text).
+
+    14:00 текст · завтра 9:30 текст · 25.12 18:00 текст · 2025-01-31 10:00 текст ·
+    через 40 мин текст · каждый день / по будням / каждую неделю / каждый месяц 8:00 текст.
+    A bare time that has already passed today means tomorrow. Raises ValueError."""
+    match = REMIND_RE.match(args.strip())
+    if not match:
+        raise ValueError(args)
+    now = now or datetime.now(timezone.utc)
+    local_now = now.replace(tzinfo=None) + timedelta(minutes=offset)
+    repeat = repeat_of(match["repeat"]) if match["repeat"] else None
+
+    if match["amount"]:
+        unit = match["unit"].lower()
+        if unit.startswith("м"):
+            delta = timedelta(minutes=int(match["amount"]))
+        elif unit.startswith("ч"):
+            delta = timedelta(hours=int(match["amount"]))
+        else:
+            delta = timedelta(days=int(match["amount"]))
+        return to_utc(local_now + delta, offset), repeat, match["text"].strip()
+
+    hour, minute = int(match["hour"]), int(match["minute"])
+    if hour > 23 or minute > 59:
+        raise ValueError(args)
+    today = local_now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if match["date"]:
+        day, explicit_year = parse_date(match["date"], today)
+    else:
+        day, explicit_year = today, False
+    local = day.replace(hour=hour, minute=minute)
+    if local <= local_now and not match["date"]:
+        local += timedelta(days=1)
+    elif local <= local_now and not explicit_year:
+        local = local.replace(year=local.year + 1) # "25.12" in January: this coming December
+    if repeat == "weekdays":
+        while local.weekday() >= 5:
+            local += timedelta(days=1)
+    return to_utc(local, offset), repeat, match["text"].strip()
+
+
+def advance(local: datetime, repeat: str, anchor_day: int = None) -> datetime:
+    """Next occurrence. Monthly ones aim for anchor_day (the day of the first run) every
+    month, clamped to the month's length, so the 31st doesn't drift to the 28th for good."""
+    if repeat == "daily":
+        return local + timedelta(days=1)
+    if repeat == "weekly":
+        return local + timedelta(weeks=1)
+    if repeat == "weekdays":
+        local += timedelta(days=1)
+        while local.weekday() >= 5:
+            local += timedelta(days=1)
+        return local
+    if repeat == "monthly":
+        year, month = (local.year + 1, 1) if local.month == 12 else (local.year, local.month + 1)
+        day = anchor_day or local.day
+        return local.replace(year=year, month=month, day=min(day, calendar.monthrange(year, month)[1]))
+    raise ValueError(repeat)
+
+
+def next_run(run_at: int, repeat: str, old_offset: int, offset: int, now: float, anchor_day: int = None) -> int:
+    """Next occurrence after `now`, keeping the local wall time when the user's zone
+    has changed since (DST, /timezone). Occurrences missed while the bot was down are skipped."""
+    local = to_local(run_at, old_offset)
+    while True:
+        local = advance(local, repeat, anchor_day)
+        run_at = to_utc(local, offset)
+        if run_at > now:
+            return run_at
@@ -0,0 +1,103 @@
+import time
+from collections import deque
+
+
+class LatencyWindow:
+    """Rolling window of the last N latencies (seconds) with percentiles."""
+
+    def __init__(self, size: int = 100):
+        self.samples = deque(maxlen=size)
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, p: float):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def __len__(self):
+        return len(self.samples)
+
+
+class CircuitBreaker:
+    """closed -> open after repeated failures -> half-open probe after a cooldown.
+    The cooldown doubles each time a probe fails, up to max_cooldown."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failures: int = 3, error_rate: float = 0.5, window: int = 10,
+                 cooldown: float = 60, max_cooldown: float = 600):
+        self.failure_threshold = failures
+        self.error_rate_threshold = error_rate
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.cooldown = cooldown
+        self.outcomes = deque(maxlen=window) # True = success
+        self.consecutive_failures = 0
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self.probing = False
+
+    def available(self) -> bool:
+        """Would allow() let a request through? Does not claim the half-open probe."""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            return time.monotonic() - self.opened_at >= self.cooldown
+        return not self.probing
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+            self.state = self.HALF_OPEN
+            self.probing = False
+        if self.state == self.HALF_OPEN and not self.probing:
+            self.probing = True # Let exactly one request through
+            return True
+        return False
+
+    def record_success(self):
+        self.outcomes.append(True)
+        self.consecutive_failures = 0
+        if self.state != self.CLOSED:
+            self.state = self.CLOSED
+            self.cooldown = self.base_cooldown
+            self.outcomes.clear()
+        self.probing = False
+
+    def record_failure(self):
+        self.outcomes.append(False)
+        self.consecutive_failures += 1
+        if self.state == self.HALF_OPEN:
+            self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+            self._open()
+        elif self.state == self.CLOSED and (
+            self.consecutive_failures >= self.failure_threshold
+            or (len(self.outcomes) >= self.outcomes.maxlen // 2 and self.error_rate() >= self.error_rate_threshold)
+        ):
+            self._open()
+        self.probing = False
+
+    def release(self):
+        """Give back a half-open probe whose request was cancelled before finishing."""
+        self.probing = False
+
+    def _open(self):
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def retry_in(self) -> float:
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self.cooldown - (time.monotonic() - self.opened_at))
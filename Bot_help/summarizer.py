@@ -0,0 +1,102 @@
+import asyncio
+import re
+
+import config
+from ai_providers import estimate_tokens
+
+MAP_PROMPT = (
+    "Это часть {n} из {total} длинного документа. Кратко перескажи её на русском языке: "
+    "ключевые факты, цифры, выводы. Без вступлений и дисклеймеров.\n\n{text}"
+)
+COMBINE_PROMPT = (
+    "Ниже пересказы нескольких частей документа. Объедини их в один краткий пересказ "
+    "без повторов, сохранив факты и цифры.\n\n{text}"
+)
+
+SENTENCE_RE = re.compile(r"(?<=[.!?…])\s+|\n{2,}")
+
+
+def split_chunks(text: str, max_tokens: int):
+    """Split text into chunks of at most max_tokens, on paragraph/sentence boundaries where possible."""
+    max_chars = max_tokens * 3 # inverse of estimate_tokens
+    chunks = []
+    current = ""
+    for piece in SENTENCE_RE.split(text):
+        piece = piece.strip()
+        if not piece:
+            continue
+        while estimate_tokens(piece) > max_tokens: # a single huge "sentence"
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(piece[:max_chars])
+            piece = piece[max_chars:]
+        if current and estimate_tokens(current) + estimate_tokens(piece) > max_tokens:
+            chunks.append(current)
+            current = piece
+        else:
+            current = f"{current} {piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def group_parts(parts, max_tokens: int):
+    """Join consecutive partial summaries into groups of up to max_tokens.
+    Every group takes at least two parts, so each reduce round halves the count."""
+    groups = []
+    current = []
+    for part in parts:
+        if len(current) >= 2 and estimate_tokens("\n\n".join(current + [part])) > max_tokens:
+            groups.append("\n\n".join(current))
+            current = []
+        current.append(part)
+    if current:
+        groups.append("\n\n".join(current))
+    return groups
+
+
+async def summarize(text: str, ask, final_prompt: str, progress=None, max_chunks: int = None):
+    """Map-reduce summary of an arbitrarily long text.
+
+    ask(prompt) -> str | None is the AI call (cached and rate-limited upstream, so
+    chunk summaries are reused on repeat requests). final_prompt is a template with {text}.
+    progress(done, total) is awaited after each chunk.
+    Returns (summary | None, chunks_used, chunks_total)."""
+    chunks = split_chunks(text, config.SUMMARY_CHUNK_TOKENS)
+    total = len(chunks)
+    chunks = chunks[:max_chunks or config.SUMMARY_MAX_CHUNKS]
+    if not chunks:
+        return None, 0, 0
+    if len(chunks) == 1:
+        return await ask(final_prompt.format(text=chunks[0])), 1, total
+
+    parts = await map_chunks(chunks, MAP_PROMPT, ask, progress)
+    for _ in range(3):
+        joined = "\n\n".join(parts)
+        if len(parts) <= 1 or estimate_tokens(joined) <= config.SUMMARY_CHUNK_TOKENS:
+            break
+        # Partial summaries still don't fit one prompt: reduce them in groups first
+        parts = await map_chunks(group_parts(parts, config.SUMMARY_CHUNK_TOKENS), COMBINE_PROMPT, ask)
+    if not parts:
+        return None, len(chunks), total
+    return await ask(final_prompt.format(text="\n\n".join(parts))), len(chunks), total
+
+
+async def map_chunks(chunks, template: str, ask, progress=None):
+    """Summarize chunks concurrently (at most SUMMARY_CONCURRENCY per document), keeping their order.
+    Failed chunks are dropped."""
+    semaphore = asyncio.Semaphore(config.SUMMARY_CONCURRENCY)
+    done = 0
+
+    async def one(n, chunk):
+        nonlocal done
+        async with semaphore:
+            result = await ask(template.format(n=n, total=len(chunks), text=chunk))
+        done += 1
+        if progress:
+            await progress(done, len(chunks))
+        return result
+
+    results = await asyncio.gather(*(one(n, chunk) for n, chunk in enumerate(chunks, 1)))
+    return [r for r in results if r]
@@ -0,0 +1,337 @@
+import asyncio
+import base64
+import html
+import json
+import logging
+import random
+import string
+import time
+
+from bs4 import BeautifulSoup
+
+import config
+import database
+
+
+class MailError(Exception):
+    """The temp-mail service refused the request or answered with something unexpected."""
+
+
+class MailMessage:
+    def __init__(self, id: str, sender: str, subject: str, date: str, intro: str = ""):
+        self.id = str(id)
+        self.sender = sender
+        self.subject = subject
+        self.date = date
+        self.intro = intro
+        self.body = None
+
+
+def random_login(length: int = 10, alphabet: str = string.ascii_lowercase + string.digits) -> str:
+    return "".join(random.choices(alphabet, k=length))
+
+
+def html_to_text(markup: str) -> str:
+    return BeautifulSoup(markup, "html.parser").get_text("\n", strip=True) if markup else ""
+
+
+def format_mail(message: MailMessage, limit: int = 500) -> str:
+    """HTML for Telegram."""
+    body = message.body if message.body is not None else message.intro
+    body = body.strip() or "(пустое письмо)"
+    if len(body) > limit:
+        body = body[:limit] + "..."
+    return (
+        f"👤 От: {html.escape(message.sender)}\n📅 Дата: {html.escape(message.date)}\n"
+        f"📌 Тема: {html.escape(message.subject or '(без темы)')}\n\n{html.escape(body)}"
+    )
+
+
+class MailProvider:
+    """One temp-mail service. `secret` is whatever it needs besides the address (the mail.tm password)."""
+
+    name = None
+
+    def __init__(self, http, base_url: str):
+        self.http = http
+        self.base_url = base_url.rstrip("/")
+
+    async def create(self):
+        """-> (address, secret)"""
+        raise NotImplementedError
+
+    async def messages(self, address: str, secret) -> list:
+        """Headers of the inbox, newest first."""
+        raise NotImplementedError
+
+    async def read(self, address: str, secret, message_id: str) -> str:
+        """Plain-text body."""
+        raise NotImplementedError
+
+    def forget(self, address: str):
+        pass
+
+    def check(self, response):
+        if response.status_code >= 400:
+            raise MailError(f"{self.name}: HTTP {response.status_code}")
+        try:
+            return response.json()
+        except ValueError:
+            raise MailError(f"{self.name}: не JSON-ответ")
+
+
+class MailTm(MailProvider):
+    """api.mail.tm: accounts with a password, JWT bearer tokens cached until they expire."""
+
+    name = "mailtm"
+
+    def __init__(self, http, base_url: str):
+        super().__init__(http, base_url)
+        self.tokens = {} # address -> (token, expires_at)
+        self.domains = ([], 0.0)
+        self.logins = 0
+        self.token_hits = 0
+
+    async def domain(self) -> str:
+        domains, fetched_at = self.domains
+        if not domains or time.time() - fetched_at > 3600:
+            data = self.check(await self.http.get(f"{self.base_url}/domains"))
+            domains = [d["domain"] for d in data.get("hydra:member", []) if d.get("isActive", True)]
+            if not domains:
+                raise MailError("mail.tm: нет доступных доменов")
+            self.domains = (domains, time.time())
+        return domains[0]
+
+    async def create(self):
+        address = f"{random_login()}@{await self.domain()}"
+        password = random_login(12, string.ascii_letters + string.digits)
+        r = await self.http.post(f"{self.base_url}/accounts", json={"address": address, "password": password})
+        if r.status_code != 201:
+            raise MailError(f"mail.tm: регистрация не удалась (HTTP {r.status_code})")
+        return address, password
+
+    @staticmethod
+    def expiry(token: str) -> float:
+        """`exp` claim of the JWT, or MAIL_TOKEN_TTL from now if it can't be read."""
+        try:
+            payload = token.split(".")[1]
+            claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+            return float(claims["exp"])
+        except (IndexError, KeyError, TypeError, ValueError):
+            return time.time() + config.MAIL_TOKEN_TTL
+
+    async def token(self, address: str, password: str) -> str:
+        cached = self.tokens.get(address)
+        if cached and cached[1] - 30 > time.time():
+            self.token_hits += 1
+            return cached[0]
+        r = await self.http.post(f"{self.base_url}/token", json={"address": address, "password": password})
+        if r.status_code != 200:
+            raise MailError(f"mail.tm: ошибка авторизации (HTTP {r.status_code})")
+        token = self.check(r)["token"]
+        self.tokens[address] = (token, self.expiry(token))
+        self.logins += 1
+        return token
+
+    async def authorized_get(self, path: str, address: str, password: str):
+        for attempt in range(2):
+            token = await self.token(address, password)
+            r = await self.http.get(f"{self.base_url}{path}", headers={"Authorization": f"Bearer {token}"})
+            if r.status_code == 401 and attempt == 0:
+                self.tokens.pop(address, None) # Revoked early: log in again once
+                continue
+            return self.check(r)
+
+    async def messages(self, address: str, password) -> list:
+        data = await self.authorized_get("/messages", address, password)
+        return [
+            MailMessage(m["id"], (m.get("from") or {}).get("address", "?"), m.get("subject") or "",
+                        m.get("createdAt", ""), m.get("intro") or "")
+            for m in data.get("hydra:member", [])
+        ]
+
+    async def read(self, address: str, password, message_id: str) -> str:
+        data = await self.authorized_get(f"/messages/{message_id}", address, password)
+        return data.get("text") or html_to_text("".join(data.get("html") or []))
+
+    def forget(self, address: str):
+        self.tokens.pop(address, None)
+
+
+class OneSecMail(MailProvider):
+    """1secmail.com: any login works, no authentication."""
+
+    name = "1secmail"
+
+    async def call(self, **params):
+        return self.check(await self.http.get(f"{self.base_url}/", params=params))
+
+    async def create(self):
+        domains = await self.call(action="getDomainList")
+        return f"{random_login()}@{domains[0] if domains else '1secmail.com'}", None
+
+    async def messages(self, address: str, secret) -> list:
+        login, domain = address.split("@")
+        data = await self.call(action="getMessages", login=login, domain=domain)
+        return [MailMessage(m["id"], m.get("from", "?"), m.get("subject") or "", m.get("date", "")) for m in data]
+
+    async def read(self, address: str, secret, message_id: str) -> str:
+        login, domain = address.split("@")
+        data = await self.call(action="readMessage", login=login, domain=domain, id=message_id)
+        return data.get("textBody") or html_to_text(data.get("htmlBody"))
+
+
+class TempMail:
+    """Both services behind one interface. New inboxes fall back to the other service
+    when the preferred one (MAIL_PROVIDER) fails."""
+
+    def __init__(self, http):
+        self.providers = {
+            MailTm.name: MailTm(http, config.MAIL_TM_URL),
+            OneSecMail.name: OneSecMail(http, config.ONESECMAIL_URL),
+        }
+
+    def provider(self, name) -> MailProvider:
+        # Inboxes saved before providers were recorded are 1secmail ones
+        return self.providers.get(name) or self.providers[OneSecMail.name]
+
+    async def create(self):
+        """-> (provider name, address, secret)"""
+        order = [config.MAIL_PROVIDER] + [name for name in self.providers if name != config.MAIL_PROVIDER]
+        error = None
+        for name in order:
+            if name not in self.providers:
+                continue
+            try:
+                address, secret = await self.providers[name].create()
+                return name, address, secret
+            except Exception as e:
+                logging.warning(f"Temp mail: {name} failed to create an inbox: {e}")
+                error = e
+        raise MailError(f"Сервисы почты недоступны: {error}")
+
+    async def inbox(self, provider: str, address: str, secret, limit: int = None, skip=()) -> list:
+        """Newest first, without the ids in `skip`. Bodies are fetched concurrently."""
+        service = self.provider(provider)
+        messages = [m for m in await service.messages(address, secret) if m.id not in skip][:limit]
+        semaphore = asyncio.Semaphore(config.MAIL_BODY_CONCURRENCY)
+
+        async def read(message):
+            async with semaphore:
+                try:
+                    message.body = await service.read(address, secret, message.id)
+                except Exception as e:
+                    logging.warning(f"Temp mail: can't read {message.id} at {address}: {e}")
+
+        await asyncio.gather(*(read(m) for m in messages))
+        return messages
+
+    def forget(self, provider: str, address: str):
+        self.provider(provider).forget(address)
+
+
+class WatchedInbox:
+    def __init__(self, user_id: int, provider: str, address: str, secret, watch_until: float):
+        self.user_id = user_id
+        self.provider = provider
+        self.address = address
+        self.secret = secret
+        self.watch_until = watch_until
+        self.interval = config.MAIL_POLL_MIN
+        self.next_check = 0.0
+        self.seen = database.get_seen_mail(user_id)
+
+
+class MailWatcher:
+    """Polls active inboxes in the background and pushes new mail to their owners.
+    An inbox is checked every MAIL_POLL_MIN seconds after mail arrives, backing off
+    to MAIL_POLL_MAX while it stays quiet, until its watch_until. Seen ids are stored
+    in SQLite, so a message is pushed once, also across restarts and manual checks."""
+
+    def __init__(self, mail: TempMail):
+        self.mail = mail
+        self.inboxes = {} # user_id -> WatchedInbox
+        self.polls = 0
+        self.pushed = 0
+        self.errors = 0
+
+    def load(self):
+        for user_id, provider, address, secret, watch_until in database.get_watched_mailboxes(time.time()):
+            self.watch(user_id, provider, address, secret, watch_until)
+
+    def watch(self, user_id: int, provider: str, address: str, secret, watch_until: float):
+        current = self.inboxes.get(user_id)
+        if current is not None and current.address == address:
+            current.watch_until = watch_until
+            current.interval = config.MAIL_POLL_MIN
+            return
+        if current is not None:
+            self.mail.forget(current.provider, current.address)
+        self.inboxes[user_id] = WatchedInbox(user_id, provider, address, secret, watch_until)
+
+    def mark_seen(self, user_id: int, ids):
+        inbox = self.inboxes.get(user_id)
+        if inbox is not None:
+            inbox.seen.update(ids)
+
+    async def run(self, notify):
+        """notify(user_id, address, message) is awaited for every new message, oldest first."""
+        semaphore = asyncio.Semaphore(config.MAIL_WATCH_CONCURRENCY)
+
+        async def poll(inbox):
+            async with semaphore:
+                try:
+                    await self.poll(inbox, notify)
+                except Exception as e:
+                    # Nothing may end the loop: it runs as a fire-and-forget task
+                    self.errors += 1
+                    inbox.next_check = time.time() + inbox.interval
+                    logging.error(f"Temp mail watcher: polling {inbox.address} failed: {e}")
+
+        while True:
+            now = time.time()
+            for user_id, inbox in list(self.inboxes.items()):
+                if inbox.watch_until <= now:
+                    del self.inboxes[user_id]
+                    self.mail.forget(inbox.provider, inbox.address)
+            due = [inbox for inbox in self.inboxes.values() if inbox.next_check <= now]
+            if due:
+                await asyncio.gather(*(poll(inbox) for inbox in due))
+            await asyncio.sleep(1)
+
+    async def poll(self, inbox: WatchedInbox, notify):
+        self.polls += 1
+        try:
+            new = await self.mail.inbox(inbox.provider, inbox.address, inbox.secret, config.MAIL_PUSH_LIMIT, inbox.seen)
+        except Exception as e:
+            self.errors += 1
+            logging.warning(f"Temp mail watcher: {inbox.address}: {e}")
+            new = None
+
+        if new:
+            for message in reversed(new):
+                try:
+                    await notify(inbox.user_id, inbox.address, message)
+                except Exception as e:
+                    logging.error(f"Temp mail push to {inbox.user_id} failed: {e}")
+            ids = [m.id for m in new]
+            inbox.seen.update(ids)
+            try:
+                database.add_seen_mail(inbox.user_id, ids)
+            except Exception as e:
+                # Still marked seen in memory: only a restart before the next write could repeat them
+                self.errors += 1
+                logging.error(f"Temp mail watcher: can't save seen ids for {inbox.user_id}: {e}")
+            self.pushed += len(new)
+            inbox.interval = config.MAIL_POLL_MIN
+        else:
+            inbox.interval = min(inbox.interval * 2, config.MAIL_POLL_MAX)
+        inbox.next_check = time.time() + inbox.interval
+
+    def report(self) -> str:
+        mailtm = self.mail.providers[MailTm.name]
+        return (
+            f"📧 Временная почта: отслеживается {len(self.inboxes)} ящ., проверок {self.polls}, "
+            f"доставлено писем {self.pushed}, ошибок {self.errors}; mail.tm входов {mailtm.logins}, "
+            f"токен из кэша {mailtm.token_hits}"
+        )
@@ -0,0 +1,73 @@
+import difflib
+import html
+import json
+import re
+
+TOKEN_RE = re.compile(r"\s+|\w+|[^\w\s]")
+
+
+def make_diff(old: str, new: str) -> str:
+    """Compact edit script turning `old` into `new`.
+    Only changed spans are stored: [[start, end, replacement], ...] over characters of `old`."""
+    ops = []
+    matcher = difflib.SequenceMatcher(None, old, new, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag != "equal":
+            ops.append([i1, i2, new[j1:j2]])
+    return json.dumps(ops, ensure_ascii=False, separators=(",", ":"))
+
+
+def apply_diff(old: str, diff: str) -> str:
+    parts = []
+    pos = 0
+    for start, end, replacement in json.loads(diff):
+        parts.append(old[pos:start])
+        parts.append(replacement)
+        pos = end
+    parts.append(old[pos:])
+    return "".join(parts)
+
+
+def apply_chain(original: str, diffs) -> str:
+    """Replay revisions (oldest first) on top of the original text."""
+    text = original or ""
+    for diff in diffs:
+        text = apply_diff(text, diff)
+    return text
+
+
+def _trim(text: str, context: int, head: bool, tail: bool) -> str:
+    # Keep only `context` chars next to the surrounding changes
+    if len(text) <= context * 2:
+        return text
+    if head and tail:
+        return text[:context] + " … " + text[-context:]
+    if head:
+        return text[:context] + " …"
+    if tail:
+        return "… " + text[-context:]
+    return text
+
+
+def render_inline_diff(old: str, new: str, context: int = 40) -> str:
+    """HTML diff for alerts: <s>removed</s> <b>added</b>, unchanged text shortened."""
+    old_tokens = TOKEN_RE.findall(old or "")
+    new_tokens = TOKEN_RE.findall(new or "")
+    opcodes = difflib.SequenceMatcher(None, old_tokens, new_tokens, autojunk=False).get_opcodes()
+
+    out = []
+    for n, (tag, i1, i2, j1, j2) in enumerate(opcodes):
+        removed = "".join(old_tokens[i1:i2])
+        added = "".join(new_tokens[j1:j2])
+        if tag == "equal":
+            out.append(html.escape(_trim(removed, context, head=n > 0, tail=n < len(opcodes) - 1)))
+            continue
+        if removed.strip():
+            out.append(f"<s>{html.escape(removed)}</s>")
+        elif removed:
+            out.append(removed)
+        if added.strip():
+            out.append(f"<b>{html.escape(added)}</b>")
+        elif added:
+            out.append(added)
+    return "".join(out)
@@ -0,0 +1,67 @@
+import re
+from datetime import datetime, timedelta, timezone
+
+import config
+
+try:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+except ImportError: # Python < 3.9: only numeric offsets
+    ZoneInfo = None
+
+OFFSET_RE = re.compile(r"^(?:utc|gmt)?\s*([+-]?)(\d{1,2})(?::?(\d{2}))?$", re.IGNORECASE)
+
+
+def parse_timezone(text: str):
+    """'+3', 'UTC-5:30', 'Europe/Moscow' -> (tz_name | None, offset_minutes). Raises ValueError."""
+    text = text.strip()
+    match = OFFSET_RE.match(text)
+    if match:
+        sign, hours, minutes = match.groups()
+        offset = int(hours) * 60 + int(minutes or 0)
+        if offset > 14 * 60:
+            raise ValueError(text)
+        return None, -offset if sign == "-" else offset
+    if ZoneInfo is not None and "/" in text:
+        try:
+            return text, current_offset(text)
+        except (ZoneInfoNotFoundError, ValueError):
+            pass
+    raise ValueError(text)
+
+
+def current_offset(tz_name: str) -> int:
+    """UTC offset of an IANA zone right now, in minutes (follows DST)."""
+    return int(datetime.now(ZoneInfo(tz_name)).utcoffset().total_seconds() // 60)
+
+
+def format_offset(offset: int) -> str:
+    sign = "+" if offset >= 0 else "-"
+    hours, minutes = divmod(abs(offset), 60)
+    return f"UTC{sign}{hours}" + (f":{minutes:02d}" if minutes else "")
+
+
+def utc_minute(now: datetime = None) -> int:
+    now = now or datetime.now(timezone.utc)
+    return now.hour * 60 + now.minute
+
+
+def brief_local_minute(user_id: int) -> int:
+    """Local minute-of-day of the user's morning brief. Users in one zone are spread
+    over BRIEF_SPREAD_MINUTES so they don't all hit the APIs in the same second."""
+    return config.BRIEF_HOUR * 60 + user_id % max(1, config.BRIEF_SPREAD_MINUTES)
+
+
+def brief_minute(user_id: int, offset: int) -> int:
+    """UTC minute-of-day the user's morning brief is due."""
+    return (brief_local_minute(user_id) - offset) % 1440
+
+
+def local_now(offset: int) -> datetime:
+    """Naive local time of a user with the given offset."""
+    return (datetime.now(timezone.utc) + timedelta(minutes=offset)).replace(tzinfo=None)
+
+
+def to_utc_minute(hhmm: str, offset: int) -> int:
+    """Local "HH:MM" -> UTC minute-of-day. Raises ValueError on a bad time."""
+    parsed = datetime.strptime(hhmm.strip(), "%H:%M")
+    return (parsed.hour * 60 + parsed.minute - offset) % 1440
@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+
+import config
+
+API_URL = "https://api.openweathermap.org/data/2.5/weather"
+
+
+class WeatherError(Exception):
+    """OpenWeatherMap answered but refused the query (unknown city, bad key...)."""
+
+
+def weather_key(lat=None, lon=None, city_name=None):
+    """Cache key: a lat/lon grid cell (WEATHER_GRID degrees) or a normalized city name."""
+    if lat is not None and lon is not None:
+        grid = config.WEATHER_GRID
+        return f"geo:{round(lat / grid)}:{round(lon / grid)}"
+    if city_name:
+        return "city:" + " ".join(city_name.casefold().replace("ё", "е").split())
+    return None
+
+
+class CallLimiter:
+    """Sliding one-minute window of upstream calls; acquire() waits when the window is full."""
+
+    def __init__(self, per_minute: int):
+        self.per_minute = per_minute
+        self.calls = deque()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                while self.calls and now - self.calls[0] >= 60:
+                    self.calls.popleft()
+                if len(self.calls) < self.per_minute:
+                    self.calls.append(now)
+                    return
+                await asyncio.sleep(60 - (now - self.calls[0]))
+
+
+class WeatherCache:
+    """Current weather per grid cell / city with a TTL. Concurrent lookups of the same
+    key share one upstream call; a stale entry is served if the refresh fails."""
+
+    def __init__(self, http, api_key: str):
+        self.http = http
+        self.api_key = api_key
+        self.entries = OrderedDict() # key -> (data | WeatherError, fetched_at)
+        self.inflight = {} # key -> asyncio.Task
+        self.limiter = CallLimiter(config.WEATHER_CALLS_PER_MINUTE)
+        self.hits = 0
+        self.coalesced = 0
+        self.upstream = 0
+        self.stale = 0
+
+    def params(self, key: str, lat=None, lon=None, city_name=None):
+        params = {"appid": self.api_key, "units": "metric", "lang": "ru"}
+        if key.startswith("geo:"):
+            # Query the cell centre so every user in the cell gets the same answer
+            _, y, x = key.split(":")
+            params["lat"] = round(int(y) * config.WEATHER_GRID, 4)
+            params["lon"] = round(int(x) * config.WEATHER_GRID, 4)
+        else:
+            params["q"] = city_name.strip()
+        return params
+
+    def fresh(self, key: str):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        value, fetched_at = entry
+        ttl = config.WEATHER_ERROR_TTL if isinstance(value, WeatherError) else config.WEATHER_TTL
+        if time.time() - fetched_at > ttl:
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    async def get(self, lat=None, lon=None, city_name=None) -> dict:
+        """Raw OpenWeatherMap response. Raises WeatherError or the transport error."""
+        key = weather_key(lat, lon, city_name)
+        if key is None:
+            raise WeatherError("Не указана локация")
+
+        entry = self.fresh(key)
+        if entry is not None:
+            self.hits += 1
+            return self._unwrap(entry[0])
+
+        task = self.inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(self._refresh(key, self.params(key, lat, lon, city_name)))
+            self.inflight[key] = task
+            task.add_done_callback(lambda _: self.inflight.pop(key, None))
+        return self._unwrap(await asyncio.shield(task))
+
+    @staticmethod
+    def _unwrap(value):
+        if isinstance(value, WeatherError):
+            raise value
+        return value
+
+    async def _refresh(self, key: str, params: dict):
+        await self.limiter.acquire()
+        self.upstream += 1
+        try:
+            r = await self.http.get(API_URL, params=params)
+            if r.status_code == 429 or r.status_code >= 500:
+                # An outage, not an answer: never replaces the cached reading
+                raise WeatherError(f"Сервис погоды недоступен (HTTP {r.status_code})")
+            data = r.json()
+        except Exception as e:
+            old = self.entries.get(key)
+            if old is not None and not isinstance(old[0], WeatherError) and time.time() - old[1] < config.WEATHER_STALE:
+                logging.warning(f"Weather refresh for {key} failed ({e}), serving stale data")
+                self.stale += 1
+                return old[0]
+            raise
+
+        # Refusals (unknown city, bad key...) are cached briefly so typos don't burn the quota
+        value = data if r.status_code == 200 else WeatherError(data.get("message", "Неизвестная ошибка"))
+        self.entries[key] = (value, time.time())
+        self.entries.move_to_end(key)
+        while len(self.entries) > config.WEATHER_MAX_ENTRIES:
+            self.entries.popitem(last=False)
+        return value
+
+    async def prefetch(self, locations):
+        """Warm the cache for [(city, lat, lon), ...], one upstream call per distinct key."""
+        keys = {}
+        for city, lat, lon in locations:
+            key = weather_key(lat, lon, city)
+            if key and key not in keys and self.fresh(key) is None:
+                keys[key] = (lat, lon, city)
+        semaphore = asyncio.Semaphore(config.WEATHER_CONCURRENCY)
+
+        async def one(lat, lon, city):
+            async with semaphore:
+                try:
+                    await self.get(lat, lon, city)
+                except Exception as e:
+                    logging.warning(f"Weather prefetch failed for {city or (lat, lon)}: {e}")
+
+        await asyncio.gather(*(one(*args) for args in keys.values()))
+        return len(keys)
+
+    def report(self) -> str:
+        total = self.hits + self.coalesced + self.upstream
+        saved = (self.hits + self.coalesced) / total * 100 if total else 0
+        return (
+            f"🌦 Кэш погоды: {len(self.entries)} мест, попадания {self.hits}, совмещено {self.coalesced}, "
+            f"запросов к API {self.upstream} ({saved:.0f}% сэкономлено), устаревших ответов {self.stale}"
+        )
+
+
+def format_weather(data: dict) -> str:
+    temp = data['main']['temp']
+    desc = data['weather'][0]['description']
+    place = data.get('name', 'Неизвестное место')
+    return f"{temp}°C, {desc} ({place})"